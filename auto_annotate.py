@@ -1,152 +1,340 @@
 #!/usr/bin/env python3
 """
-Auto-annotate thread roll images using current YOLO model
-This creates initial annotations that can be used for training
+Auto-annotate thread roll images using the current YOLO model
+
+Builds YOLO training labels for thread_roll_dataset from a folder of
+photos. Images are labeled in batches (one batched YOLO pass each) on a
+process pool with one model per worker. With --merge-holes, rolls found
+by center-hole detection (detect_center_holes) that no YOLO box covers
+are labeled as well.
+
+Runs are incremental: every image is identified by its content hash, and
+images whose hash already has a label file in the dataset (auto or hand
+annotated, under any name) are skipped. Hashes are cached by file size
+and mtime, so a re-run only costs anything for new images. The train/val
+split is derived from the hash, so it stays stable as images are added.
+Images and labels are written atomically (label last), so an interrupted
+run never leaves a half-written label behind. data.yaml is rebuilt with
+paths relative to the dataset folder.
+
+Auto-annotations may not be perfect: review and correct them before training.
+
+Usage:
+    python auto_annotate.py
+    python auto_annotate.py --images /data/new_photos --merge-holes --workers 4
 """
 
-import sys
-import os
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend/app'))
-
-from ultralytics import YOLO
+import argparse
 import glob
-from pathlib import Path
+import hashlib
+import json
+import multiprocessing
+import os
 import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(REPO_DIR, 'backend/app'))
+
+DEFAULT_IMAGES = os.path.join(REPO_DIR, "sample_images_for_training")
+DEFAULT_DATASET = os.path.join(REPO_DIR, "thread_roll_dataset")
+DEFAULT_MODEL = os.path.join(REPO_DIR, "backend/app/models_weights/best.pt")
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+SPLITS = ("train", "val")
+CACHE_FILENAME = ".annotate_cache.json"   # path -> [size, mtime_ns, sha256], kept in the dataset folder
+ANNOTATE_CONFIDENCE = 0.1                 # Low, to catch all rolls; review removes false positives
+ANNOTATE_BATCH_SIZE = 4                   # Images per batched YOLO call
+
+# Per-worker detector, loaded once by _init_worker
+_DETECTOR = None
+
+
+def _init_worker(model_path):
+    global _DETECTOR
+    import contextlib
+    import io
+    import cv2
+    from detection_v2 import ThreadRollDetectorV2
+
+    cv2.setNumThreads(1)  # Parallelism comes from the pool
+    with contextlib.redirect_stdout(io.StringIO()):
+        _DETECTOR = ThreadRollDetectorV2(model_path)
+
+
+def _annotate_batch(image_paths, confidence, merge_holes):
+    """
+    YOLO boxes (and optionally extra center-hole boxes) for a batch of images, in pixels.
+
+    Returns one {"width", "height", "boxes", "holes_added"} or {"error"} per image.
+    """
+    import contextlib
+    import io
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            results = _DETECTOR.model.predict(source=list(image_paths), conf=confidence, verbose=False)
+        except Exception as e:
+            if len(image_paths) == 1:
+                return [{"error": f"{type(e).__name__}: {e}"}]
+            # Retry one at a time so a bad image only fails itself
+            return [item for path in image_paths for item in _annotate_batch([path], confidence, merge_holes)]
+
+        annotations = []
+        for image_path, result in zip(image_paths, results):
+            height, width = result.orig_shape
+            boxes = [[float(v) for v in box.xyxy[0].cpu().numpy()] for box in result.boxes]
+            holes_added = 0
+            if merge_holes:
+                try:
+                    holes = _DETECTOR.detect_center_holes(image_path, colors=False)
+                except Exception as e:
+                    annotations.append({"error": f"{type(e).__name__}: {e}"})
+                    continue
+                for hole in holes:
+                    if not any(covers(box, hole["center"]) for box in boxes):
+                        boxes.append(list(hole["bbox"]))
+                        holes_added += 1
+            annotations.append({"width": width, "height": height, "boxes": boxes, "holes_added": holes_added})
+        return annotations
+
+
+def covers(box, point):
+    x1, y1, x2, y2 = box
+    return x1 <= point[0] <= x2 and y1 <= point[1] <= y2
+
+
+def yolo_label_lines(boxes, width, height):
+    """Pixel xyxy boxes as YOLO label lines (class 0 = thread_roll, normalized center/size)."""
+    lines = []
+    for x1, y1, x2, y2 in boxes:
+        x1, x2 = max(0.0, min(x1, x2)), min(float(width), max(x1, x2))
+        y1, y2 = max(0.0, min(y1, y2)), min(float(height), max(y1, y2))
+        if x2 <= x1 or y2 <= y1:
+            continue
+        x_center = ((x1 + x2) / 2) / width
+        y_center = ((y1 + y2) / 2) / height
+        lines.append(f"0 {x_center:.6f} {y_center:.6f} {(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}")
+    return lines
+
+
+def write_atomic(path, data):
+    """Write bytes or text via a temp file and rename, so readers never see a partial file."""
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    with open(tmp_path, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def copy_atomic(src, dest):
+    tmp_path = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.tmp")
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dest)
+
+
+class HashCache:
+    """Content hashes keyed by path, reused while a file's size and mtime are unchanged."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def digest(self, file_path):
+        stat = os.stat(file_path)
+        key = os.path.abspath(file_path)
+        entry = self.entries.get(key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.entries[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return self.entries[key][2]
+
+    def save(self):
+        # Forget files that no longer exist
+        self.entries = {key: entry for key, entry in self.entries.items() if os.path.exists(key)}
+        write_atomic(self.path, json.dumps(self.entries))
+
+
+def list_images(directory):
+    images = []
+    for pattern in IMAGE_PATTERNS:
+        images.extend(glob.glob(os.path.join(directory, pattern)))
+    return sorted(images)
+
+
+def split_for(digest, val_fraction):
+    """Train or val, fixed per image content."""
+    return "val" if int(digest[:8], 16) / 0xFFFFFFFF < val_fraction else "train"
+
+
+def labeled_hashes(dataset_dir, cache):
+    """Content hashes of dataset images that have a label file, and the image names already in use."""
+    hashes, names = set(), {}
+    for split in SPLITS:
+        for image_path in list_images(os.path.join(dataset_dir, split, "images")):
+            name = os.path.basename(image_path)
+            digest = cache.digest(image_path)
+            names[(split, name)] = digest
+            stem = os.path.splitext(name)[0]
+            if os.path.exists(os.path.join(dataset_dir, split, "labels", f"{stem}.txt")):
+                hashes.add(digest)
+    return hashes, names
+
+
+def plan_annotations(image_dir, dataset_dir, cache, val_fraction, force=False, skip_hashes=frozenset()):
+    """
+    New images to annotate: [(source path, split, dataset image name)], plus the count of skipped ones.
+
+    skip_hashes: content hashes to leave out as well (e.g. images labeled in another dataset)
+    """
+    labeled, names = labeled_hashes(dataset_dir, cache)
+    if force:
+        labeled = set()
+    labeled |= set(skip_hashes)
+    new_images, seen, skipped = [], set(), 0
+    for source in list_images(image_dir):
+        digest = cache.digest(source)
+        if digest in labeled or digest in seen:
+            skipped += 1
+            continue
+        seen.add(digest)
+        new_images.append([source, digest, split_for(digest, val_fraction)])
+
+    # Small datasets can hash entirely into train; YOLO needs at least one val image
+    if val_fraction > 0 and new_images and not any(split == "val" for split, _ in names) \
+            and not any(split == "val" for _, _, split in new_images):
+        min(new_images, key=lambda item: item[1])[2] = "val"
+
+    planned = []
+    for source, digest, split in new_images:
+        name = os.path.basename(source)
+        # Another image already uses this name: keep both by adding the hash
+        if names.get((split, name), digest) != digest:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}_{digest[:8]}{ext}"
+        names[(split, name)] = digest
+        planned.append((source, split, name))
+    return planned, skipped
+
+
+def save_annotation(dataset_dir, source, split, name, annotation):
+    """Copy the image in and write its label file, both atomically (label last)."""
+    images_dir = os.path.join(dataset_dir, split, "images")
+    labels_dir = os.path.join(dataset_dir, split, "labels")
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
 
-def auto_annotate_images():
-    """Auto-annotate images using pre-trained YOLO model."""
-
-    # Paths
-    image_dir = "/home/shibin/Desktop/object counting/sample_images_for_training"
-    output_dir = "/home/shibin/Desktop/object counting/thread_roll_dataset"
-    model_path = "backend/app/models_weights/best.pt"
-
-    print("=" * 60)
-    print("Auto-Annotation Tool for Thread Rolls")
-    print("=" * 60)
-
-    # Load YOLO model
-    print(f"\n📦 Loading YOLO model...")
-    model = YOLO(model_path)
-
-    # Get all images
-    image_files = glob.glob(os.path.join(image_dir, "*.jp*g")) + \
-                  glob.glob(os.path.join(image_dir, "*.png"))
+    copy_atomic(source, os.path.join(images_dir, name))
+    lines = yolo_label_lines(annotation["boxes"], annotation["width"], annotation["height"])
+    label_path = os.path.join(labels_dir, f"{os.path.splitext(name)[0]}.txt")
+    write_atomic(label_path, "\n".join(lines))
+    return len(lines)
 
-    if not image_files:
-        print("❌ No images found!")
-        return
 
-    print(f"✓ Found {len(image_files)} images")
+def create_data_yaml(dataset_dir):
+    """Write data.yaml with paths relative to the dataset folder, so the dataset can be moved."""
+    yaml_content = """# Thread Roll Dataset
+# Paths are relative to this file; pass its absolute path to YOLO (see train_thread_rolls.py)
+train: train/images
+val: val/images
 
-    # Split into train/val (80/20)
-    split_idx = int(len(image_files) * 0.8)
-    train_images = image_files[:split_idx]
-    val_images = image_files[split_idx:]
+# Classes
+nc: 1  # number of classes
+names: ['thread_roll']  # class names
+"""
+    yaml_path = os.path.join(dataset_dir, 'data.yaml')
+    write_atomic(yaml_path, yaml_content)
+    print(f"✓ Created {yaml_path}")
 
-    print(f"  - Train: {len(train_images)} images")
-    print(f"  - Val: {len(val_images)} images")
 
-    # Process train images
-    print(f"\n🔍 Auto-annotating training images...")
-    annotate_split(model, train_images, os.path.join(output_dir, 'train'))
+def auto_annotate(args, skip_hashes=frozenset()):
+    print("=" * 60)
+    print("Auto-Annotation Tool for Thread Rolls")
+    print("=" * 60)
 
-    # Process val images
-    print(f"\n🔍 Auto-annotating validation images...")
-    annotate_split(model, val_images, os.path.join(output_dir, 'val'))
+    os.makedirs(args.dataset, exist_ok=True)
+    cache = HashCache(os.path.join(args.dataset, CACHE_FILENAME))
+    planned, skipped = plan_annotations(args.images, args.dataset, cache, args.val_fraction, force=args.force,
+                                        skip_hashes=skip_hashes)
+    cache.save()
+    print(f"✓ {len(planned) + skipped} images in {args.images}: "
+          f"{skipped} already labeled (or duplicates), {len(planned)} new")
+
+    totals = {"train": 0, "val": 0, "boxes": 0, "holes_added": 0, "failed": 0}
+    if planned:
+        if not os.path.exists(args.model):
+            print(f"❌ Model file not found at {args.model}")
+            return 1
+        batches = [planned[i:i + args.batch_size] for i in range(0, len(planned), args.batch_size)]
+        workers = min(args.workers or os.cpu_count() or 1, len(batches))
+        print(f"\n🔍 Auto-annotating with {workers} worker(s)"
+              f"{' (merging center holes)' if args.merge_holes else ''}...")
+
+        started = time.monotonic()
+        done_count = 0
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(args.model,)) as pool:
+            pending = {pool.submit(_annotate_batch, [source for source, _, _ in batch], args.conf,
+                                   args.merge_holes): batch
+                       for batch in batches}
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    batch = pending.pop(future)
+                    for (source, split, name), annotation in zip(batch, future.result()):
+                        done_count += 1
+                        prefix = f"  [{done_count}/{len(planned)}] {os.path.basename(source)}..."
+                        if "error" in annotation:
+                            totals["failed"] += 1
+                            print(f"{prefix} ❌ {annotation['error']}")
+                            continue
+                        boxes = save_annotation(args.dataset, source, split, name, annotation)
+                        totals[split] += 1
+                        totals["boxes"] += boxes
+                        totals["holes_added"] += annotation["holes_added"]
+                        extra = f" (+{annotation['holes_added']} from center holes)" if annotation["holes_added"] else ""
+                        print(f"{prefix} ✓ {boxes} boxes{extra} → {split}" if boxes
+                              else f"{prefix} ⚠️  No detections (empty label file) → {split}")
+        elapsed = time.monotonic() - started
+        print(f"\n✓ Annotated {done_count - totals['failed']} images in {elapsed:.1f}s "
+              f"({done_count / elapsed:.2f} images/s)")
 
-    # Create data.yaml
     print(f"\n📝 Creating data.yaml...")
-    create_data_yaml(output_dir)
+    create_data_yaml(args.dataset)
+    cache.save()
 
     print("\n" + "=" * 60)
     print("✓ Auto-annotation Complete!")
     print("=" * 60)
-    print(f"\nDataset saved to: {output_dir}")
-    print(f"Train images: {len(train_images)}")
-    print(f"Val images: {len(val_images)}")
+    print(f"\nDataset: {args.dataset}")
+    print(f"New train images: {totals['train']}, new val images: {totals['val']}, failed: {totals['failed']}")
+    print(f"New boxes: {totals['boxes']} ({totals['holes_added']} from center holes)")
     print(f"\n⚠️  Note: Auto-annotations may not be perfect.")
     print("Review and manually correct if needed before training.")
+    return 0 if not totals["failed"] else 1
 
 
-def annotate_split(model, image_files, output_dir):
-    """Annotate a split of images."""
-
-    # Create directories
-    images_dir = os.path.join(output_dir, 'images')
-    labels_dir = os.path.join(output_dir, 'labels')
-    os.makedirs(images_dir, exist_ok=True)
-    os.makedirs(labels_dir, exist_ok=True)
-
-    for i, image_path in enumerate(image_files, 1):
-        filename = Path(image_path).stem
-        print(f"  [{i}/{len(image_files)}] {Path(image_path).name}...", end=' ')
-
-        # Copy image
-        dest_image = os.path.join(images_dir, Path(image_path).name)
-        shutil.copy(image_path, dest_image)
-
-        # Run prediction with low confidence to catch all objects
-        results = model.predict(image_path, conf=0.1, verbose=False)
-
-        # Convert to YOLO format
-        yolo_annotations = []
-
-        for result in results:
-            boxes = result.boxes
-            if len(boxes) == 0:
-                print("⚠️  No detections")
-                continue
-
-            # Get image dimensions
-            h, w = result.orig_shape
-
-            for box in boxes:
-                # Get box coordinates
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-
-                # Convert to YOLO format (class x_center y_center width height)
-                x_center = ((x1 + x2) / 2) / w
-                y_center = ((y1 + y2) / 2) / h
-                width = abs(x2 - x1) / w
-                height = abs(y2 - y1) / h
-
-                # Class 0 for thread_roll
-                yolo_annotations.append(f"0 {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}")
-
-        # Save annotations
-        label_path = os.path.join(labels_dir, f"{filename}.txt")
-
-        if yolo_annotations:
-            with open(label_path, 'w') as f:
-                f.write('\n'.join(yolo_annotations))
-            print(f"✓ {len(yolo_annotations)} boxes")
-        else:
-            # Create empty label file
-            open(label_path, 'w').close()
-            print("⚠️  No annotations (empty file created)")
-
-
-def create_data_yaml(dataset_dir):
-    """Create data.yaml configuration file."""
-
-    yaml_content = f"""# Thread Roll Dataset
-path: {dataset_dir}
-train: train/images
-val: val/images
-
-# Classes
-nc: 1  # number of classes
-names: ['thread_roll']  # class names
-"""
-
-    yaml_path = os.path.join(dataset_dir, 'data.yaml')
-
-    with open(yaml_path, 'w') as f:
-        f.write(yaml_content)
-
-    print(f"✓ Created {yaml_path}")
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Folder of photos to annotate")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="YOLO dataset folder (train/, val/, data.yaml)")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="YOLO weights used for annotation")
+    parser.add_argument("--conf", type=float, default=ANNOTATE_CONFIDENCE, help="YOLO confidence threshold")
+    parser.add_argument("--merge-holes", action="store_true",
+                        help="Also label center-hole detections that no YOLO box covers")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--batch-size", type=int, default=ANNOTATE_BATCH_SIZE, help="Images per batched YOLO call")
+    parser.add_argument("--val-fraction", type=float, default=0.2, help="Share of new images put in val")
+    parser.add_argument("--force", action="store_true", help="Re-annotate images that already have labels")
+    return auto_annotate(parser.parse_args())
 
 
 if __name__ == "__main__":
-    auto_annotate_images()
+    sys.exit(main())
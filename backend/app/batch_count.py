@@ -0,0 +1,230 @@
+"""
+Offline batch counter: count every image in folders or globs on all cores.
+
+    cd backend/app && python -m cli count /data/photos --output counts.csv
+    python -m cli count "/data/2025-*/**/*.jpg" --output counts.jsonl --workers 8
+
+Each worker process loads the detector once and counts batches of images
+(one batched YOLO pass per batch). Rows are appended to the output (CSV or
+JSONL, chosen by extension) as batches finish and flushed right away, so
+an interrupted run keeps everything finished so far. Running the same
+command again skips images already in the output (failed ones are tried
+again); --no-resume starts over. Throughput is reported at the end.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, Iterable, List, Optional, Set
+import csv
+import glob
+import json
+import os
+import signal
+import statistics
+import threading
+import time
+
+from detection_v2 import DETECTION_MODES
+from worker_pool import create_detector_pool, default_workers, detect_batch, is_image
+
+OUTPUT_COLUMNS = ["image", "total_count", "color_counts", "detector", "detect_ms", "error"]
+COUNT_BATCH_SIZE = 4               # Images per batched YOLO call
+
+
+def collect_images(inputs: Iterable[str], recursive: bool = False) -> List[str]:
+    """Absolute paths of the images in the given folders, globs and files, sorted and without duplicates."""
+    paths = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                if not recursive:
+                    dirs.clear()
+                paths.update(os.path.join(root, name) for name in files)
+        else:
+            paths.update(glob.glob(pattern, recursive=True))
+    return sorted(os.path.abspath(path) for path in paths if os.path.isfile(path) and is_image(path))
+
+
+def _output_format(path: str) -> str:
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def completed_images(output_path: str) -> Set[str]:
+    """
+    Images already counted in an existing output file.
+
+    A row cut off by a crash is truncated away first, so the file can be
+    appended to. Rows with an error don't count as done.
+    """
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+
+    done = set()
+    with open(output_path, newline="") as f:
+        if _output_format(output_path) == "jsonl":
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            if not row.get("error"):
+                done.add(row["image"])
+    return done
+
+
+def result_row(image_path: str, result: Dict) -> Dict:
+    timings = result.get("timings") or {}
+    return {
+        "image": image_path,
+        "total_count": result.get("total_count"),
+        "color_counts": result.get("color_counts"),
+        "detector": timings.get("path"),
+        "detect_ms": timings.get("detect"),
+        "error": result.get("error"),
+    }
+
+
+class ResultWriter:
+    """Appends result rows to a CSV or JSONL file, flushing after every batch."""
+
+    def __init__(self, path: str):
+        self.format = _output_format(path)
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="")
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=OUTPUT_COLUMNS)
+            if new:
+                self._csv.writeheader()
+
+    def write(self, rows: List[Dict]):
+        for row in rows:
+            if self.format == "jsonl":
+                self._file.write(json.dumps(row) + "\n")
+            else:
+                self._csv.writerow(dict(row, color_counts=json.dumps(row["color_counts"])
+                                        if row["color_counts"] is not None else ""))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def count_images(images: List[str], writer: ResultWriter, model_path: str, confidence_threshold: float = 0.5,
+                 workers: Optional[int] = None, batch_size: int = COUNT_BATCH_SIZE, mode: str = "hybrid",
+                 stop: Optional[threading.Event] = None) -> Dict:
+    """
+    Count images on a detector process pool, writing rows as batches finish.
+
+    Keeps two batches per worker in flight. When stop is set no new batches
+    are started and the ones in flight are finished and written.
+
+    Returns:
+        Throughput summary: counted, failed, seconds, images_per_sec, total_rolls, detect_ms p50/p95
+    """
+    workers = workers or default_workers()
+    stop = stop or threading.Event()
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+    counted = failed = total_rolls = 0
+    detect_ms = []
+
+    started = time.monotonic()
+    pool = create_detector_pool(model_path, workers=workers, confidence_threshold=confidence_threshold)
+    in_flight = {}
+    try:
+        next_batch = 0
+        while True:
+            while not stop.is_set() and next_batch < len(batches) and len(in_flight) < 2 * workers:
+                batch = batches[next_batch]
+                in_flight[pool.submit(detect_batch, batch, mode)] = batch
+                next_batch += 1
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                rows = [result_row(path, result) for path, result in zip(batch, future.result())]
+                writer.write(rows)
+                for row in rows:
+                    if row["error"]:
+                        failed += 1
+                        print(f"❌ {row['image']}: {row['error']}")
+                        continue
+                    counted += 1
+                    total_rolls += row["total_count"]
+                    if row["detect_ms"] is not None:
+                        detect_ms.append(row["detect_ms"])
+                print(f"   {counted + failed}/{len(images)} images", end="\r", flush=True)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.monotonic() - started
+    return {
+        "counted": counted,
+        "failed": failed,
+        "skipped": len(images) - counted - failed,
+        "seconds": elapsed,
+        "images_per_sec": (counted + failed) / elapsed if elapsed else 0.0,
+        "total_rolls": total_rolls,
+        "detect_ms_p50": statistics.median(detect_ms) if detect_ms else None,
+        "detect_ms_p95": statistics.quantiles(detect_ms, n=20)[-1] if len(detect_ms) >= 2 else None,
+        "workers": workers,
+    }
+
+
+def add_arguments(parser):
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    parser.add_argument("inputs", nargs="+", help="Image folders, glob patterns (quote them) or files")
+    parser.add_argument("--output", "-o", required=True, help="Results file (.csv or .jsonl)")
+    parser.add_argument("--model", default=os.path.join(app_dir, "models_weights", "best.pt"), help="YOLO weights")
+    parser.add_argument("--conf", type=float, default=0.5, help="Confidence threshold (the API uses 0.5)")
+    parser.add_argument("--mode", default="hybrid", choices=DETECTION_MODES, help="Detection mode")
+    parser.add_argument("--workers", type=int, default=None, help="Detector processes (default: one per core)")
+    parser.add_argument("--batch-size", type=int, default=COUNT_BATCH_SIZE, help="Images per batched YOLO call")
+    parser.add_argument("--recursive", "-r", action="store_true", help="Include images in subfolders")
+    parser.add_argument("--no-resume", action="store_true", help="Overwrite the output instead of resuming")
+    parser.set_defaults(func=run)
+
+
+def run(args) -> int:
+    images = collect_images(args.inputs, recursive=args.recursive)
+    if not images:
+        print(f"❌ No images found in {', '.join(args.inputs)}")
+        return 1
+
+    if args.no_resume and os.path.exists(args.output):
+        os.remove(args.output)
+    done = completed_images(args.output)
+    todo = [image for image in images if image not in done]
+    if not todo:
+        print(f"✓ All {len(images)} images are already in {args.output}")
+        return 0
+    # No more detectors than batches: each worker loads the model
+    workers = min(args.workers or default_workers(), -(-len(todo) // args.batch_size))
+    print(f"✓ {len(images)} images, {len(images) - len(todo)} already in {args.output}, "
+          f"counting {len(todo)} with {workers} worker(s)")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    writer = ResultWriter(args.output)
+    try:
+        summary = count_images(todo, writer, args.model, confidence_threshold=args.conf, workers=workers,
+                               batch_size=args.batch_size, mode=args.mode, stop=stop)
+    finally:
+        writer.close()
+
+    print(f"\n{'=' * 60}")
+    print(f"Counted {summary['counted']} images ({summary['failed']} failed) in {summary['seconds']:.1f}s "
+          f"with {summary['workers']} worker(s)")
+    print(f"Throughput: {summary['images_per_sec']:.2f} images/s | {summary['total_rolls']} rolls")
+    if summary["detect_ms_p50"] is not None:
+        p95 = summary["detect_ms_p95"]
+        print(f"Per-image detect (excl. batched YOLO): p50 {summary['detect_ms_p50']:.0f} ms"
+              + (f", p95 {p95:.0f} ms" if p95 is not None else ""))
+    if stop.is_set():
+        print(f"Interrupted: {summary['skipped']} images left, run the same command again to resume")
+    print(f"Results: {args.output}")
+    return 130 if stop.is_set() else 0
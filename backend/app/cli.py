@@ -0,0 +1,31 @@
+"""
+Command line tools, run from backend/app:
+
+    python -m cli ingest DIR [DIR ...]    Watch drop folders and record new images (ingest.py)
+    python -m cli count INPUT [INPUT ...] -o FILE
+                                          Count images into a CSV/JSONL file on all cores (batch_count.py)
+"""
+
+import argparse
+import sys
+
+import batch_count
+import ingest
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m cli", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest.add_arguments(commands.add_parser("ingest", help="Watch drop folders and record new images",
+                                             description=ingest.__doc__,
+                                             formatter_class=argparse.RawDescriptionHelpFormatter))
+    batch_count.add_arguments(commands.add_parser("count", help="Count images into a CSV/JSONL file",
+                                                  description=batch_count.__doc__,
+                                                  formatter_class=argparse.RawDescriptionHelpFormatter))
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
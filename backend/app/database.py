@@ -1,18 +1,76 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import create_engine, event, Boolean, Column, ForeignKey, Index, Integer, String, Text, DateTime, JSON
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from concurrent.futures import Future
 from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import os
+import queue
+import threading
+import time
 
 # Database setup
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE_URL = f"sqlite:///{os.path.join(os.path.dirname(BASE_DIR), 'thread_rolls.db')}"
+DATABASE_PATH = os.environ.get(
+    "THREAD_ROLL_DB_PATH", os.path.join(os.path.dirname(BASE_DIR), 'thread_rolls.db')
+)
+DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# SQLite tuning
+SQLITE_BUSY_TIMEOUT_MS = 5000    # Wait for locks instead of failing with "database is locked"
+SQLITE_CACHE_SIZE_KB = 20000     # Page cache per connection (negative PRAGMA value = KiB)
+POOL_SIZE = 8                    # Persistent connections kept open
+POOL_MAX_OVERFLOW = 8            # Extra connections allowed under burst load
+
+# Rollup buckets maintained alongside every Record change, keyed in SQLAlchemy's SQLite DateTime format
+ROLLUP_BUCKET_FORMATS = {
+    "hour": "%Y-%m-%d %H:00:00.000000",
+    "day": "%Y-%m-%d 00:00:00.000000",
+}
+ROLLUP_GRANULARITIES = tuple(ROLLUP_BUCKET_FORMATS)
+ANONYMOUS_USER = ""              # Rollup key for records without a user
+
+# Write-behind commit queue
+WRITER_FLUSH_INTERVAL = 0.005    # Seconds to gather inserts into one commit
+WRITER_MAX_BATCH = 256           # Upper bound on records per commit
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine for the FastAPI handlers (aiosqlite runs each connection on its own thread)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    poolclass=AsyncAdaptedQueuePool,  # aiosqlite defaults to NullPool, reconnecting per session
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Enable WAL so readers never block the writer, and relax fsync to once per checkpoint."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
 class Record(Base):
     __tablename__ = "records"
 
@@ -26,6 +84,307 @@ class Record(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class RecordColor(Base):
+    """Per-record color counts, normalized out of Record.color_counts for indexed filtering."""
+    __tablename__ = "record_colors"
+    __table_args__ = (Index("ix_record_colors_color_count", "color", "count", "record_id"),)
+
+    record_id = Column(Integer, ForeignKey("records.id", ondelete="CASCADE"), primary_key=True)
+    color = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+
+# PRAGMA user_version once the search indexes have been backfilled from existing records
+SEARCH_SCHEMA_VERSION = 1
+
+# Search indexes kept in sync with `records` by triggers, so every writer
+# (ORM sessions, the record writer, raw SQL) updates them in the same transaction
+SEARCH_SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS ix_records_created_at ON records (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_records_user_created_at ON records (user, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_records_total_count ON records (total_count)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5("
+    "description, content='records', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    """CREATE TRIGGER IF NOT EXISTS records_search_ai AFTER INSERT ON records BEGIN
+        INSERT INTO records_fts (rowid, description) VALUES (new.id, new.description);
+        INSERT INTO record_colors (record_id, color, count)
+            SELECT new.id, key, value FROM json_each(new.color_counts);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS records_search_ad AFTER DELETE ON records BEGIN
+        INSERT INTO records_fts (records_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        DELETE FROM record_colors WHERE record_id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS records_search_au_description AFTER UPDATE OF description ON records BEGIN
+        INSERT INTO records_fts (records_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO records_fts (rowid, description) VALUES (new.id, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS records_search_au_colors AFTER UPDATE OF color_counts ON records BEGIN
+        DELETE FROM record_colors WHERE record_id = old.id;
+        INSERT INTO record_colors (record_id, color, count)
+            SELECT new.id, key, value FROM json_each(new.color_counts);
+    END""",
+]
+
+
+class RollupBucket(Base):
+    """Record and roll totals per time bucket and user."""
+    __tablename__ = "rollup_buckets"
+
+    granularity = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    user = Column(String, primary_key=True, default=ANONYMOUS_USER)
+    record_count = Column(Integer, nullable=False, default=0)
+    roll_count = Column(Integer, nullable=False, default=0)
+
+
+class ColorRollup(Base):
+    """Roll totals per time bucket, user and color."""
+    __tablename__ = "color_rollups"
+
+    granularity = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    user = Column(String, primary_key=True, default=ANONYMOUS_USER)
+    color = Column(String, primary_key=True)
+    roll_count = Column(Integer, nullable=False, default=0)
+
+
+class ReprocessRun(Base):
+    """A re-count of historical uploads with a (new) model file, see reprocess.py."""
+    __tablename__ = "reprocess_runs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    model_path = Column(String, nullable=False)
+    model_sha256 = Column(String, nullable=False)
+    mode = Column(String, nullable=False, default="hybrid")
+    batch_size = Column(Integer, nullable=False)
+    workers = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="pending")   # pending/running/paused/completed/failed
+    max_record_id = Column(Integer, nullable=False)              # Records created later are not part of the run
+    total = Column(Integer, nullable=False)
+    processed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    owner = Column(String, nullable=True)                        # "host:pid" of the process driving the run
+    heartbeat_at = Column(DateTime, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class ReprocessCheckpoint(Base):
+    """Records a run has finished with; everything else up to max_record_id is still to do."""
+    __tablename__ = "reprocess_checkpoints"
+
+    run_id = Column(Integer, ForeignKey("reprocess_runs.id", ondelete="CASCADE"), primary_key=True)
+    record_id = Column(Integer, primary_key=True)
+    ok = Column(Boolean, nullable=False)
+    error = Column(Text, nullable=True)
+    processed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RecordVersion(Base):
+    """Counts for a record from a later model, stored next to the original counts on Record."""
+    __tablename__ = "record_versions"
+    __table_args__ = (Index("ix_record_versions_record_run", "record_id", "run_id", unique=True),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    record_id = Column(Integer, ForeignKey("records.id", ondelete="CASCADE"), nullable=False)
+    run_id = Column(Integer, ForeignKey("reprocess_runs.id", ondelete="CASCADE"), nullable=False)
+    model_sha256 = Column(String, nullable=False)
+    total_count = Column(Integer, nullable=False)
+    color_counts = Column(JSON, nullable=False)
+    raw_detection = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class PredictionJob(Base):
+    """An uploaded image waiting for (or done with) asynchronous prediction, see jobs.py."""
+    __tablename__ = "prediction_jobs"
+    __table_args__ = (Index("ix_prediction_jobs_claim", "status", "visible_at"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    status = Column(String, nullable=False, default="queued")   # queued/running/succeeded/failed
+    image_filename = Column(String, nullable=False)
+    user = Column(String, nullable=True)
+    description = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    visible_at = Column(DateTime, nullable=False)               # Not claimable before this (retry backoff / lease)
+    claim_token = Column(String, nullable=True)                 # Identifies the current attempt's lease
+    error = Column(Text, nullable=True)
+    record_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class IngestedFile(Base):
+    """An image picked up from a watched drop folder, keyed by content so it is recorded once, see ingest.py."""
+    __tablename__ = "ingested_files"
+
+    content_sha256 = Column(String, primary_key=True)
+    source_path = Column(String, nullable=False)                # Where it was first seen
+    status = Column(String, nullable=False, default="processing")   # processing/done/failed
+    claim_token = Column(String, nullable=True)                 # Identifies the current attempt
+    claimed_at = Column(DateTime, nullable=False)
+    record_id = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# Foreign keys are not enforced on these connections, so record deletes cascade by trigger
+REPROCESS_SCHEMA = [
+    """CREATE TRIGGER IF NOT EXISTS records_versions_ad AFTER DELETE ON records BEGIN
+        DELETE FROM record_versions WHERE record_id = old.id;
+    END""",
+]
+
+
+def _rollup_statements(row: str, sign: int) -> str:
+    """Trigger body adding (sign 1) or removing (sign -1) the `new`/`old` row of records to the rollups."""
+    granularities = " UNION ALL ".join(
+        f"SELECT '{granularity}' AS granularity, '{fmt}' AS fmt" for granularity, fmt in ROLLUP_BUCKET_FORMATS.items()
+    )
+    # WHERE also separates the SELECT from ON CONFLICT, which SQLite would otherwise parse as a join constraint
+    return f"""
+        INSERT INTO rollup_buckets (granularity, bucket_start, user, record_count, roll_count)
+            SELECT g.granularity, strftime(g.fmt, {row}.created_at), COALESCE({row}.user, '{ANONYMOUS_USER}'),
+                   {sign}, {sign} * COALESCE({row}.total_count, 0)
+            FROM ({granularities}) AS g WHERE {row}.created_at IS NOT NULL
+            ON CONFLICT (granularity, bucket_start, user) DO UPDATE SET
+                record_count = record_count + excluded.record_count, roll_count = roll_count + excluded.roll_count;
+        INSERT INTO color_rollups (granularity, bucket_start, user, color, roll_count)
+            SELECT g.granularity, strftime(g.fmt, {row}.created_at), COALESCE({row}.user, '{ANONYMOUS_USER}'),
+                   j.key, {sign} * j.value
+            FROM ({granularities}) AS g, json_each({row}.color_counts) AS j WHERE {row}.created_at IS NOT NULL
+            ON CONFLICT (granularity, bucket_start, user, color) DO UPDATE SET
+                roll_count = roll_count + excluded.roll_count;"""
+
+
+# Rollups kept in sync with `records` by triggers, like the search indexes, so Core
+# inserts/updates/deletes and raw SQL update them in the same transaction as the ORM does
+ROLLUP_SCHEMA = [
+    f"""CREATE TRIGGER IF NOT EXISTS records_rollups_ai AFTER INSERT ON records BEGIN
+        {_rollup_statements("new", 1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS records_rollups_ad AFTER DELETE ON records BEGIN
+        {_rollup_statements("old", -1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS records_rollups_au
+        AFTER UPDATE OF created_at, user, total_count, color_counts ON records BEGIN
+        {_rollup_statements("old", -1)}
+        {_rollup_statements("new", 1)}
+    END""",
+]
+
+
+def rollup_bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its hour or day bucket."""
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup granularity: {granularity}")
+
+
+class RecordWriter:
+    """
+    Single writer thread that group-commits Record inserts.
+
+    SQLite allows one writer at a time, so instead of every request opening
+    its own write transaction, inserts are queued here and committed together
+    every WRITER_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(self, flush_interval: float = WRITER_FLUSH_INTERVAL, max_batch: int = WRITER_MAX_BATCH):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[Tuple[Dict, Future]]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the writer thread (idempotent)."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="record-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Flush pending inserts and stop the writer thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+
+    def submit(self, values: Dict) -> Future:
+        """
+        Queue a Record insert.
+
+        Args:
+            values: Column values for the new Record
+
+        Returns:
+            Future resolving to the committed (detached) Record
+        """
+        self.start()
+        future = Future()
+        self._queue.put((values, future))
+        return future
+
+    def insert(self, values: Dict) -> Record:
+        """Queue a Record insert and block until it is committed."""
+        return self.submit(values).result()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch: List[Tuple[Dict, Future]]):
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            records = [Record(**values) for values, _ in batch]
+            db.add_all(records)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+
+        for record, (_, future) in zip(records, batch):
+            future.set_result(record)
+
+
+record_writer = RecordWriter()
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -34,5 +393,24 @@ def get_db():
         db.close()
 
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency yielding an AsyncSession, so handlers never block the event loop on DB I/O."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        for statement in SEARCH_SCHEMA + ROLLUP_SCHEMA + REPROCESS_SCHEMA:
+            conn.exec_driver_sql(statement)
+
+        # Backfill indexes once for databases created before search existed
+        if conn.exec_driver_sql("PRAGMA user_version").scalar() < SEARCH_SCHEMA_VERSION:
+            conn.exec_driver_sql("INSERT INTO records_fts (records_fts) VALUES ('rebuild')")
+            conn.exec_driver_sql(
+                "INSERT OR IGNORE INTO record_colors (record_id, color, count) "
+                "SELECT r.id, j.key, j.value FROM records AS r, json_each(r.color_counts) AS j"
+            )
+            conn.exec_driver_sql(f"PRAGMA user_version = {SEARCH_SCHEMA_VERSION}")
@@ -3,8 +3,13 @@ import numpy as np
 from ultralytics import YOLO
 from sklearn.cluster import KMeans
 from PIL import Image
+import json
 import os
-from typing import List, Dict, Tuple
+import time
+from typing import List, Dict, Optional, Tuple, Union
+
+from metrics import add_stage, collect_timings, set_path, stage
+from routing import PipelineRouter, model_digest
 
 # Optimized color ranges for orange/brown thread rolls
 COLOR_RANGES = {
@@ -15,15 +20,338 @@ COLOR_RANGES = {
     "orange": [(5, 100, 100), (20, 255, 255)],       # Fallback orange
 }
 
+# "hybrid" tries YOLO and falls back to center holes; the others force one path
+DETECTION_MODES = ("hybrid", "yolo", "hough")
+
+# When hybrid mode runs both paths it keeps the YOLO result only if it finds more than this many rolls
+# (which paths run is decided per image by routing.PipelineRouter)
+YOLO_MIN_DETECTIONS = 50
+
+# Smallest contour area (pixels of the full image) taken for the cage
+CAGE_MIN_AREA = 100000
+
+# Routing pre-features are computed on a thumbnail with this long side
+THUMBNAIL_SIZE = 256
+# Dark connected components of this many thumbnail pixels are counted as possible center holes
+DARK_BLOB_AREA = (2, 60)
+
+# YOLO input size when the weights don't record the size they were trained at
+YOLO_DEFAULT_INPUT_SIZE = 640
+
+# HOUGH_PARAMS are in pixels of photos up to this long side (the messaging-app sized samples);
+# center-hole detection on much smaller images misses holes below minRadius
+HOUGH_REFERENCE_DIMENSION = 1600
+
+# YOLO confidence at which raw outputs are captured for later rescoring (lowest rescorable threshold)
+RAW_CAPTURE_CONFIDENCE = 0.05
+
+# HoughCircles parameters for center-hole detection (optimized for exactly 109 rolls)
+HOUGH_PARAMS = {
+    "dp": 1.2,
+    "minDist": 33,     # Spacing between centers
+    "param1": 50,
+    "param2": 34.5,    # Fine-tuned between 34 (112 rolls) and 35 (98 rolls)
+    "minRadius": 6,    # Minimum center hole radius
+    "maxRadius": 22,   # Maximum center hole radius
+}
+
+# HSV thresholds used by map_hsv_to_label (hue bands are fixed, these are tunable)
+COLOR_RULES = {
+    "yellow_bright_s_min": 10,    # Bright yellow in H=17-25 (looks orange-ish)
+    "yellow_bright_v_min": 105,   # ... and the V split between yellow and orange/brown
+    "yellow_s_min": 10,           # Standard yellow H=26-35
+    "yellow_v_min": 25,
+    "yellow_wrap_s_min": 70,      # Camera-affected bright yellow at H=170-180
+    "yellow_wrap_v_min": 170,
+    "orange_brown_s_min": 45,     # Darker orange/brown in H=8-25
+    "orange_brown_v_min": 60,
+    "white_s_max": 50,
+    "white_v_min": 180,
+    "pink_s_min": 60,             # True pink, not yellow
+    "pink_v_min": 85,
+    "pink_v_max": 170,
+    "pink_magenta_v_min": 115,    # Main pink/magenta range H=140-165
+    "pink_dark_s_min": 45,        # Lower saturation (darker) pink shades
+    "pink_dark_v_min": 110,
+}
+
+# Optional overrides written by tune_detector.py, looked up next to the model weights
+DETECTOR_CONFIG_FILENAME = "detector_config.json"
+
+# Detector inputs: an image file path, or an already decoded BGR image (e.g. from shared memory)
+ImageSource = Union[str, np.ndarray]
+
+
+def load_detector_config(config_path: str) -> Dict:
+    """
+    Read detector overrides ({"hough": {...}, "color_rules": {...}}) from a JSON file.
+
+    Unknown keys are rejected so a typo cannot silently fall back to defaults.
+    """
+    with open(config_path) as f:
+        config = json.load(f)
+
+    for section, defaults in (("hough", HOUGH_PARAMS), ("color_rules", COLOR_RULES)):
+        unknown = set(config.get(section, {})) - set(defaults)
+        if unknown:
+            raise ValueError(f"Unknown {section} keys in {config_path}: {', '.join(sorted(unknown))}")
+    return config
+
+
+def preferred_input_dimension(yolo_input_size: int = YOLO_DEFAULT_INPUT_SIZE) -> int:
+    """
+    Longest image side worth uploading.
+
+    YOLO resizes to its input size anyway, but the center-hole fallback
+    needs the resolution its pixel parameters were tuned at.
+    """
+    return max(yolo_input_size, HOUGH_REFERENCE_DIMENSION)
+
+
+def read_image(image: ImageSource) -> np.ndarray:
+    """Decode an image file to BGR; already decoded images are returned as they are."""
+    if isinstance(image, np.ndarray):
+        return image
+    decoded = cv2.imread(image)
+    if decoded is None:
+        raise ValueError(f"Could not read image: {image}")
+    return decoded
+
+
+def find_center_circles(gray: np.ndarray, hough_params: Dict) -> List[Tuple[int, int, int]]:
+    """Run HoughCircles on a grayscale image and return (cx, cy, r) center-hole candidates."""
+    circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, **hough_params)
+    if circles is None:
+        return []
+    circles = np.uint16(np.around(circles))
+    return [(int(c[0]), int(c[1]), int(c[2])) for c in circles[0]]
+
+
+def is_inside_cage(point: Tuple[float, float], cage_bbox: Optional[Tuple[int, int, int, int]]) -> bool:
+    """Check if a point is inside the cage boundary."""
+    if cage_bbox is None:
+        return True  # If no cage detected, include everything
+
+    x, y = point
+    x1, y1, x2, y2 = cage_bbox
+
+    return x1 <= x <= x2 and y1 <= y <= y2
+
+
+def find_cage_boundary(image: np.ndarray, edges: Optional[np.ndarray] = None,
+                       min_area: float = CAGE_MIN_AREA) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Largest square-ish contour of the Canny edge map (the cage), or None.
+
+    Args:
+        image: BGR image
+        edges: Precomputed Canny(gray, 50, 150) edge map, if already available
+        min_area: Smallest contour area in pixels (scale it down for downsized images)
+    """
+    try:
+        if edges is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            edges = cv2.Canny(gray, 50, 150)
+
+        # Find contours
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        if not contours:
+            return None
+
+        # Find the largest rectangular contour (likely the cage)
+        largest_area = 0
+        cage_bbox = None
+
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area > largest_area and area > min_area:  # Minimum area threshold
+                x, y, w, h = cv2.boundingRect(contour)
+                # Check if it's roughly square-ish (aspect ratio between 0.7 and 1.5)
+                aspect_ratio = w / h if h > 0 else 0
+                if 0.7 < aspect_ratio < 1.5:
+                    largest_area = area
+                    cage_bbox = (x, y, x + w, y + h)
+
+        if cage_bbox:
+            print(f"✓ Detected cage boundary: {cage_bbox}")
+
+        return cage_bbox
+
+    except Exception as e:
+        print(f"⚠️  Could not detect cage boundary: {e}")
+        return None
+
+
+def thumbnail_features(image: np.ndarray) -> Dict:
+    """
+    Cheap routing pre-features from a THUMBNAIL_SIZE thumbnail of a BGR image.
+
+    Returns:
+        {"cage_found", "dark_blob_density" (hole-sized dark blobs per 10k
+        thumbnail pixels), "brightness" (mean gray level)}
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, THUMBNAIL_SIZE / max(height, width))
+    thumbnail = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+    brightness = float(gray.mean())
+
+    # Center holes are much darker than the yarn around them, whatever the exposure
+    dark = (gray < 0.5 * brightness).astype(np.uint8)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(dark, connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    blobs = int(((areas >= DARK_BLOB_AREA[0]) & (areas <= DARK_BLOB_AREA[1])).sum())
+
+    return {
+        "cage_found": find_cage_boundary(thumbnail, min_area=CAGE_MIN_AREA * scale * scale) is not None,
+        "dark_blob_density": round(blobs / (gray.size / 1e4), 2),
+        "brightness": round(brightness, 1),
+    }
+
+
+def roll_hsv(image: np.ndarray, cx: int, cy: int, center_radius: int) -> Optional[np.ndarray]:
+    """
+    Dominant HSV color of the outer ring of a thread roll, excluding the black center.
+
+    Args:
+        image: Full image (RGB)
+        cx, cy: Center coordinates of the roll
+        center_radius: Radius of the center hole
+
+    Returns:
+        HSV triple, or None if the ring has no pixels inside the image
+    """
+    # Define annular region: outer roll surface, excluding center hole
+    inner_radius = center_radius + 5  # Start sampling after the center hole
+    outer_radius = int(center_radius * 6)  # Sample the colored surface
+
+    height, width = image.shape[:2]
+
+    # Only the square around the ring can be inside it; slicing keeps pixel
+    # order identical to a full-image mask but avoids an H x W distance map per roll
+    x0, x1 = max(0, cx - outer_radius), min(width, cx + outer_radius + 1)
+    y0, y1 = max(0, cy - outer_radius), min(height, cy + outer_radius + 1)
+    region = image[y0:y1, x0:x1]
+
+    # Create mask for annular sampling
+    y_coords, x_coords = np.ogrid[y0:y1, x0:x1]
+    dist_from_center = np.sqrt((x_coords - cx)**2 + (y_coords - cy)**2)
+
+    # Boolean mask for the annular region
+    annular_mask = (dist_from_center >= inner_radius) & (dist_from_center <= outer_radius)
+
+    # Extract pixels from the annular region
+    annular_pixels = region[annular_mask]
+
+    if len(annular_pixels) == 0:
+        return None
+
+    # Sample max 500 pixels for speed (fixed seed: the same roll always gets the same color)
+    if len(annular_pixels) > 500:
+        indices = np.random.default_rng(0).choice(len(annular_pixels), 500, replace=False)
+        annular_pixels = annular_pixels[indices]
+
+    # Apply KMeans to find dominant color
+    kmeans = KMeans(n_clusters=1, random_state=42, n_init=10)
+    kmeans.fit(annular_pixels)
+    dominant_color_rgb = kmeans.cluster_centers_[0]
+
+    # Convert RGB to HSV
+    dominant_color_bgr = np.uint8([[dominant_color_rgb[::-1]]])
+    return cv2.cvtColor(dominant_color_bgr, cv2.COLOR_BGR2HSV)[0][0]
+
+
+def map_hsv_to_label(hsv: np.ndarray, rules: Dict = COLOR_RULES) -> str:
+    """Map HSV values to predefined color labels - optimized for yellow thread rolls."""
+    h, s, v = hsv
+
+    # PRIORITY 1: Yellow detection (CHECK FIRST for bright rolls)
+    # Yellow thread rolls: H=17-35 (includes bright yellow that looks orange-ish)
+    # Key insight: Bright rolls (V>=105) in H=17-25 are YELLOW, not orange/brown
+    # Analysis shows: Yellow rolls have H=17-25, V=75-157 (bright!)
+    
+    # Bright yellow in H=17-25 range (catches yellow that looks orange-ish)
+    if 17 <= h <= 25 and s >= rules["yellow_bright_s_min"] and v >= rules["yellow_bright_v_min"]:
+        return "yellow"
+    
+    # Standard yellow range H=26-35
+    if 26 <= h <= 35 and s >= rules["yellow_s_min"] and v >= rules["yellow_v_min"]:
+        return "yellow"
+    
+    # Also catch camera-affected bright yellow (high H due to white balance)
+    if 170 <= h <= 180 and v >= rules["yellow_wrap_v_min"] and s >= rules["yellow_wrap_s_min"]:
+        return "yellow"
+    
+    # PRIORITY 2: Orange/Brown detection (darker rolls, checked after yellow)
+    # Orange/brown thread rolls: H=8-25, but DARKER than yellow (V<105)
+    # Analysis shows: Orange/brown has H=8-25, V=60-105 (darker than bright yellow)
+    if (8 <= h <= 25 and s >= rules["orange_brown_s_min"]
+            and rules["orange_brown_v_min"] <= v < rules["yellow_bright_v_min"]):
+        return "orange_brown"
+    
+    # PRIORITY 3: White (low saturation, high brightness)
+    if s <= rules["white_s_max"] and v >= rules["white_v_min"]:
+        return "white"
+    
+    # PRIORITY 4: Pink detection (true pink, not yellow)
+    # Exclude bright colors that could be yellow
+    if s >= rules["pink_s_min"] and v >= rules["pink_v_min"] and v < rules["pink_v_max"]:
+        # Pink/red wraparound range (but not catching yellow)
+        if (165 <= h <= 180) or (0 <= h <= 7):
+            return "pink"
+        # Main pink/magenta range
+        if 140 <= h < 165 and v >= rules["pink_magenta_v_min"]:
+            return "pink"
+    
+    # Lower saturation pink (darker pink shades)
+    if s >= rules["pink_dark_s_min"] and v >= rules["pink_dark_v_min"] and v < rules["pink_v_max"]:
+        if 140 <= h <= 180:
+            return "pink"
+
+    # Check remaining colors from COLOR_RANGES
+    for color_name, (lower, upper) in COLOR_RANGES.items():
+        if color_name in ["pink", "yellow", "white", "orange_brown"]:  # Already handled
+            continue
+            
+        lower = np.array(lower)
+        upper = np.array(upper)
+
+        if (lower[0] <= h <= upper[0] and
+            lower[1] <= s <= upper[1] and
+            lower[2] <= v <= upper[2]):
+            return color_name
+
+    return "other"
+
+
+def summarize_detections(detections: List[Dict]) -> Dict:
+    """Total count, per-color counts and the detections themselves (uncolored ones are not in color_counts)."""
+    color_counts = {}
+    for detection in detections:
+        color = detection["color"]
+        if color is not None:
+            color_counts[color] = color_counts.get(color, 0) + 1
+
+    return {
+        "total_count": len(detections),
+        "color_counts": color_counts,
+        "detections": detections
+    }
+
 
 class ThreadRollDetectorV2:
-    def __init__(self, model_path: str, confidence_threshold: float = 0.05):
+    def __init__(self, model_path: str, confidence_threshold: float = 0.05, config_path: Optional[str] = None,
+                 route_log: Optional[str] = None):
         """
         Enhanced thread roll detector with center-hole detection and region filtering.
         
         Args:
             model_path: Path to the YOLO model weights file
             confidence_threshold: Minimum confidence for detections
+            config_path: Hough/color overrides; defaults to detector_config.json next to the weights
+            route_log: Decision log of the hybrid-mode router (see routing.py); None keeps its statistics in memory
         """
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model file not found at {model_path}")
@@ -32,63 +360,75 @@ class ThreadRollDetectorV2:
         self.confidence_threshold = confidence_threshold
         print(f"✓ Model loaded with confidence threshold: {confidence_threshold}")
 
-    def detect_center_holes(self, image_path: str) -> List[Dict]:
+        self.hough_params = dict(HOUGH_PARAMS)
+        self.color_rules = dict(COLOR_RULES)
+        if config_path is None:
+            config_path = os.path.join(os.path.dirname(model_path), DETECTOR_CONFIG_FILENAME)
+            if not os.path.exists(config_path):
+                config_path = None
+        if config_path is not None:
+            config = load_detector_config(config_path)
+            self.hough_params.update(config.get("hough", {}))
+            self.color_rules.update(config.get("color_rules", {}))
+            print(f"✓ Detector config loaded from {config_path}")
+
+        self.router = PipelineRouter(log_path=route_log, model=model_digest(model_path) if route_log else None)
+
+    @property
+    def input_size(self) -> int:
+        """Long side YOLO resizes images to (the training imgsz recorded in the weights)."""
+        imgsz = getattr(self.model, "overrides", {}).get("imgsz", YOLO_DEFAULT_INPUT_SIZE)
+        return max(imgsz) if isinstance(imgsz, (list, tuple)) else int(imgsz)
+
+    def detect_center_holes(self, image_path: ImageSource, raw: Optional[Dict] = None,
+                            colors: bool = True) -> List[Dict]:
         """
         Detect thread rolls by finding their black center holes using circle detection.
         This is more accurate than detecting the entire roll.
         
         Args:
-            image_path: Path to the input image
+            image_path: Path to the input image, or the decoded BGR image
+            raw: If given, the Hough circles and cage boundary are stored in it for rescore()
+            colors: Classify each roll's color; without it detections have color None
             
         Returns:
             List of detection dictionaries with bbox, confidence, and color
         """
         # Read image
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Could not read image: {image_path}")
-            
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        height, width = image.shape[:2]
+        with stage("decode"):
+            image = read_image(image_path)
+
+            # Without colors only the image size is needed, so skip the RGB copy
+            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if colors else image
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
         # Detect the cage boundary (largest rectangle/contour)
         cage_bbox = self._detect_cage_boundary(image)
         
         print(f"🔍 Detecting center holes in image...")
-        
-        # Apply adaptive thresholding to find dark centers
-        _, thresh = cv2.threshold(gray, 60, 255, cv2.THRESH_BINARY_INV)
-        
-        # Morphological operations to clean up
-        kernel = np.ones((5, 5), np.uint8)
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-        
-        # Find circles using HoughCircles (optimized for exactly 109 rolls)
-        circles = cv2.HoughCircles(
-            gray,
-            cv2.HOUGH_GRADIENT,
-            dp=1.2,
-            minDist=33,   # Spacing between centers  
-            param1=50,
-            param2=34.5,  # Fine-tuned between 34 (112 rolls) and 35 (98 rolls)
-            minRadius=6,  # Minimum center hole radius
-            maxRadius=22  # Maximum center hole radius
-        )
-        
+
+        with stage("hough"):
+            # Find circles using HoughCircles
+            circles = find_center_circles(gray, self.hough_params)
+
+        if raw is not None:
+            raw["circles"] = circles
+            raw["cage_bbox"] = cage_bbox
+
+        return self._label_center_holes(circles, image_rgb, cage_bbox, colors=colors)
+
+    def _label_center_holes(self, circles: List[Tuple[int, int, int]], image_rgb: np.ndarray,
+                            cage_bbox: Optional[Tuple[int, int, int, int]], colors: bool = True) -> List[Dict]:
+        """Turn Hough circles inside the cage into color-labeled roll detections."""
+        height, width = image_rgb.shape[:2]
         detections = []
         
-        if circles is not None:
-            circles = np.uint16(np.around(circles))
-            print(f"   Found {len(circles[0])} potential center holes")
+        if circles:
+            print(f"   Found {len(circles)} potential center holes")
             
             detection_number = 1  # Counter for numbering
             
-            for circle in circles[0]:
-                cx, cy, r = int(circle[0]), int(circle[1]), int(circle[2])
-                
+            for cx, cy, r in circles:
                 # Filter out circles outside the cage
                 if cage_bbox and not self._is_inside_cage((cx, cy), cage_bbox):
                     continue
@@ -102,7 +442,10 @@ class ThreadRollDetectorV2:
                 
                 # Extract only the outer ring for color detection (avoid black center)
                 # Create annular mask to sample only the colored part
-                color_label = self._get_roll_color(image_rgb, cx, cy, r)
+                color_label = None
+                if colors:
+                    with stage("color"):
+                        color_label = self._get_roll_color(image_rgb, cx, cy, r)
                 
                 detection = {
                     "id": detection_number,  # Add unique number for each detection
@@ -118,81 +461,276 @@ class ThreadRollDetectorV2:
         print(f"✓ Detected {len(detections)} thread rolls inside cage")
         return detections
 
-    def detect_rolls(self, image_path: str) -> List[Dict]:
+    def detect_rolls(self, image_path: ImageSource, mode: str = "hybrid", raw: Optional[Dict] = None,
+                     yolo_boxes: Optional[List[Dict]] = None, colors: bool = True,
+                     route: Optional[Dict] = None, yolo_ms: float = 0.0) -> List[Dict]:
         """
-        Hybrid detection: Use YOLO first, then fall back to center-hole detection.
+        Hybrid detection: YOLO and/or center-hole detection, routed per image.
+
+        In hybrid mode the router (see routing.py) decides from thumbnail
+        features whether YOLO, center holes or both run. When both run, the
+        YOLO result is kept if it finds more than YOLO_MIN_DETECTIONS rolls.
         
         Args:
-            image_path: Path to the input image
+            image_path: Path to the input image, or the decoded BGR image
+            mode: "hybrid" (default), or "yolo" / "hough" to force a single path
+            raw: If given, filled with the model outputs and circles that rescore() needs
+            yolo_boxes: Boxes already predicted for this image (see process_batch())
+            colors: Classify each roll's color; without it detections have color None
+            route: Router decision already made for this image (see process_batch())
+            yolo_ms: Time already spent predicting yolo_boxes, for the router's latency statistics
             
         Returns:
             List of detection dictionaries
         """
-        # Try YOLO detection first
-        yolo_detections = self._detect_with_yolo(image_path)
-        
-        # If YOLO finds good results, use it
-        if len(yolo_detections) > 50:
+        if mode not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection mode: {mode}")
+
+        # Decode once for YOLO, the cage search and center-hole detection
+        with stage("decode"):
+            image = read_image(image_path)
+
+        if mode == "hough":
+            hole_detections = self.detect_center_holes(image, raw=raw, colors=colors)
+            set_path("hough")
+            return hole_detections
+
+        if mode == "yolo":
+            yolo_detections = self._detect_with_yolo(image, raw=raw, boxes=yolo_boxes, colors=colors)
             print(f"✓ Using YOLO detections: {len(yolo_detections)} objects")
+            set_path("yolo")
             return yolo_detections
-        
-        # Otherwise, use center-hole detection
-        print(f"⚠️  YOLO found only {len(yolo_detections)} objects, switching to center-hole detection...")
-        hole_detections = self.detect_center_holes(image_path)
-        
-        return hole_detections
 
-    def _detect_with_yolo(self, image_path: str) -> List[Dict]:
+        if route is None:
+            route = self._route(image, image_path)
+
+        detections, latency_ms = {}, {}
+        if route["route"] in ("yolo", "both"):
+            start = time.perf_counter()
+            detections["yolo"] = self._detect_with_yolo(image, raw=raw, boxes=yolo_boxes, colors=colors)
+            latency_ms["yolo"] = (time.perf_counter() - start) * 1000 + yolo_ms
+        if route["route"] in ("hough", "both"):
+            start = time.perf_counter()
+            detections["hough"] = self.detect_center_holes(image, raw=raw, colors=colors)
+            latency_ms["hough"] = (time.perf_counter() - start) * 1000
+
+        counts = {path: len(path_detections) for path, path_detections in detections.items()}
+        path = route["route"]
+        if path == "both":
+            path = "yolo" if counts["yolo"] > YOLO_MIN_DETECTIONS else "hough"
+        print(f"✓ Using {path} detections: {counts[path]} objects")
+        self.router.record(route, path, counts, latency_ms)
+        set_path(path)
+        return detections[path]
+
+    def _route(self, image: np.ndarray, image_path: ImageSource) -> Dict:
+        """Router decision for a decoded image (see routing.PipelineRouter.choose())."""
+        with stage("route"):
+            decision = self.router.choose(thumbnail_features(image),
+                                          image=image_path if isinstance(image_path, str) else None)
+        print(f"🧭 Route {decision['route']}: {decision['reason']}")
+        return decision
+
+    def _detect_with_yolo(self, image_path: ImageSource, raw: Optional[Dict] = None,
+                          boxes: Optional[List[Dict]] = None, colors: bool = True) -> List[Dict]:
         """Original YOLO-based detection with region filtering."""
-        results = self.model.predict(
-            source=image_path,
-            conf=self.confidence_threshold,
-            verbose=False
-        )
-
-        image = cv2.imread(image_path)
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        # When capturing raw outputs, predict at the capture threshold and cut afterwards
+        # (same result, see sweep_thresholds()) so lower thresholds can be rescored later
+        confidence = self._predict_confidence(keep_raw=raw is not None)
+        if boxes is None:
+            boxes = self._predict_yolo_boxes(image_path, confidence)
+
+        with stage("decode"):
+            image = read_image(image_path)
+            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if colors else None
         
         # Detect cage boundary
         cage_bbox = self._detect_cage_boundary(image)
 
-        detections = []
-        detection_number = 1  # Counter for numbering
-
+        if raw is not None:
+            raw["boxes"] = boxes
+            raw["capture_confidence"] = confidence
+            raw["cage_bbox"] = cage_bbox
+
+        return self._label_yolo_boxes(boxes, image_rgb, cage_bbox, self.confidence_threshold)
+
+    def _predict_confidence(self, keep_raw: bool) -> float:
+        """YOLO confidence to predict at: lower when raw outputs are captured for rescoring."""
+        if keep_raw:
+            return min(self.confidence_threshold, RAW_CAPTURE_CONFIDENCE)
+        return self.confidence_threshold
+
+    def _predict_yolo_boxes(self, image_path: ImageSource, confidence: float) -> List[Dict]:
+        """Run YOLO once and return its scored boxes (after the model's NMS) before any filtering."""
+        return self._predict_yolo_boxes_batch([image_path], confidence)[0]
+
+    def _predict_yolo_boxes_batch(self, image_paths: List[ImageSource], confidence: float) -> List[List[Dict]]:
+        """Scored YOLO boxes for several images from one batched forward pass."""
+        with stage("yolo"):
+            results = self.model.predict(
+                source=image_paths[0] if len(image_paths) == 1 else list(image_paths),
+                conf=confidence,
+                verbose=False
+            )
+
+        batch = []
         for result in results:
-            boxes = result.boxes
-            print(f"🔍 YOLO detected {len(boxes)} objects")
-
-            for box in boxes:
+            print(f"🔍 YOLO detected {len(result.boxes)} objects")
+            boxes = []
+            for box in result.boxes:
                 x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                confidence = float(box.conf[0].cpu().numpy())
-                
-                # Get box center
-                center_x = (x1 + x2) / 2
-                center_y = (y1 + y2) / 2
-                
-                # Filter out objects outside the cage
-                if cage_bbox and not self._is_inside_cage((center_x, center_y), cage_bbox):
-                    continue
-
                 class_id = int(box.cls[0].cpu().numpy())
-                class_name = result.names[class_id] if hasattr(result, 'names') else "unknown"
+                boxes.append({
+                    "bbox": [float(x1), float(y1), float(x2), float(y2)],
+                    "confidence": float(box.conf[0].cpu().numpy()),
+                    "class": result.names[class_id] if hasattr(result, 'names') else "unknown"
+                })
+            batch.append(boxes)
+        return batch
+
+    def _label_yolo_boxes(self, boxes: List[Dict], image_rgb: Optional[np.ndarray],
+                          cage_bbox: Optional[Tuple[int, int, int, int]], threshold: float,
+                          color_cache: Optional[Dict[int, str]] = None) -> List[Dict]:
+        """
+        Keep boxes at or above threshold whose center is inside the cage, and color-label them.
+
+        color_cache (box index -> color) lets several thresholds share one
+        color classification per box. Without image_rgb the boxes get color None.
+        """
+        detections = []
+        for index, box in enumerate(boxes):
+            if box["confidence"] < threshold:
+                continue
 
-                crop = image_rgb[int(y1):int(y2), int(x1):int(x2)]
-                color_label = self._get_dominant_color(crop)
+            # Filter out objects outside the cage
+            x1, y1, x2, y2 = box["bbox"]
+            center_x = (x1 + x2) / 2
+            center_y = (y1 + y2) / 2
+            if cage_bbox and not self._is_inside_cage((center_x, center_y), cage_bbox):
+                continue
 
-                detection = {
-                    "id": detection_number,  # Add unique number
-                    "bbox": [float(x1), float(y1), float(x2), float(y2)],
-                    "confidence": confidence,
-                    "color": color_label,
-                    "class": class_name
-                }
-                detections.append(detection)
-                detection_number += 1
+            if image_rgb is None:
+                color_label = None
+            elif color_cache is not None and index in color_cache:
+                color_label = color_cache[index]
+            else:
+                with stage("color"):
+                    crop = image_rgb[int(y1):int(y2), int(x1):int(x2)]
+                    color_label = self._get_dominant_color(crop)
+                if color_cache is not None:
+                    color_cache[index] = color_label
+
+            detections.append({
+                "id": len(detections) + 1,  # Add unique number
+                "bbox": list(box["bbox"]),
+                "confidence": box["confidence"],
+                "color": color_label,
+                "class": box["class"]
+            })
 
         return detections
 
+    def sweep_thresholds(self, image_path: ImageSource, thresholds: List[float], mode: str = "hybrid") -> Dict:
+        """
+        Detection results for several confidence thresholds from a single YOLO pass.
+
+        YOLO runs once at the lowest threshold. Greedy NMS only lets a box be
+        suppressed by a higher-scoring one, so cutting the low-threshold output
+        at a higher threshold gives the same boxes a separate pass would. Each
+        box is color-labeled at most once, and center-hole detection runs at
+        most once. In hybrid mode the router picks the paths once per image
+        (its features don't depend on the threshold); when both run, the
+        count rule of detect_rolls() picks each threshold's answer.
+
+        Args:
+            image_path: Path to the input image, or the decoded BGR image
+            thresholds: Confidence thresholds to evaluate
+            mode: Detection mode, see detect_rolls()
+
+        Returns:
+            {"results": {threshold: process_image()-style result plus "path"},
+             "curve": [{"threshold", "yolo_count" (None if YOLO didn't run), "count", "path"}, ...]}
+        """
+        if mode not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection mode: {mode}")
+        thresholds = sorted(set(float(t) for t in thresholds))
+        if not thresholds or thresholds[0] <= 0 or thresholds[-1] > 1:
+            raise ValueError("Thresholds must be a non-empty list of values in (0, 1]")
+
+        with collect_timings() as timings:
+            with stage("decode"):
+                image = read_image(image_path)
+            route = mode
+            if mode == "hybrid":
+                # Not recorded: a sweep's counts at other thresholds say nothing about the router's
+                route = self._route(image, image_path)["route"]
+
+            if route != "hough":
+                boxes = self._predict_yolo_boxes(image_path, thresholds[0])
+                with stage("decode"):
+                    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                cage_bbox = self._detect_cage_boundary(image)
+                color_cache = {}
+
+            hole_detections = None
+            results, curve = {}, []
+            for threshold in thresholds:
+                yolo_detections = None
+                if route != "hough":
+                    yolo_detections = self._label_yolo_boxes(boxes, image_rgb, cage_bbox, threshold, color_cache)
+
+                path = route
+                if path == "both":
+                    path = "yolo" if len(yolo_detections) > YOLO_MIN_DETECTIONS else "hough"
+                if path == "yolo":
+                    detections = yolo_detections
+                else:
+                    if hole_detections is None:
+                        hole_detections = self.detect_center_holes(image)
+                    detections = hole_detections
+
+                results[threshold] = dict(summarize_detections(detections), path=path)
+                curve.append({
+                    "threshold": threshold,
+                    "yolo_count": len(yolo_detections) if yolo_detections is not None else None,
+                    "count": len(detections),
+                    "path": path
+                })
+            set_path("sweep")
+
+        return {"results": results, "curve": curve, "timings": timings.as_dict()}
+
+    def count_curve(self, image_path: ImageSource, thresholds: Optional[List[float]] = None) -> List[Dict]:
+        """
+        In-cage YOLO count for each confidence threshold from one pass, without color labeling.
+
+        Args:
+            image_path: Path to the input image, or the decoded BGR image
+            thresholds: Thresholds to report; defaults to 0.05 to 0.95 in steps of 0.05
+
+        Returns:
+            List of {"threshold", "count"} in ascending threshold order
+        """
+        if thresholds is None:
+            thresholds = [round(0.05 * i, 2) for i in range(1, 20)]
+        thresholds = sorted(set(float(t) for t in thresholds))
+        if not thresholds or thresholds[0] <= 0 or thresholds[-1] > 1:
+            raise ValueError("Thresholds must be a non-empty list of values in (0, 1]")
+
+        boxes = self._predict_yolo_boxes(image_path, thresholds[0])
+        with stage("decode"):
+            image = read_image(image_path)
+        cage_bbox = self._detect_cage_boundary(image)
+
+        confidences = []
+        for box in boxes:
+            x1, y1, x2, y2 = box["bbox"]
+            if cage_bbox and not self._is_inside_cage(((x1 + x2) / 2, (y1 + y2) / 2), cage_bbox):
+                continue
+            confidences.append(box["confidence"])
+
+        return [{"threshold": t, "count": sum(1 for c in confidences if c >= t)} for t in thresholds]
+
     def _detect_cage_boundary(self, image: np.ndarray) -> Tuple[int, int, int, int]:
         """
         Detect the square cage boundary to filter out objects outside it.
@@ -200,48 +738,12 @@ class ThreadRollDetectorV2:
         Returns:
             (x1, y1, x2, y2) bounding box of the cage, or None
         """
-        try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            edges = cv2.Canny(gray, 50, 150)
-            
-            # Find contours
-            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            if not contours:
-                return None
-            
-            # Find the largest rectangular contour (likely the cage)
-            largest_area = 0
-            cage_bbox = None
-            
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                if area > largest_area and area > 100000:  # Minimum area threshold
-                    x, y, w, h = cv2.boundingRect(contour)
-                    # Check if it's roughly square-ish (aspect ratio between 0.7 and 1.5)
-                    aspect_ratio = w / h if h > 0 else 0
-                    if 0.7 < aspect_ratio < 1.5:
-                        largest_area = area
-                        cage_bbox = (x, y, x + w, y + h)
-            
-            if cage_bbox:
-                print(f"✓ Detected cage boundary: {cage_bbox}")
-            
-            return cage_bbox
-            
-        except Exception as e:
-            print(f"⚠️  Could not detect cage boundary: {e}")
-            return None
+        with stage("cage"):
+            return find_cage_boundary(image)
 
     def _is_inside_cage(self, point: Tuple[float, float], cage_bbox: Tuple[int, int, int, int]) -> bool:
         """Check if a point is inside the cage boundary."""
-        if cage_bbox is None:
-            return True  # If no cage detected, include everything
-        
-        x, y = point
-        x1, y1, x2, y2 = cage_bbox
-        
-        return x1 <= x <= x2 and y1 <= y <= y2
+        return is_inside_cage(point, cage_bbox)
 
     def _get_roll_color(self, image: np.ndarray, cx: int, cy: int, center_radius: int) -> str:
         """
@@ -255,40 +757,10 @@ class ThreadRollDetectorV2:
         Returns:
             Color label string
         """
-        # Define annular region: outer roll surface, excluding center hole
-        inner_radius = center_radius + 5  # Start sampling after the center hole
-        outer_radius = int(center_radius * 6)  # Sample the colored surface
-        
-        height, width = image.shape[:2]
-        
-        # Create mask for annular sampling
-        y_coords, x_coords = np.ogrid[:height, :width]
-        dist_from_center = np.sqrt((x_coords - cx)**2 + (y_coords - cy)**2)
-        
-        # Boolean mask for the annular region
-        annular_mask = (dist_from_center >= inner_radius) & (dist_from_center <= outer_radius)
-        
-        # Extract pixels from the annular region
-        annular_pixels = image[annular_mask]
-        
-        if len(annular_pixels) == 0:
+        hsv = roll_hsv(image, cx, cy, center_radius)
+        if hsv is None:
             return "other"
-        
-        # Sample max 500 pixels for speed
-        if len(annular_pixels) > 500:
-            indices = np.random.choice(len(annular_pixels), 500, replace=False)
-            annular_pixels = annular_pixels[indices]
-        
-        # Apply KMeans to find dominant color
-        kmeans = KMeans(n_clusters=1, random_state=42, n_init=10)
-        kmeans.fit(annular_pixels)
-        dominant_color_rgb = kmeans.cluster_centers_[0]
-        
-        # Convert RGB to HSV
-        dominant_color_bgr = np.uint8([[dominant_color_rgb[::-1]]])
-        dominant_color_hsv = cv2.cvtColor(dominant_color_bgr, cv2.COLOR_BGR2HSV)[0][0]
-        
-        return self._map_hsv_to_label(dominant_color_hsv)
+        return self._map_hsv_to_label(hsv)
 
     def _get_dominant_color(self, crop: np.ndarray) -> str:
         """Extract dominant color from a cropped image region."""
@@ -315,87 +787,152 @@ class ThreadRollDetectorV2:
         return color_label
 
     def _map_hsv_to_label(self, hsv: np.ndarray) -> str:
-        """Map HSV values to predefined color labels - optimized for yellow thread rolls."""
-        h, s, v = hsv
-
-        # PRIORITY 1: Yellow detection (CHECK FIRST for bright rolls)
-        # Yellow thread rolls: H=17-35 (includes bright yellow that looks orange-ish)
-        # Key insight: Bright rolls (V>=105) in H=17-25 are YELLOW, not orange/brown
-        # Analysis shows: Yellow rolls have H=17-25, V=75-157 (bright!)
-        
-        # Bright yellow in H=17-25 range (catches yellow that looks orange-ish)
-        if 17 <= h <= 25 and s >= 10 and v >= 105:
-            return "yellow"
-        
-        # Standard yellow range H=26-35
-        if 26 <= h <= 35 and s >= 10 and v >= 25:
-            return "yellow"
-        
-        # Also catch camera-affected bright yellow (high H due to white balance)
-        if 170 <= h <= 180 and v >= 170 and s >= 70:
-            return "yellow"
-        
-        # PRIORITY 2: Orange/Brown detection (darker rolls, checked after yellow)
-        # Orange/brown thread rolls: H=8-25, but DARKER than yellow (V<105)
-        # Analysis shows: Orange/brown has H=8-25, V=60-105 (darker than bright yellow)
-        if 8 <= h <= 25 and s >= 45 and 60 <= v < 105:
-            return "orange_brown"
-        
-        # PRIORITY 3: White (low saturation, high brightness)
-        if s <= 50 and v >= 180:
-            return "white"
-        
-        # PRIORITY 4: Pink detection (true pink, not yellow)
-        # Exclude bright colors that could be yellow
-        if s >= 60 and v >= 85 and v < 170:
-            # Pink/red wraparound range (but not catching yellow)
-            if (165 <= h <= 180) or (0 <= h <= 7):
-                return "pink"
-            # Main pink/magenta range
-            if 140 <= h < 165 and v >= 115:
-                return "pink"
-        
-        # Lower saturation pink (darker pink shades)
-        if s >= 45 and v >= 110 and v < 170:
-            if 140 <= h <= 180:
-                return "pink"
-
-        # Check remaining colors from COLOR_RANGES
-        for color_name, (lower, upper) in COLOR_RANGES.items():
-            if color_name in ["pink", "yellow", "white", "orange_brown"]:  # Already handled
-                continue
-                
-            lower = np.array(lower)
-            upper = np.array(upper)
-
-            if (lower[0] <= h <= upper[0] and
-                lower[1] <= s <= upper[1] and
-                lower[2] <= v <= upper[2]):
-                return color_name
+        """Map HSV values to predefined color labels using this detector's color rules."""
+        return map_hsv_to_label(hsv, self.color_rules)
 
-        return "other"
-
-    def process_image(self, image_path: str) -> Dict:
+    def process_image(self, image_path: ImageSource, mode: str = "hybrid", keep_raw: bool = False,
+                      colors: bool = True) -> Dict:
         """
         Process an image and return detection results with color counts.
         
         Args:
-            image_path: Path to the input image
+            image_path: Path to the input image, or the decoded BGR image
+            mode: Detection mode, see detect_rolls()
+            keep_raw: Also return the raw model outputs under "raw" (see rescore())
+            colors: Classify colors; without it color_counts is empty (for count-only callers)
             
         Returns:
-            Dictionary with total_count, color_counts, and detections
+            Dictionary with total_count, color_counts, detections and per-stage timings (ms)
+        """
+        raw = {} if keep_raw else None
+        with collect_timings() as timings:
+            with timings.stage("detect"):
+                detections = self.detect_rolls(image_path, mode=mode, raw=raw, colors=colors)
+
+        result = dict(summarize_detections(detections), timings=timings.as_dict())
+        if keep_raw:
+            result["raw"] = raw
+        return result
+
+    def process_batch(self, image_paths: List[ImageSource], mode: str = "hybrid",
+                      keep_raw: bool = False, colors: bool = True) -> List[Dict]:
         """
-        detections = self.detect_rolls(image_path)
+        process_image() for several images with one batched YOLO forward pass.
 
-        # Count colors
-        color_counts = {}
-        for detection in detections:
-            color = detection["color"]
-            color_counts[color] = color_counts.get(color, 0) + 1
+        In hybrid mode every image is decoded and routed first, and only the
+        images routed to YOLO go into the batch. Cage detection, color
+        labeling and center-hole detection still run per image. The shared
+        YOLO time is not part of the per-image timings.
+
+        Returns:
+            One process_image()-style result per image, in input order
+        """
+        if mode not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection mode: {mode}")
+
+        images = list(image_paths)
+        routes = [None] * len(images)
+        routing_seconds = [{} for _ in images]  # Per-image stage times measured before its timings start
+        if mode == "hybrid":
+            for index, image_path in enumerate(image_paths):
+                start = time.perf_counter()
+                images[index] = read_image(image_path)
+                decoded = time.perf_counter()
+                routes[index] = self._route(images[index], image_path)
+                routing_seconds[index] = {"decode": decoded - start, "route": time.perf_counter() - decoded}
+
+        yolo_indexes = [index for index, route in enumerate(routes)
+                        if mode == "yolo" or (mode == "hybrid" and route["route"] != "hough")]
+        batch_boxes = [None] * len(images)
+        yolo_ms = 0.0
+        if yolo_indexes:
+            start = time.perf_counter()
+            predicted = self._predict_yolo_boxes_batch([images[index] for index in yolo_indexes],
+                                                       self._predict_confidence(keep_raw))
+            yolo_ms = (time.perf_counter() - start) * 1000 / len(yolo_indexes)
+            for index, boxes in zip(yolo_indexes, predicted):
+                batch_boxes[index] = boxes
+
+        results = []
+        for image, boxes, route, seconds in zip(images, batch_boxes, routes, routing_seconds):
+            raw = {} if keep_raw else None
+            with collect_timings() as timings:
+                for name, duration in seconds.items():
+                    add_stage(name, duration)
+                with timings.stage("detect"):
+                    detections = self.detect_rolls(image, mode=mode, raw=raw, yolo_boxes=boxes, colors=colors,
+                                                   route=route, yolo_ms=yolo_ms if boxes is not None else 0.0)
+            result = dict(summarize_detections(detections), timings=timings.as_dict())
+            if keep_raw:
+                result["raw"] = raw
+            results.append(result)
+        return results
+
+    def rescore(self, image_path: ImageSource, raw: Dict, confidence_threshold: Optional[float] = None,
+                mode: str = "hybrid") -> Dict:
+        """
+        Re-apply threshold, cage filter and color classification to stored raw outputs.
 
-        return {
-            "total_count": len(detections),
-            "color_counts": color_counts,
-            "detections": detections
-        }
+        No YOLO inference is run. The image is only decoded for color
+        classification. Hybrid mode is routed like detect_rolls(); images
+        that were routed to center holes only (no stored YOLO outputs) stay
+        on center holes. If hybrid/hough mode needs center holes that were
+        never computed for this image, Hough runs once and the circles are
+        added to raw, so callers should persist raw again when it changed.
 
+        Args:
+            image_path: Path to the original image
+            raw: Raw outputs from process_image(..., keep_raw=True)
+            confidence_threshold: YOLO threshold; defaults to the detector's own
+            mode: Detection mode, see detect_rolls()
+
+        Returns:
+            process_image()-style result plus the detector "path" taken
+        """
+        if mode not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection mode: {mode}")
+        threshold = self.confidence_threshold if confidence_threshold is None else confidence_threshold
+        boxes = raw.get("boxes")
+        if mode == "yolo" and boxes is None:
+            raise ValueError("No stored YOLO outputs for this image; only mode='hough' or 'hybrid' can be rescored")
+        if mode != "hough" and boxes is not None and threshold < raw["capture_confidence"]:
+            raise ValueError(f"Threshold {threshold} is below the capture threshold {raw['capture_confidence']}")
+
+        with collect_timings() as timings:
+            with stage("decode"):
+                image = read_image(image_path)
+                image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+            if "cage_bbox" not in raw:
+                raw["cage_bbox"] = self._detect_cage_boundary(image)
+            cage_bbox = raw["cage_bbox"]
+
+            decision = None
+            route = mode
+            if mode == "hybrid":
+                decision = self._route(image, image_path)
+                if boxes is None and decision["route"] != "hough":
+                    decision = dict(decision, route="hough", reason="no stored YOLO outputs (routed to center holes)")
+                route = decision["route"]
+
+            detections = {}
+            if route in ("yolo", "both"):
+                detections["yolo"] = self._label_yolo_boxes(boxes, image_rgb, cage_bbox, threshold)
+            if route in ("hough", "both"):
+                if raw.get("circles") is None:
+                    with stage("hough"):
+                        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                        raw["circles"] = find_center_circles(gray, self.hough_params)
+                detections["hough"] = self._label_center_holes(raw["circles"], image_rgb, cage_bbox)
+
+            path = route
+            if path == "both":
+                path = "yolo" if len(detections["yolo"]) > YOLO_MIN_DETECTIONS else "hough"
+            if decision is not None:
+                # Rescoring skips YOLO inference, so its timings say nothing about path latency
+                counts = {name: len(path_detections) for name, path_detections in detections.items()}
+                self.router.record(decision, path, counts, {}, source="rescore")
+            detections = detections[path]
+            set_path(path)
+
+        return dict(summarize_detections(detections), path=path, timings=timings.as_dict())
@@ -0,0 +1,211 @@
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import csv
+import io
+import json
+
+from database import Record, engine
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+EXPORT_CHUNK_SIZE = 1000         # Rows fetched from the cursor per round trip
+
+RECORD_COLUMNS = ["record_id", "created_at", "user", "description", "image_filename", "total_count"]
+DETECTION_COLUMNS = ["detection_id", "x1", "y1", "x2", "y2", "confidence", "detection_color"]
+
+
+def parquet_available() -> bool:
+    """Parquet export needs the optional pyarrow package."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@contextmanager
+def export_snapshot() -> Iterator[Connection]:
+    """
+    Connection holding one read transaction for a whole export.
+
+    The color columns and the rows are read in the same snapshot, so a record
+    written mid-export with a new color can't end up in a row without its column.
+    """
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN")  # pysqlite only opens transactions for writes
+        yield conn
+
+
+def export_colors(conn: Connection) -> List[str]:
+    """All colors present in any record, read from the normalized record_colors index."""
+    rows = conn.exec_driver_sql("SELECT DISTINCT color FROM record_colors ORDER BY color")
+    return [color for (color,) in rows]
+
+
+def export_columns(colors: List[str], include_detections: bool) -> List[str]:
+    columns = RECORD_COLUMNS + [f"color_{color}" for color in colors]
+    if include_detections:
+        columns += DETECTION_COLUMNS
+    return columns
+
+
+def _iter_rows(conn: Connection, colors: List[str], include_detections: bool, start: Optional[datetime],
+               end: Optional[datetime]) -> Iterator[List[Dict]]:
+    """
+    Yield chunks of flattened export rows from a server-side cursor.
+
+    Each record becomes one row with a color_<name> column per color. With
+    detections included, each detection becomes its own row carrying the
+    record columns.
+    """
+    columns = [Record.id, Record.created_at, Record.user, Record.description,
+               Record.image_filename, Record.total_count, Record.color_counts]
+    if include_detections:
+        columns.append(Record.raw_detection)
+
+    query = select(*columns).order_by(Record.id)
+    if start is not None:
+        query = query.where(Record.created_at >= start)
+    if end is not None:
+        query = query.where(Record.created_at < end)
+
+    result = conn.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE).execute(query)
+    for partition in result.partitions():
+        chunk = []
+        for row in partition:
+            base = {
+                "record_id": row.id,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "user": row.user,
+                "description": row.description,
+                "image_filename": row.image_filename,
+                "total_count": row.total_count,
+            }
+            color_counts = row.color_counts or {}
+            for color in colors:
+                base[f"color_{color}"] = color_counts.get(color, 0)
+
+            if not include_detections:
+                chunk.append(base)
+                continue
+
+            detections = row.raw_detection or []
+            if not detections:
+                chunk.append(dict(base, **{column: None for column in DETECTION_COLUMNS}))
+            for detection in detections:
+                x1, y1, x2, y2 = detection.get("bbox", [None] * 4)
+                chunk.append(dict(
+                    base,
+                    detection_id=detection.get("id"),
+                    x1=x1, y1=y1, x2=x2, y2=y2,
+                    confidence=detection.get("confidence"),
+                    detection_color=detection.get("color"),
+                ))
+        yield chunk
+
+
+def stream_csv(include_detections: bool = False, start: Optional[datetime] = None,
+               end: Optional[datetime] = None) -> Iterator[bytes]:
+    with export_snapshot() as conn:
+        colors = export_colors(conn)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=export_columns(colors, include_detections))
+        writer.writeheader()
+        for chunk in _iter_rows(conn, colors, include_detections, start, end):
+            writer.writerows(chunk)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+
+def stream_jsonl(include_detections: bool = False, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None) -> Iterator[bytes]:
+    with export_snapshot() as conn:
+        colors = export_colors(conn)
+        for chunk in _iter_rows(conn, colors, include_detections, start, end):
+            yield "".join(json.dumps(row) + "\n" for row in chunk).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to a generator instead of keeping them."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_parquet(include_detections: bool = False, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None) -> Iterator[bytes]:
+    """Write one Parquet row group per chunk and stream each as soon as it is encoded."""
+    with export_snapshot() as conn:
+        yield from _stream_parquet(conn, export_colors(conn), include_detections, start, end)
+
+
+def _stream_parquet(conn: Connection, colors: List[str], include_detections: bool, start: Optional[datetime],
+                    end: Optional[datetime]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = [
+        pa.field("record_id", pa.int64()),
+        pa.field("created_at", pa.string()),
+        pa.field("user", pa.string()),
+        pa.field("description", pa.string()),
+        pa.field("image_filename", pa.string()),
+        pa.field("total_count", pa.int64()),
+    ]
+    fields += [pa.field(f"color_{color}", pa.int64()) for color in colors]
+    if include_detections:
+        fields += [
+            pa.field("detection_id", pa.int64()),
+            pa.field("x1", pa.float64()),
+            pa.field("y1", pa.float64()),
+            pa.field("x2", pa.float64()),
+            pa.field("y2", pa.float64()),
+            pa.field("confidence", pa.float64()),
+            pa.field("detection_color", pa.string()),
+        ]
+    schema = pa.schema(fields)
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        for chunk in _iter_rows(conn, colors, include_detections, start, end):
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+STREAMERS = {
+    "csv": stream_csv,
+    "jsonl": stream_jsonl,
+    "parquet": stream_parquet,
+}
@@ -0,0 +1,420 @@
+"""
+Shared inference server: one process owns the detector for every API worker.
+
+With `uvicorn main:app --workers N` each worker would otherwise load its
+own copy of the YOLO model. Instead, run this server once and point the
+API workers at it:
+
+    cd backend/app && python inference_server.py
+    THREAD_ROLL_INFERENCE_SERVER=run/inference.sock uvicorn main:app --workers 4
+
+API workers decode uploads themselves and hand the frame over through a
+shared memory segment; only a small request header travels over the Unix
+socket. Results come back as compact arrays (see pack_result()). Requests
+from all workers share one InferenceScheduler, so the priority lanes hold
+across workers.
+
+The socket lives in a directory only the server's user can open (mode
+0700). Connections are authenticated with THREAD_ROLL_INFERENCE_AUTHKEY,
+or else with a random key the server writes next to the socket at each
+start (<socket>.key, mode 0600), which the API workers read.
+
+Rescoring stored raw outputs (see rescore.py) goes to the server too, so API
+workers never load the model.
+"""
+
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError, resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+from typing import Dict, Optional
+import argparse
+import contextlib
+import contextvars
+import io
+import itertools
+import os
+import queue
+import secrets
+import threading
+
+import cv2
+import numpy as np
+from prometheus_client import start_http_server
+
+from metrics import merge_timings, stage
+from raw_outputs import pack_raw_outputs, unpack_raw_outputs
+from routing import DEFAULT_ROUTE_LOG
+from scheduler import LANE_SLOS, InferenceScheduler
+from worker_pool import load_detector
+
+DEFAULT_ADDRESS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run", "inference.sock")
+AUTHKEY_BYTES = 32
+INFO_REQUEST = "info"        # Message asking for server_info() instead of a detection
+RESCORE_REQUEST = "rescore"  # Message asking for detector.rescore() of stored raw outputs
+
+
+def ensure_private_dir(path: str):
+    """Create the socket's directory with mode 0700; refuse one owned by another user."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f"{path} is owned by another user; use a private directory for the socket")
+    os.chmod(path, 0o700)
+
+
+def authkey_path(address: str) -> str:
+    return f"{address}.key"
+
+
+def create_authkey(address: str) -> bytes:
+    """THREAD_ROLL_INFERENCE_AUTHKEY, or a new random key written to <address>.key for the API workers."""
+    configured = os.environ.get("THREAD_ROLL_INFERENCE_AUTHKEY")
+    if configured:
+        return configured.encode()
+    key = secrets.token_bytes(AUTHKEY_BYTES)
+    tmp_path = f"{authkey_path(address)}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    os.replace(tmp_path, authkey_path(address))
+    return key
+
+
+def load_authkey(address: str) -> bytes:
+    """Key the server at this address accepts (raises OSError while no server has written one)."""
+    configured = os.environ.get("THREAD_ROLL_INFERENCE_AUTHKEY")
+    if configured:
+        return configured.encode()
+    with open(authkey_path(address), "rb") as f:
+        return f.read()
+
+
+def pack_result(result: Dict) -> Dict:
+    """
+    process_image() result with detections as parallel arrays.
+
+    Colors and classes become indices into small name tables, so a few
+    hundred detections pickle to a few kilobytes instead of a list of dicts.
+    """
+    detections = result["detections"]
+    colors = sorted({d["color"] for d in detections}, key=str)   # Count-only results have color None
+    classes = sorted({d["class"] for d in detections}, key=str)
+    packed = {
+        "total_count": result["total_count"],
+        "color_counts": result["color_counts"],
+        "timings": result.get("timings"),
+        "bboxes": np.array([d["bbox"] for d in detections], dtype=np.float64).reshape(-1, 4),
+        "confidences": np.array([d["confidence"] for d in detections], dtype=np.float64),
+        "color_names": colors,
+        "colors": np.array([colors.index(d["color"]) for d in detections], dtype=np.uint8),
+        "class_names": classes,
+        "classes": np.array([classes.index(d["class"]) for d in detections], dtype=np.uint8),
+    }
+    # Center-hole detections carry their center; YOLO ones don't
+    if detections and all("center" in d for d in detections):
+        packed["centers"] = np.array([d["center"] for d in detections], dtype=np.int32)
+    if result.get("raw") is not None:
+        packed["raw"] = pack_raw_outputs(result["raw"])
+    return packed
+
+
+def unpack_result(packed: Dict) -> Dict:
+    """Inverse of pack_result(): the process_image() result format."""
+    detections = []
+    centers = packed.get("centers")
+    for i, (bbox, confidence, color, cls) in enumerate(
+            zip(packed["bboxes"], packed["confidences"], packed["colors"], packed["classes"])):
+        detection = {
+            "id": i + 1,
+            "bbox": [float(v) for v in bbox],
+            "confidence": float(confidence),
+            "color": packed["color_names"][color],
+        }
+        if centers is not None:
+            detection["center"] = (int(centers[i][0]), int(centers[i][1]))
+        detection["class"] = packed["class_names"][cls]
+        detections.append(detection)
+
+    result = {
+        "total_count": packed["total_count"],
+        "color_counts": packed["color_counts"],
+        "detections": detections,
+        "timings": packed["timings"],
+    }
+    if "raw" in packed:
+        result["raw"] = unpack_raw_outputs(packed["raw"])
+    return result
+
+
+def _read_frame(name: str, shape, dtype: str) -> np.ndarray:
+    """Copy a frame out of a client's shared memory segment (the client unlinks it)."""
+    segment = shared_memory.SharedMemory(name=name)
+    # Attaching registers the segment with this process's resource tracker, which
+    # would unlink it (or warn) at exit; the client owns it
+    resource_tracker.unregister(segment._name, "shared_memory")
+    try:
+        return np.ndarray(shape, dtype=dtype, buffer=segment.buf).copy()
+    finally:
+        segment.close()
+
+
+class InferenceServer:
+    """Serves detection requests from API workers over a Unix socket."""
+
+    def __init__(self, detector, address: str = DEFAULT_ADDRESS, slos: Dict[str, float] = LANE_SLOS):
+        self.address = address
+        self.detector = detector
+        self.scheduler = InferenceScheduler(lambda: detector, slos=slos)
+
+    def serve_forever(self):
+        ensure_private_dir(os.path.dirname(os.path.abspath(self.address)))
+        if os.path.exists(self.address):
+            os.remove(self.address)   # Stale socket from a previous run
+        authkey = create_authkey(self.address)
+        with Listener(self.address, family="AF_UNIX", authkey=authkey) as listener:
+            while True:
+                try:
+                    connection = listener.accept()
+                except (AuthenticationError, EOFError, OSError) as e:
+                    print(f"⚠️  Rejected inference client: {type(e).__name__}: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def info(self) -> Dict:
+        """What API workers need to know about the detector (the input size the weights were trained at)."""
+        return {"input_size": getattr(self.detector, "input_size", None)}
+
+    def rescore(self, image_path: str, packed_raw: Dict, confidence_threshold: Optional[float], mode: str):
+        """
+        detector.rescore() for a client: (True, result, packed raw) or (False, exception).
+
+        The raw outputs go back because rescoring may add center holes / the
+        cage box to them, which the client saves for the next rescore.
+        """
+        raw = unpack_raw_outputs(packed_raw)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = self.detector.rescore(image_path, raw, confidence_threshold=confidence_threshold, mode=mode)
+        except (ValueError, OSError) as e:
+            return False, e
+        except Exception as e:
+            return False, RuntimeError(f"{type(e).__name__}: {e}")
+        return True, result, pack_raw_outputs(raw)
+
+    def _serve_connection(self, connection):
+        send_lock = threading.Lock()
+
+        def reply(request_id: int, future: Future):
+            try:
+                message = (request_id, True, pack_result(future.result()))
+            except Exception as e:
+                message = (request_id, False, f"{type(e).__name__}: {e}")
+            with send_lock:
+                with contextlib.suppress(OSError):
+                    connection.send(message)
+
+        with connection:
+            while True:
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    return   # API worker went away
+                if message[0] == INFO_REQUEST:
+                    with send_lock:
+                        connection.send(self.info())
+                    continue
+                if message[0] == RESCORE_REQUEST:
+                    reply_message = self.rescore(*message[1:])
+                    with send_lock:
+                        connection.send(reply_message)
+                    continue
+                request_id, lane, mode, keep_raw, colors, frame = message
+                try:
+                    image = _read_frame(*frame)
+                    future = self.scheduler.submit(image, lane=lane, mode=mode, keep_raw=keep_raw, colors=colors)
+                except Exception as e:
+                    future = Future()
+                    future.set_exception(e)
+                future.add_done_callback(lambda f, request_id=request_id: reply(request_id, f))
+
+
+class InferenceClient:
+    """
+    InferenceScheduler stand-in for API workers that uses a shared InferenceServer.
+
+    submit() has the same signature and result. Uploads are decoded and
+    written to shared memory on a sender thread; the server's stage timings
+    are merged into the caller's collect_timings().
+    """
+
+    def __init__(self, address: str = DEFAULT_ADDRESS):
+        self.address = address
+        self._ids = itertools.count()
+        self._pending: Dict[int, tuple] = {}
+        self._outbox: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._connection = None
+        self._lock = threading.Lock()
+        self._sender = None
+
+    def start(self):
+        """Start the sender thread (idempotent)."""
+        with self._lock:
+            if self._sender is None or not self._sender.is_alive():
+                self._sender = threading.Thread(target=self._send_loop, name="inference-client", daemon=True)
+                self._sender.start()
+
+    def stop(self):
+        """Send queued requests and stop; requests still waiting for the server fail."""
+        with self._lock:
+            sender = self._sender
+            self._sender = None
+        if sender is not None and sender.is_alive():
+            self._outbox.put(None)
+            sender.join()
+        self._disconnect(ConnectionError("Inference client stopped"))
+
+    def submit(self, image_path: str, lane: str = "interactive", mode: str = "hybrid",
+               keep_raw: bool = False, colors: bool = True) -> Future:
+        """Queue an image for detection on the server; see InferenceScheduler.submit()."""
+        self.start()
+        future = Future()
+        self._outbox.put((image_path, lane, mode, keep_raw, colors, contextvars.copy_context(), future))
+        return future
+
+    def server_info(self) -> Dict:
+        """InferenceServer.info(), over a short-lived connection of its own."""
+        with Client(self.address, family="AF_UNIX", authkey=load_authkey(self.address)) as connection:
+            connection.send((INFO_REQUEST,))
+            return connection.recv()
+
+    def rescore(self, image_path: str, raw: Dict, confidence_threshold: Optional[float] = None,
+                mode: str = "hybrid") -> Dict:
+        """
+        ThreadRollDetectorV2.rescore() on the server, over a short-lived connection of its own.
+
+        Like the detector, updates raw in place with center holes / cage box computed on demand.
+        """
+        with Client(self.address, family="AF_UNIX", authkey=load_authkey(self.address)) as connection:
+            connection.send((RESCORE_REQUEST, os.path.abspath(image_path), pack_raw_outputs(raw),
+                             confidence_threshold, mode))
+            reply = connection.recv()
+        if not reply[0]:
+            raise reply[1]
+        raw.update(unpack_raw_outputs(reply[2]))
+        return reply[1]
+
+    def _connect(self):
+        """The server connection, opened (with a receiver thread) on first use."""
+        with self._lock:
+            if self._connection is None:
+                # Read on every connect: a restarted server has a new key
+                self._connection = Client(self.address, family="AF_UNIX", authkey=load_authkey(self.address))
+                threading.Thread(target=self._receive_loop, args=(self._connection,),
+                                 name="inference-client-receiver", daemon=True).start()
+            return self._connection
+
+    def _disconnect(self, error: Exception, connection=None):
+        """Drop the connection and fail everything still waiting on it."""
+        with self._lock:
+            if connection is not None and connection is not self._connection:
+                return
+            if self._connection is not None:
+                with contextlib.suppress(OSError):
+                    self._connection.close()
+                self._connection = None
+            pending, self._pending = self._pending, {}
+        for _, _, segment in pending.values():
+            self._release(segment)
+        for future, _, _ in pending.values():
+            future.set_exception(error)
+
+    @staticmethod
+    def _release(segment):
+        segment.close()
+        with contextlib.suppress(FileNotFoundError):
+            segment.unlink()
+
+    def _send_loop(self):
+        while True:
+            item = self._outbox.get()
+            if item is None:
+                return
+            image_path, lane, mode, keep_raw, colors, context, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            context.run(self._send, image_path, lane, mode, keep_raw, colors, context, future)
+
+    def _send(self, image_path, lane: str, mode: str, keep_raw: bool, colors: bool, context, future: Future):
+        with stage("decode"):
+            image = image_path if isinstance(image_path, np.ndarray) else cv2.imread(image_path)
+        if image is None:
+            future.set_exception(ValueError(f"Could not read image: {image_path}"))
+            return
+        with stage("shared_memory"):
+            segment = shared_memory.SharedMemory(create=True, size=image.nbytes)
+            np.ndarray(image.shape, dtype=image.dtype, buffer=segment.buf)[:] = image
+
+        request_id = next(self._ids)
+        try:
+            connection = self._connect()
+            with self._lock:
+                self._pending[request_id] = (future, context, segment)
+            connection.send((request_id, lane, mode, keep_raw, colors,
+                             (segment.name, image.shape, image.dtype.str)))
+        except OSError as e:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            self._release(segment)
+            self._disconnect(ConnectionError(f"Inference server unavailable: {e}"))
+            if not future.done():
+                future.set_exception(ConnectionError(f"Inference server unavailable: {e}"))
+
+    def _receive_loop(self, connection):
+        while True:
+            try:
+                request_id, ok, payload = connection.recv()
+            except (EOFError, OSError) as e:
+                self._disconnect(ConnectionError(f"Inference server connection lost: {e}"), connection)
+                return
+            with self._lock:
+                entry = self._pending.pop(request_id, None)
+            if entry is None:
+                continue
+            future, context, segment = entry
+            self._release(segment)
+            if not ok:
+                future.set_exception(RuntimeError(payload))
+                continue
+            result = unpack_result(payload)
+            context.run(merge_timings, result.get("timings"))
+            future.set_result(result)
+
+
+def main():
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", default=os.environ.get("THREAD_ROLL_INFERENCE_SERVER", DEFAULT_ADDRESS),
+                        help="Unix socket path")
+    parser.add_argument("--model", default=os.path.join(app_dir, "models_weights", "best.pt"), help="YOLO weights")
+    parser.add_argument("--conf", type=float, default=0.5, help="Confidence threshold (the API uses 0.5)")
+    parser.add_argument("--interactive-slo-ms", type=float,
+                        default=float(os.environ.get("THREAD_ROLL_INTERACTIVE_SLO_MS", "2000")),
+                        help="Latency SLO of the interactive lane")
+    parser.add_argument("--metrics-port", type=int, help="Serve this process's Prometheus metrics (lanes, stages)")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Serves the API's detections, so it learns from and adds to the API's route log
+        detector = load_detector(args.model, args.conf, route_log=DEFAULT_ROUTE_LOG or None)
+    print(f"✓ Inference server listening on {args.address}")
+    try:
+        slos = dict(LANE_SLOS, interactive=args.interactive_slo_ms / 1000)
+        InferenceServer(detector, args.address, slos=slos).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+"""
+Ingest daemon for stations that save photos to a shared folder instead of using the web UI.
+
+    cd backend/app && python -m cli ingest /srv/drop/station1 /srv/drop/station2 --user "Dock 1"
+
+New images in the watched folders are picked up once they stop changing
+(writers copy files in over a network share, so a file is only taken once
+its size and mtime have been stable for --settle seconds), copied into the
+uploads directory and counted in batches on a detector process pool. Each
+result becomes a Record exactly like one from POST /predict.
+
+Images are tracked by content hash in ingested_files. A hash is claimed
+before inference, and the Record is committed together with marking the
+hash done, so renamed, re-copied or re-scanned files are never counted
+twice. An image whose claim is abandoned (daemon killed mid-batch) is
+taken again after INGEST_CLAIM_TIMEOUT.
+
+Folders are watched with inotify through watchdog when it is installed,
+and scanned every few seconds otherwise. Either way they are scanned at
+startup, so files dropped while the daemon was down are picked up, and
+rescanned every few minutes for events inotify missed (network shares).
+
+If a detector worker dies, the pool is replaced and the images of the
+lost batches are tried again one at a time, with nothing else in flight;
+an image that crashes a worker on its own is marked failed.
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from sqlalchemy import or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from typing import Deque, Dict, List, Optional, Tuple
+import hashlib
+import os
+import shutil
+import signal
+import threading
+import time
+import uuid
+
+from database import IngestedFile, Record, SessionLocal, init_db
+from raw_outputs import delete_raw_outputs, raw_outputs_path, save_raw_outputs
+from worker_pool import create_detector_pool, default_workers, detect_batch, is_image
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Optional: inotify watching instead of periodic scans
+    FileSystemEventHandler = object
+    Observer = None
+
+INGEST_SETTLE_SECONDS = 2.0        # A file must be unchanged this long before it is taken
+INGEST_BATCH_SIZE = 4              # Images per batched YOLO call
+INGEST_TICK = 0.25                 # Seconds between debounce checks
+INGEST_SCAN_INTERVAL = 5.0         # Seconds between folder scans without watchdog
+INGEST_RESCAN_INTERVAL = 300.0     # Seconds between safety scans with watchdog
+INGEST_CLAIM_TIMEOUT = timedelta(minutes=10)   # Claims older than this were abandoned and are taken again
+INGEST_REPORT_INTERVAL = 30.0      # Seconds between throughput lines
+
+
+def content_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def claim_file(db: Session, content_sha256: str, source_path: str, retry_failed: bool = False) -> Optional[str]:
+    """
+    Claim an image's content hash for processing.
+
+    Returns the claim token, or None if the content was already recorded,
+    is being processed, or failed (unless retry_failed).
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    inserted = db.execute(
+        sqlite_insert(IngestedFile)
+        .values(content_sha256=content_sha256, source_path=source_path, status="processing",
+                claim_token=token, claimed_at=now)
+        .on_conflict_do_nothing()
+    ).rowcount
+    if not inserted:
+        claimable = IngestedFile.status == "processing"
+        if retry_failed:
+            claimable = or_(claimable, IngestedFile.status == "failed")
+        inserted = db.execute(
+            update(IngestedFile)
+            .where(IngestedFile.content_sha256 == content_sha256, claimable,
+                   or_(IngestedFile.status == "failed", IngestedFile.claimed_at <= now - INGEST_CLAIM_TIMEOUT))
+            .values(status="processing", source_path=source_path, claim_token=token, claimed_at=now, error=None)
+        ).rowcount
+    db.commit()
+    return token if inserted else None
+
+
+def release_claim(db: Session, content_sha256: str, token: str):
+    """Give up a claim that was never processed (e.g. on shutdown)."""
+    db.execute(
+        IngestedFile.__table__.delete()
+        .where(IngestedFile.content_sha256 == content_sha256, IngestedFile.claim_token == token,
+               IngestedFile.status == "processing")
+    )
+    db.commit()
+
+
+class Debouncer:
+    """
+    Holds back files until they stop changing.
+
+    touch() is called for every file event (or scan hit); ready() returns
+    the files whose size and mtime have not changed for settle seconds.
+    Files that disappear in the meantime are dropped.
+    """
+
+    def __init__(self, settle: float = INGEST_SETTLE_SECONDS):
+        self.settle = settle
+        self._pending: Dict[str, Tuple[Optional[Tuple[int, int]], float]] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, path: str):
+        with self._lock:
+            self._pending[path] = (None, time.monotonic())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def __contains__(self, path: str) -> bool:
+        with self._lock:
+            return path in self._pending
+
+    def ready(self) -> List[str]:
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path, (signature, changed_at) in list(self._pending.items()):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    del self._pending[path]
+                    continue
+                current = (stat.st_size, stat.st_mtime_ns)
+                if current != signature:
+                    self._pending[path] = (current, now)
+                elif stat.st_size > 0 and now - changed_at >= self.settle:
+                    del self._pending[path]
+                    ready.append(path)
+        return ready
+
+
+class _DropFolderHandler(FileSystemEventHandler):
+    def __init__(self, debouncer: Debouncer):
+        self.debouncer = debouncer
+
+    def on_created(self, event):
+        if not event.is_directory and is_image(event.src_path):
+            self.debouncer.touch(event.src_path)
+
+    on_modified = on_created
+
+    def on_moved(self, event):
+        # Writers that copy to a temp name and rename into place
+        if not event.is_directory and is_image(event.dest_path):
+            self.debouncer.touch(event.dest_path)
+
+
+class IngestDaemon:
+    """
+    Watches drop folders and records every new image once.
+
+    A single driver thread debounces, hashes and claims files and keeps up
+    to two batches per worker in flight, so a burst of hundreds of files
+    queues as ready paths (cheap) and is only claimed as workers free up.
+    Finished batches are committed in one transaction.
+    """
+
+    def __init__(self, directories: List[str], model_path: str, uploads_dir: str,
+                 confidence_threshold: float = 0.5, workers: Optional[int] = None,
+                 batch_size: int = INGEST_BATCH_SIZE, settle: float = INGEST_SETTLE_SECONDS,
+                 user: Optional[str] = None, description: Optional[str] = None,
+                 recursive: bool = False, retry_failed: bool = False, poll: bool = False):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.model_path = model_path
+        self.uploads_dir = uploads_dir
+        self.confidence_threshold = confidence_threshold
+        self.workers = workers or default_workers()
+        self.batch_size = batch_size
+        self.user = user
+        self.description = description
+        self.recursive = recursive
+        self.retry_failed = retry_failed
+        self.poll = poll or Observer is None
+        self.debouncer = Debouncer(settle)
+        self._ready: Deque[str] = deque()
+        self._queued = set()                          # Paths in _ready
+        self._seen: Dict[str, Tuple[int, int]] = {}   # Path -> (size, mtime) when last taken; pruned by scan()
+        self._suspects: Deque[str] = deque()          # Paths from batches lost to a worker crash
+        self.stats = {"recorded": 0, "duplicates": 0, "failed": 0}
+
+    def scan(self):
+        """Queue every image in the folders that changed since it was last taken; forget removed files."""
+        present = set()
+        for directory in self.directories:
+            for root, dirs, files in os.walk(directory):
+                if not self.recursive:
+                    dirs.clear()
+                for name in files:
+                    path = os.path.join(root, name)
+                    if not is_image(path):
+                        continue
+                    present.add(path)
+                    if path in self.debouncer or path in self._queued:
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if self._seen.get(path) != (stat.st_size, stat.st_mtime_ns):
+                        self.debouncer.touch(path)
+        for path in set(self._seen) - present:
+            del self._seen[path]
+
+    def run(self, stop: threading.Event):
+        """Ingest until stop is set, then finish the batches in flight."""
+        init_db()
+        os.makedirs(self.uploads_dir, exist_ok=True)
+
+        observer = None
+        if not self.poll:
+            observer = Observer()
+            handler = _DropFolderHandler(self.debouncer)
+            for directory in self.directories:
+                observer.schedule(handler, directory, recursive=self.recursive)
+            observer.start()
+        self.scan()
+        last_scan = last_report = started = time.monotonic()
+        scan_interval = INGEST_SCAN_INTERVAL if self.poll else INGEST_RESCAN_INTERVAL
+
+        pool = create_detector_pool(self.model_path, workers=self.workers,
+                                    confidence_threshold=self.confidence_threshold)
+        in_flight = {}
+        isolated = set()   # Futures of suspects running alone
+        try:
+            with SessionLocal() as db:
+                while not stop.is_set() or in_flight:
+                    now = time.monotonic()
+                    if not stop.is_set():
+                        if now - last_scan >= scan_interval:
+                            self.scan()
+                            last_scan = now
+                        ready = self.debouncer.ready()
+                        self._ready.extend(ready)
+                        self._queued.update(ready)
+                        while len(in_flight) < 2 * self.workers and (self._ready or self._suspects):
+                            # A suspect only runs alone, so a crash can be blamed on it
+                            suspect = bool(self._suspects)
+                            if suspect and in_flight:
+                                break
+                            batch = self._claim_batch(db, self._suspects if suspect else self._ready,
+                                                      1 if suspect else self.batch_size)
+                            if not batch:
+                                continue
+                            paths = [item["upload_path"] for item in batch]
+                            try:
+                                future = pool.submit(detect_batch, paths, "hybrid", True)
+                            except BrokenProcessPool:
+                                print("⚠️  Detector pool broke, starting a new one")
+                                pool.shutdown(wait=False, cancel_futures=True)
+                                pool = create_detector_pool(self.model_path, workers=self.workers,
+                                                            confidence_threshold=self.confidence_threshold)
+                                future = pool.submit(detect_batch, paths, "hybrid", True)
+                            in_flight[future] = batch
+                            if suspect:
+                                isolated.add(future)
+                                break
+
+                    if in_flight:
+                        done, _ = wait(in_flight, timeout=INGEST_TICK, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._save(db, in_flight.pop(future), future, future in isolated)
+                            isolated.discard(future)
+                    else:
+                        stop.wait(INGEST_TICK)
+
+                    if now - last_report >= INGEST_REPORT_INTERVAL:
+                        self.report(now - started)
+                        last_report = now
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            if observer is not None:
+                observer.stop()
+                observer.join()
+        self.report(time.monotonic() - started)
+
+    def report(self, elapsed: float):
+        recorded = self.stats["recorded"]
+        print(f"📥 {recorded} recorded ({recorded / max(elapsed, 1e-9):.2f} images/s), "
+              f"{self.stats['duplicates']} duplicates, {self.stats['failed']} failed, "
+              f"{len(self._ready) + len(self._suspects) + len(self.debouncer)} waiting")
+
+    def _claim_batch(self, db: Session, paths: Deque[str], size: int) -> List[Dict]:
+        """Hash and claim files from paths until a batch is full; the claimed ones are copied into uploads."""
+        batch = []
+        while paths and len(batch) < size:
+            path = paths.popleft()
+            self._queued.discard(path)
+            try:
+                stat = os.stat(path)
+                digest = content_digest(path)
+            except OSError:
+                continue   # Removed before we got to it
+            self._seen[path] = (stat.st_size, stat.st_mtime_ns)
+
+            token = claim_file(db, digest, path, retry_failed=self.retry_failed)
+            if token is None:
+                self.stats["duplicates"] += 1
+                continue
+
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"{timestamp}_{digest[:8]}_{os.path.basename(path)}"
+            upload_path = os.path.join(self.uploads_dir, filename)
+            try:
+                shutil.copyfile(path, upload_path)
+            except OSError:
+                release_claim(db, digest, token)
+                self._seen.pop(path, None)
+                continue
+            batch.append({"path": path, "sha256": digest, "token": token,
+                          "filename": filename, "upload_path": upload_path})
+        return batch
+
+    def _save(self, db: Session, batch: List[Dict], future, isolated: bool = False):
+        """Record a finished batch: Records and their ingested_files rows in one transaction."""
+        try:
+            results = future.result()
+        except Exception as e:
+            # The pool broke (a worker died); the next submit replaces it
+            self._handle_crash(db, batch, e, isolated)
+            return
+
+        now = datetime.utcnow()
+        saved = []
+        for item, result in zip(batch, results):
+            fence = [IngestedFile.content_sha256 == item["sha256"], IngestedFile.claim_token == item["token"],
+                     IngestedFile.status == "processing"]
+            if "error" in result:
+                db.execute(update(IngestedFile).where(*fence)
+                           .values(status="failed", error=result["error"], claim_token=None, finished_at=now))
+                self._discard(item)
+                self.stats["failed"] += 1
+                print(f"❌ {item['path']}: {result['error']}")
+                continue
+
+            if not db.execute(update(IngestedFile).where(*fence)
+                              .values(status="done", claim_token=None, finished_at=now)).rowcount:
+                self._discard(item)   # Claim timed out and was taken over
+                continue
+            record = Record(
+                image_filename=item["filename"],
+                total_count=result["total_count"],
+                color_counts=result["color_counts"],
+                raw_detection=result["detections"],
+                description=self.description,
+                user=self.user,
+                created_at=now,
+            )
+            db.add(record)
+            db.flush()
+            db.execute(update(IngestedFile).where(IngestedFile.content_sha256 == item["sha256"])
+                       .values(record_id=record.id))
+            if result.get("raw") is not None:
+                save_raw_outputs(raw_outputs_path(item["filename"]), result["raw"])
+            saved.append((item, record.id, result["total_count"]))
+
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            for item, _, _ in saved:
+                self._discard(item)
+            raise
+
+        for item, record_id, total_count in saved:
+            self.stats["recorded"] += 1
+            print(f"✓ {item['path']} → record #{record_id} ({total_count} rolls)")
+
+    def _handle_crash(self, db: Session, batch: List[Dict], error: Exception, isolated: bool):
+        """Images of a batch lost to a worker crash: suspects to retry alone, or failed if one ran alone."""
+        for item in batch:
+            self._discard(item)
+            if not isolated:
+                release_claim(db, item["sha256"], item["token"])
+                self._seen.pop(item["path"], None)
+                self._suspects.append(item["path"])
+                continue
+            db.execute(update(IngestedFile)
+                       .where(IngestedFile.content_sha256 == item["sha256"], IngestedFile.claim_token == item["token"],
+                              IngestedFile.status == "processing")
+                       .values(status="failed", error=f"Detector worker crashed: {error}",
+                               claim_token=None, finished_at=datetime.utcnow()))
+            db.commit()
+            self.stats["failed"] += 1
+            print(f"❌ {item['path']}: detector worker crashed on it ({type(error).__name__})")
+        if not isolated:
+            print(f"⚠️  Detector worker died; retrying its {len(batch)} image(s) one at a time")
+
+    @staticmethod
+    def _discard(item: Dict):
+        if os.path.exists(item["upload_path"]):
+            os.remove(item["upload_path"])
+        delete_raw_outputs(item["filename"])
+
+
+def add_arguments(parser):
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    parser.add_argument("directories", nargs="+", help="Drop folders to watch")
+    parser.add_argument("--model", default=os.path.join(app_dir, "models_weights", "best.pt"), help="YOLO weights")
+    parser.add_argument("--conf", type=float, default=0.5, help="Confidence threshold (the API uses 0.5)")
+    parser.add_argument("--uploads", default=os.path.join(app_dir, "uploads"), help="Uploads directory")
+    parser.add_argument("--workers", type=int, default=None, help="Detector processes (default: one per core)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="Images per batched YOLO call")
+    parser.add_argument("--settle", type=float, default=INGEST_SETTLE_SECONDS,
+                        help="Seconds a file must stay unchanged before it is taken")
+    parser.add_argument("--user", help="User stored on the records (e.g. the station name)")
+    parser.add_argument("--description", help="Description stored on the records")
+    parser.add_argument("--recursive", action="store_true", help="Also watch subfolders")
+    parser.add_argument("--retry-failed", action="store_true", help="Try images that failed before again")
+    parser.add_argument("--poll", action="store_true", help="Scan periodically instead of using inotify")
+    parser.set_defaults(func=run)
+
+
+def run(args) -> int:
+    missing = [directory for directory in args.directories if not os.path.isdir(directory)]
+    if missing:
+        print(f"❌ Not a directory: {', '.join(missing)}")
+        return 1
+
+    daemon = IngestDaemon(
+        args.directories, args.model, args.uploads, confidence_threshold=args.conf, workers=args.workers,
+        batch_size=args.batch_size, settle=args.settle, user=args.user, description=args.description,
+        recursive=args.recursive, retry_failed=args.retry_failed, poll=args.poll,
+    )
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    watching = "scanning" if daemon.poll else "watching"
+    print(f"✓ {watching} {', '.join(daemon.directories)} with {daemon.workers} worker(s), Ctrl+C to stop")
+    daemon.run(stop)
+    return 0
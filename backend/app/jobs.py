@@ -0,0 +1,241 @@
+"""
+Durable prediction job queue in SQLite, and the workers that drain it.
+
+POST /jobs stores the upload and a prediction_jobs row; workers claim rows
+with a single UPDATE ... RETURNING, which takes a lease (visible_at) on the
+job. A worker that dies mid-job simply lets its lease expire and the job is
+claimed again; failures are retried with exponential backoff up to
+max_attempts. The Record and the job's completion are committed together,
+and only by the attempt that still holds the lease, so a job never
+produces two records.
+
+Workers are threads that hand their job's image to the API's detector on
+the "bulk" priority lane (see scheduler.py), so queued jobs never delay
+interactive /predict requests and load no model of their own; with an
+inference server every API worker's jobs go to the one shared model. They
+normally run inside the API (THREAD_ROLL_JOB_WORKERS, default 1, is the
+number of jobs in flight), or standalone with a detector (or inference
+server connection) of their own:
+
+    cd backend/app && python jobs.py --workers 2
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from typing import Dict, Optional
+import argparse
+import contextlib
+import io
+import os
+import threading
+import uuid
+
+from database import PredictionJob, Record, SessionLocal, init_db
+from inference_server import InferenceClient
+from raw_outputs import raw_outputs_path, save_raw_outputs
+from scheduler import InferenceScheduler
+from worker_pool import load_detector
+
+JOB_MAX_ATTEMPTS = 3
+JOB_VISIBILITY_TIMEOUT = timedelta(seconds=120)   # Lease per attempt; must exceed the slowest prediction
+JOB_RETRY_BACKOFF = timedelta(seconds=5)          # Doubled after every failed attempt
+JOB_POLL_INTERVAL = 0.5                           # Idle workers look for new jobs this often (seconds)
+JOB_SHUTDOWN_GRACE = 30.0                         # Seconds a worker may take to finish its job on stop
+JOB_LANE = "bulk"                                 # Scheduler lane job predictions wait in
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+def enqueue_job(db: Session, image_filename: str, user: Optional[str] = None,
+                description: Optional[str] = None) -> PredictionJob:
+    job = PredictionJob(
+        status="queued",
+        image_filename=image_filename,
+        user=user,
+        description=description,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        visible_at=datetime.utcnow(),
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def claim_job(db: Session) -> Optional[Dict]:
+    """
+    Lease the oldest claimable job, or return None.
+
+    Claimable means queued (and past its retry backoff) or running with an
+    expired lease. Expired jobs that used up their attempts are failed first.
+    """
+    now = datetime.utcnow()
+    db.execute(
+        update(PredictionJob)
+        .where(PredictionJob.status == "running", PredictionJob.visible_at <= now,
+               PredictionJob.attempts >= PredictionJob.max_attempts)
+        .values(status="failed", error="Worker did not finish within the visibility timeout",
+                claim_token=None, finished_at=now)
+    )
+
+    candidate = (
+        select(PredictionJob.id)
+        .where(PredictionJob.status.in_(("queued", "running")), PredictionJob.visible_at <= now)
+        .order_by(PredictionJob.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    token = uuid.uuid4().hex
+    row = db.execute(
+        update(PredictionJob)
+        .where(PredictionJob.id == candidate)
+        .values(
+            status="running",
+            attempts=PredictionJob.attempts + 1,
+            claim_token=token,
+            visible_at=now + JOB_VISIBILITY_TIMEOUT,
+            started_at=func.coalesce(PredictionJob.started_at, now),
+        )
+        .returning(PredictionJob.id, PredictionJob.image_filename, PredictionJob.user,
+                   PredictionJob.description, PredictionJob.attempts, PredictionJob.max_attempts)
+    ).first()
+    db.commit()
+    if row is None:
+        return None
+    return dict(row._mapping, claim_token=token)
+
+
+def complete_job(db: Session, job: Dict, result: Dict) -> Optional[int]:
+    """Create the job's Record and mark it succeeded in one transaction; None if the lease was lost."""
+    now = datetime.utcnow()
+    record = Record(
+        image_filename=job["image_filename"],
+        total_count=result["total_count"],
+        color_counts=result["color_counts"],
+        raw_detection=result["detections"],
+        description=job["description"],
+        user=job["user"],
+        created_at=now,
+    )
+    db.add(record)
+    db.flush()
+    updated = db.execute(
+        update(PredictionJob)
+        .where(PredictionJob.id == job["id"], PredictionJob.claim_token == job["claim_token"],
+               PredictionJob.status == "running")
+        .values(status="succeeded", record_id=record.id, error=None, claim_token=None, finished_at=now)
+    ).rowcount
+    if not updated:
+        db.rollback()
+        return None
+    db.commit()
+    return record.id
+
+
+def fail_job(db: Session, job: Dict, error: str):
+    """Schedule a retry with backoff, or fail the job for good after max_attempts."""
+    now = datetime.utcnow()
+    if job["attempts"] >= job["max_attempts"]:
+        values = dict(status="failed", finished_at=now)
+    else:
+        values = dict(status="queued", visible_at=now + JOB_RETRY_BACKOFF * 2 ** (job["attempts"] - 1))
+    db.execute(
+        update(PredictionJob)
+        .where(PredictionJob.id == job["id"], PredictionJob.claim_token == job["claim_token"])
+        .values(error=error, claim_token=None, **values)
+    )
+    db.commit()
+
+
+def run_job(inference, job: Dict, uploads_dir: str):
+    """Predict one claimed job on the bulk lane of inference (scheduler or client) and record the outcome."""
+    image_path = os.path.join(uploads_dir, job["image_filename"])
+    try:
+        result = inference.submit(image_path, lane=JOB_LANE, keep_raw=True).result()
+        if result.get("raw") is not None:
+            save_raw_outputs(raw_outputs_path(job["image_filename"]), result["raw"])
+    except Exception as e:
+        with SessionLocal() as db:
+            fail_job(db, job, f"{type(e).__name__}: {e}")
+        return
+
+    with SessionLocal() as db:
+        complete_job(db, job, result)
+
+
+def worker_loop(inference, uploads_dir: str, stop: threading.Event):
+    """Worker thread: claim and run jobs until stop is set."""
+    while not stop.is_set():
+        with SessionLocal() as db:
+            job = claim_job(db)
+        if job is None:
+            stop.wait(JOB_POLL_INTERVAL)
+            continue
+        run_job(inference, job, uploads_dir)
+
+
+class JobWorkers:
+    """A set of job worker threads sharing one inference scheduler or client, started and stopped together."""
+
+    def __init__(self, inference, uploads_dir: str):
+        self.inference = inference
+        self.uploads_dir = uploads_dir
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self, count: int):
+        self._stop.clear()
+        for i in range(count):
+            thread = threading.Thread(
+                target=worker_loop,
+                args=(self.inference, self.uploads_dir, self._stop),
+                name=f"job-worker-{i}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, grace: float = JOB_SHUTDOWN_GRACE):
+        """Let workers finish their current job; a job still running after the grace period is retried later."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(grace)
+        self._threads = []
+
+    def join(self):
+        for thread in self._threads:
+            # Short waits keep Ctrl+C responsive
+            while thread.is_alive():
+                thread.join(0.5)
+
+
+def main():
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1, help="Jobs in flight")
+    parser.add_argument("--model", default=os.path.join(app_dir, "models_weights", "best.pt"), help="YOLO weights")
+    parser.add_argument("--conf", type=float, default=0.5, help="Confidence threshold (the API uses 0.5)")
+    parser.add_argument("--uploads", default=os.path.join(app_dir, "uploads"), help="Uploads directory")
+    parser.add_argument("--server", default=os.environ.get("THREAD_ROLL_INFERENCE_SERVER"),
+                        help="Predict on this inference server (socket path) instead of loading the model here")
+    args = parser.parse_args()
+
+    init_db()
+    if args.server:
+        inference = InferenceClient(args.server)
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            detector = load_detector(args.model, args.conf)
+        inference = InferenceScheduler(lambda: detector)
+    workers = JobWorkers(inference, args.uploads)
+    workers.start(args.workers)
+    print(f"✓ {args.workers} job worker(s) running, Ctrl+C to stop")
+    try:
+        workers.join()
+    except KeyboardInterrupt:
+        print("Stopping after current jobs...")
+        workers.stop()
+    inference.stop()
+
+
+if __name__ == "__main__":
+    main()
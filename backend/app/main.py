@@ -1,15 +1,41 @@
-from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
+import asyncio
 import os
 import shutil
-from pydantic import BaseModel
-
-from database import get_db, init_db, Record
-from detection_v2 import ThreadRollDetectorV2
+import time
+import uuid
+from pydantic import BaseModel, Field
+import cv2
+import numpy as np
+
+from database import (
+    get_async_db, get_db, init_db, Record, RecordVersion, ReprocessRun, PredictionJob, record_writer, async_engine,
+    AsyncSessionLocal, SessionLocal
+)
+from detection_v2 import (
+    DETECTION_MODES, HOUGH_REFERENCE_DIMENSION, YOLO_DEFAULT_INPUT_SIZE, preferred_input_dimension
+)
+from metrics import REQUEST_SECONDS, REQUESTS_IN_PROGRESS, collect_timings, live_predict, render_metrics
+from raw_outputs import delete_raw_outputs, raw_outputs_path, save_raw_outputs
+from routing import DEFAULT_ROUTE_LOG
+from worker_pool import load_detector
+import export
+import inference_server
+import jobs
+import payload
+import reprocess
+import rescore
+import scheduler
+import search
+import stats
 
 # Initialize FastAPI app
 app = FastAPI(title="Thread Roll Counter API", version="1.0.0")
@@ -23,13 +49,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Export handler latency per route template (not per raw path, to keep label cardinality bounded)."""
+    start = time.perf_counter()
+    status = 500
+    REQUESTS_IN_PROGRESS.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        # Lets clients separate server handling time from connection/accept queueing
+        response.headers["X-Process-Time-Ms"] = f"{(time.perf_counter() - start) * 1000:.3f}"
+        return response
+    finally:
+        REQUESTS_IN_PROGRESS.dec()
+        route = request.scope.get("route")
+        REQUEST_SECONDS.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status)
+        ).observe(time.perf_counter() - start)
+
 # Initialize database
 init_db()
+with SessionLocal() as _db:
+    stats.backfill_rollups(_db)
+record_writer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_database():
+    """Pause background work, flush queued record inserts and close pooled async connections."""
+    reprocess_manager.stop()
+    job_workers.stop()
+    inference.stop()
+    record_writer.stop()
+    await async_engine.dispose()
+
 
 # Setup paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
 MODEL_PATH = os.path.join(BASE_DIR, "models_weights", "best.pt")
+DETECTOR_CONFIDENCE = 0.5
+
+PAYLOAD_FORMAT_PATTERN = f"^({'|'.join(payload.PAYLOAD_FORMATS)})$"
+# "count" skips the per-detection payload for callers that only need totals (dock scanners)
+PREDICT_MODES = ("full", "count")
+MAX_PAGE_LIMIT = 200             # Largest GET /records/page page
+
+# Re-encode quality clients should use for uploads (colors are classified from these pixels)
+UPLOAD_JPEG_QUALITY = 0.9
+CONFIG_MAX_AGE = 300             # Seconds clients may cache GET /config
+
+# "stub" swaps in a weight-free fake detector for load testing the HTTP stack
+DETECTOR_KIND = os.environ.get("THREAD_ROLL_DETECTOR", "yolo")
 
 # Create uploads directory if it doesn't exist
 os.makedirs(UPLOADS_DIR, exist_ok=True)
@@ -45,15 +120,56 @@ def get_detector():
     """Lazy load the YOLO detector."""
     global detector
     if detector is None:
-        if not os.path.exists(MODEL_PATH):
+        if DETECTOR_KIND != "stub" and not os.path.exists(MODEL_PATH):
             raise HTTPException(
                 status_code=500,
                 detail=f"Model file not found at {MODEL_PATH}. Please place your YOLO model weights there."
             )
-        detector = ThreadRollDetectorV2(MODEL_PATH, confidence_threshold=0.5)
+        detector = load_detector(MODEL_PATH, DETECTOR_CONFIDENCE, route_log=DEFAULT_ROUTE_LOG or None)
     return detector
 
 
+# Priority lanes in front of the detector: interactive uploads get an SLO and go before bulk ones
+INTERACTIVE_SLO_MS = float(os.environ.get("THREAD_ROLL_INTERACTIVE_SLO_MS", "2000"))
+# With several uvicorn workers, point them all at one `python inference_server.py` (one model in memory)
+INFERENCE_SERVER = os.environ.get("THREAD_ROLL_INFERENCE_SERVER")
+if INFERENCE_SERVER:
+    inference = inference_server.InferenceClient(INFERENCE_SERVER)
+else:
+    inference = scheduler.InferenceScheduler(
+        get_detector, slos=dict(scheduler.LANE_SLOS, interactive=INTERACTIVE_SLO_MS / 1000)
+    )
+
+
+def get_rescorer():
+    """What rescores stored raw outputs: the inference server in server mode (API workers load no model)."""
+    return inference if INFERENCE_SERVER else get_detector()
+
+
+# Queued /jobs predictions in flight on the bulk lane (0 = run them elsewhere with `python jobs.py`)
+JOB_WORKERS = int(os.environ.get("THREAD_ROLL_JOB_WORKERS", "1"))
+JOB_EVENT_INTERVAL = 0.5         # Seconds between job status checks on an SSE stream
+JOB_EVENT_KEEPALIVE = 15.0       # Seconds between SSE keep-alive comments
+job_workers = jobs.JobWorkers(inference, UPLOADS_DIR)
+
+
+@app.on_event("startup")
+def start_job_workers():
+    """Start the job workers; queued jobs from before a restart are picked up again."""
+    if JOB_WORKERS and (INFERENCE_SERVER or DETECTOR_KIND == "stub" or os.path.exists(MODEL_PATH)):
+        job_workers.start(JOB_WORKERS)
+
+
+# Background re-counting of stored uploads after a model upgrade
+reprocess_manager = reprocess.ReprocessManager(UPLOADS_DIR, DETECTOR_CONFIDENCE)
+
+
+@app.on_event("startup")
+def resume_reprocessing():
+    """Continue re-processing runs interrupted by the last shutdown."""
+    reprocess_manager.resume_interrupted()
+
+
 # Pydantic models for request/response
 class RecordResponse(BaseModel):
     id: int
@@ -64,6 +180,7 @@ class RecordResponse(BaseModel):
     description: Optional[str] = None
     user: Optional[str] = None
     created_at: datetime
+    timings: Optional[Dict] = None
 
     class Config:
         from_attributes = True
@@ -83,10 +200,110 @@ class RecordResponse(BaseModel):
         )
 
 
+class RecordSummaryResponse(BaseModel):
+    """A record without its detections, for lists."""
+    id: int
+    image_filename: str
+    total_count: int
+    color_counts: dict
+    description: Optional[str] = None
+    user: Optional[str] = None
+    created_at: datetime
+
+
+class RecordPageResponse(BaseModel):
+    items: List[RecordSummaryResponse]
+    next_before_id: Optional[int] = None
+    total: Optional[int] = None
+
+
 class UpdateDescriptionRequest(BaseModel):
     description: str
 
 
+class ReprocessRequest(BaseModel):
+    model_path: Optional[str] = None
+    mode: str = Field("hybrid", pattern=f"^({'|'.join(DETECTION_MODES)})$")
+    batch_size: int = Field(reprocess.REPROCESS_BATCH_SIZE, ge=1, le=64)
+    workers: Optional[int] = Field(None, ge=1)
+
+
+class ReprocessRunResponse(BaseModel):
+    id: int
+    status: str
+    model_path: str
+    model_sha256: str
+    mode: str
+    total: int
+    processed: int
+    failed: int
+    percent: float
+    images_per_sec: float
+    eta_seconds: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class RecordVersionResponse(BaseModel):
+    id: int
+    run_id: int
+    model_sha256: str
+    total_count: int
+    color_counts: Dict[str, int]
+    detections: list
+    created_at: datetime
+
+
+class JobResponse(BaseModel):
+    id: int
+    status: str
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    record: Optional[RecordResponse] = None
+
+    @classmethod
+    def from_job(cls, job: PredictionJob, record: Optional[Record] = None):
+        return cls(
+            id=job.id,
+            status=job.status,
+            attempts=job.attempts,
+            error=job.error,
+            created_at=job.created_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at,
+            record=RecordResponse.from_record(record) if record else None
+        )
+
+
+class RescoreRequest(BaseModel):
+    confidence_threshold: Optional[float] = Field(None, gt=0, le=1)
+    mode: str = Field("hybrid", pattern=f"^({'|'.join(DETECTION_MODES)})$")
+
+
+class BulkRescoreRequest(RescoreRequest):
+    record_ids: List[int] = Field(..., min_length=1, max_length=rescore.MAX_RESCORE_BATCH)
+
+
+class StatsBucketResponse(BaseModel):
+    bucket_start: datetime
+    user: Optional[str] = None
+    record_count: int
+    roll_count: int
+    color_counts: Dict[str, int]
+
+
+class UserStatsResponse(BaseModel):
+    user: Optional[str] = None
+    record_count: int
+    roll_count: int
+    color_counts: Dict[str, int]
+
+
 # API Endpoints
 
 @app.get("/")
@@ -95,12 +312,62 @@ def root():
     return {"message": "Thread Roll Counter API is running", "version": "1.0.0"}
 
 
-@app.post("/predict", response_model=RecordResponse)
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: per-stage detection histograms and request latencies."""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
+def detector_input_size() -> int:
+    """YOLO input size of the deployed weights, asked from the inference server or the local detector."""
+    try:
+        if INFERENCE_SERVER:
+            input_size = inference.server_info().get("input_size")
+        else:
+            # The first /predict would load it anyway; clients usually ask for /config first
+            input_size = getattr(get_detector(), "input_size", None)
+    except Exception:
+        input_size = None   # No weights or no server yet: clients get the default until they refetch
+    return input_size or YOLO_DEFAULT_INPUT_SIZE
+
+
+@app.get("/config")
+def get_config(response: Response):
+    """
+    Upload settings for clients: resize to max_dimension and re-encode before uploading.
+
+    Tied to the detector's effective input size: YOLO's input size, but
+    never below the resolution the center-hole parameters are tuned at.
+    """
+    input_size = detector_input_size()
+    response.headers["Cache-Control"] = f"max-age={CONFIG_MAX_AGE}"
+    return {
+        "upload": {
+            "max_dimension": preferred_input_dimension(input_size),
+            "mime_type": "image/jpeg",
+            "quality": UPLOAD_JPEG_QUALITY,
+        },
+        "detector": {
+            "input_size": input_size,
+            "hough_reference_dimension": HOUGH_REFERENCE_DIMENSION,
+            "modes": list(DETECTION_MODES),
+        },
+    }
+
+
+@app.post("/predict", response_model=RecordResponse, response_model_exclude_none=True)
 async def predict(
+    request: Request,
     file: UploadFile = File(...),
     user: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    include_timings: bool = Query(False),
+    lane: str = Query("interactive", pattern=f"^({'|'.join(scheduler.LANES)})$"),
+    format: Optional[str] = Query(None, pattern=PAYLOAD_FORMAT_PATTERN),
+    mode: str = Query("full", pattern=f"^({'|'.join(PREDICT_MODES)})$"),
+    colors: bool = Query(False),
+    save_image: bool = Query(True)
 ):
     """
     Predict thread rolls in an uploaded image.
@@ -109,6 +376,12 @@ async def predict(
         file: Image file (multipart/form-data)
         user: Optional user name
         description: Optional description
+        include_timings: Add the per-stage latency breakdown (ms) to the response
+        lane: Priority lane; scripted batch uploads should use "bulk"
+        format: "compact" or "msgpack" for detections as parallel arrays (or send a matching Accept header)
+        mode: "count" returns and stores no detections (and no raw outputs, so the record can't be rescored)
+        colors: In count mode, also classify colors for color_counts (full mode always does)
+        save_image: False keeps the upload in memory only; the record's image can't be shown or reprocessed
 
     Returns:
         Detection results with total count, color breakdown, and bounding boxes
@@ -116,43 +389,62 @@ async def predict(
     # Validate file type
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
-
-    # Generate unique filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_extension = os.path.splitext(file.filename)[1] or ".jpg"
-    filename = f"{timestamp}_{file.filename}"
-    file_path = os.path.join(UPLOADS_DIR, filename)
-
-    # Save uploaded file
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-
-    # Run YOLO detection
-    try:
-        det = get_detector()
-        result = det.process_image(file_path)
-    except Exception as e:
-        # Clean up uploaded file on error
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
-
-    # Save to database
-    record = Record(
-        image_filename=filename,
-        total_count=result["total_count"],
-        color_counts=result["color_counts"],
-        raw_detection=result["detections"],
-        description=description,
-        user=user,
-        created_at=datetime.utcnow()
-    )
-    db.add(record)
-    db.commit()
-    db.refresh(record)
+    payload_format = payload.negotiate_format(request, format)
+
+    with collect_timings() as timings:
+        # Generate unique filename (clients often all send "image.jpg"; the raw-output sidecar shares the name)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_extension = os.path.splitext(file.filename)[1] or ".jpg"
+        filename = f"{timestamp}_{uuid.uuid4().hex[:8]}_{file.filename}"
+        file_path = os.path.join(UPLOADS_DIR, filename)
+
+        count_only = mode == "count"
+        if save_image:
+            # Save uploaded file
+            try:
+                with timings.stage("upload"):
+                    with open(file_path, "wb") as buffer:
+                        shutil.copyfileobj(file.file, buffer)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+            image = file_path
+        else:
+            with timings.stage("upload"):
+                data = await file.read()
+            with timings.stage("decode"):
+                image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise HTTPException(status_code=400, detail="Could not decode image")
+
+        # Run YOLO detection (queued by lane; the event loop stays free meanwhile)
+        try:
+            with live_predict():
+                result = await asyncio.wrap_future(inference.submit(
+                    image, lane=lane, keep_raw=not count_only, colors=colors or not count_only
+                ))
+        except Exception as e:
+            # Clean up uploaded file on error
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
+
+        # Keep the pre-threshold model outputs so the record can be rescored without inference
+        if result.get("raw") is not None:
+            with timings.stage("raw_outputs"):
+                save_raw_outputs(raw_outputs_path(filename), result["raw"])
+
+        # Save to database (group-committed by the background writer)
+        with timings.stage("db_commit"):
+            record = await asyncio.wrap_future(record_writer.submit({
+                "image_filename": filename,
+                "total_count": result["total_count"],
+                "color_counts": result["color_counts"],
+                # Count-mode records are lean: totals only
+                "raw_detection": [] if count_only else result["detections"],
+                "description": description,
+                "user": user,
+                "created_at": datetime.utcnow()
+            }))
 
     # Prepare response
     response_data = {
@@ -165,44 +457,272 @@ async def predict(
         "user": record.user,
         "created_at": record.created_at
     }
+    if include_timings:
+        response_data["timings"] = timings.as_dict()
 
+    if payload_format != "json":
+        return payload.compact_response(request, response_data, payload_format)
     return response_data
 
 
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+def create_job(
+    file: UploadFile = File(...),
+    user: Optional[str] = Form(None),
+    description: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Queue an image for prediction and return immediately.
+
+    The job is stored durably and run by a job worker; poll GET /jobs/{id}
+    or follow GET /jobs/{id}/events for the result.
+
+    Args:
+        file: Image file (multipart/form-data)
+        user: Optional user name
+        description: Optional description
+
+    Returns:
+        The queued job
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    # Unique name: queued uploads can arrive in bursts with the same client filename
+    filename = f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}_{file.filename}"
+    try:
+        with open(os.path.join(UPLOADS_DIR, filename), "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+
+    job = jobs.enqueue_job(db, filename, user=user, description=description)
+    return JobResponse.from_job(job)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Status of a queued prediction, with the resulting record once it succeeded.
+
+    Args:
+        job_id: Job ID
+
+    Returns:
+        Job status, attempts, last error and the record
+    """
+    job = await db.get(PredictionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    record = await db.get(Record, job.record_id) if job.record_id else None
+    return JobResponse.from_job(job, record)
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Server-Sent Events stream of a job's status changes.
+
+    Sends a `status` event with the job (as GET /jobs/{id}) whenever its
+    status or attempt count changes, and closes after it succeeded or failed.
+    """
+    if not await db.get(PredictionJob, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_state = None
+        last_sent = time.monotonic()
+        while True:
+            async with AsyncSessionLocal() as session:
+                job = await session.get(PredictionJob, job_id)
+                if job is None:
+                    return
+                state = (job.status, job.attempts)
+                if state != last_state:
+                    record = await session.get(Record, job.record_id) if job.record_id else None
+                    payload = JobResponse.from_job(job, record).model_dump_json()
+                    yield f"event: status\ndata: {payload}\n\n"
+                    last_state, last_sent = state, time.monotonic()
+                    if job.status in jobs.TERMINAL_STATUSES:
+                        return
+            if time.monotonic() - last_sent > JOB_EVENT_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(JOB_EVENT_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @app.get("/records", response_model=List[RecordResponse])
-def get_records(db: Session = Depends(get_db)):
+async def get_records(
+    request: Request,
+    format: Optional[str] = Query(None, pattern=PAYLOAD_FORMAT_PATTERN),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Get all detection records, ordered by most recent first.
 
+    Args:
+        format: "compact" or "msgpack" for detections as parallel arrays (or send a matching Accept header)
+
     Returns:
         List of all records
     """
-    records = db.query(Record).order_by(Record.created_at.desc()).all()
+    payload_format = payload.negotiate_format(request, format)
+    result = await db.execute(select(Record).order_by(Record.created_at.desc()))
+    records = [RecordResponse.from_record(record) for record in result.scalars().all()]
+    if payload_format != "json":
+        return payload.compact_response(request, [r.model_dump() for r in records], payload_format)
+    return records
+
+
+@app.get("/records/page", response_model=RecordPageResponse, response_model_exclude_none=True)
+async def get_records_page(
+    limit: int = Query(50, ge=1, le=MAX_PAGE_LIMIT),
+    before_id: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    One page of records, newest (highest id) first, without detections.
+
+    Pages are keyed by id rather than offset, so records added while a
+    client scrolls don't shift the pages it already has. Fetch a record's
+    detections with GET /records/{id} when it is opened.
+
+    Args:
+        limit: Page size
+        before_id: Only records with a lower id (next_before_id of the previous page)
+
+    Returns:
+        items, next_before_id (absent on the last page) and, on the first page, the total
+    """
+    query = select(
+        Record.id, Record.image_filename, Record.total_count, Record.color_counts,
+        Record.description, Record.user, Record.created_at
+    ).order_by(Record.id.desc()).limit(limit + 1)
+    if before_id is not None:
+        query = query.where(Record.id < before_id)
+    rows = (await db.execute(query)).all()
+
+    items = [RecordSummaryResponse(**row._mapping) for row in rows[:limit]]
+    page = RecordPageResponse(items=items)
+    if len(rows) > limit:
+        page.next_before_id = items[-1].id
+    if before_id is None:
+        page.total = (await db.execute(select(func.count()).select_from(Record))).scalar_one()
+    return page
+
+
+@app.get("/records/search", response_model=List[RecordResponse])
+async def search_records(
+    q: Optional[str] = None,
+    user: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    min_total: Optional[int] = Query(None, ge=0),
+    max_total: Optional[int] = Query(None, ge=0),
+    color: Optional[List[str]] = Query(None),
+    limit: int = Query(50, ge=1, le=search.MAX_SEARCH_LIMIT),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Search records by description keywords, user, time range, count and colors.
+
+    Args:
+        q: Words that must all appear in the description (full-text, "word*" for prefix)
+        user: Exact user name
+        start: Created at or after this time (UTC)
+        end: Created before this time (UTC)
+        min_total: Minimum total roll count
+        max_total: Maximum total roll count
+        color: Repeatable; "pink" requires pink rolls, "pink:10" at least 10 of them
+        limit: Page size
+        offset: Rows to skip
+
+    Returns:
+        Matching records, most recent (highest id) first
+    """
+    try:
+        colors = [search.parse_color_filter(value) for value in color or []]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    records = await db.run_sync(
+        search.search_records, q=q, user=user, start=start, end=end,
+        min_total=min_total, max_total=max_total, colors=colors, limit=limit, offset=offset
+    )
     return [RecordResponse.from_record(record) for record in records]
 
 
+@app.get("/records/export")
+def export_records(
+    format: str = Query("csv", pattern="^(csv|jsonl|parquet)$"),
+    include_detections: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    """
+    Stream every record as CSV, JSON Lines or Parquet.
+
+    Rows are read from a server-side cursor in chunks and color_counts is
+    flattened into one color_<name> column per color, so memory stays flat
+    regardless of how many records exist.
+
+    Args:
+        format: "csv", "jsonl" or "parquet"
+        include_detections: Emit one row per detection instead of per record
+        start: Only records created at or after this time (UTC)
+        end: Only records created before this time (UTC)
+
+    Returns:
+        Streaming file download
+    """
+    if format == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export requires the pyarrow package")
+
+    media_type, extension = export.EXPORT_FORMATS[format]
+    filename = f"thread_roll_records_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return StreamingResponse(
+        export.STREAMERS[format](include_detections=include_detections, start=start, end=end),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @app.get("/records/{record_id}", response_model=RecordResponse)
-def get_record(record_id: int, db: Session = Depends(get_db)):
+async def get_record(
+    record_id: int,
+    request: Request,
+    format: Optional[str] = Query(None, pattern=PAYLOAD_FORMAT_PATTERN),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Get a single detection record by ID.
 
     Args:
         record_id: Record ID
+        format: "compact" or "msgpack" for detections as parallel arrays (or send a matching Accept header)
 
     Returns:
         Single record
     """
-    record = db.query(Record).filter(Record.id == record_id).first()
+    payload_format = payload.negotiate_format(request, format)
+    record = await db.get(Record, record_id)
     if not record:
         raise HTTPException(status_code=404, detail="Record not found")
-    return RecordResponse.from_record(record)
+    response = RecordResponse.from_record(record)
+    if payload_format != "json":
+        return payload.compact_response(request, response.model_dump(), payload_format)
+    return response
 
 
 @app.patch("/records/{record_id}", response_model=RecordResponse)
-def update_record(
+async def update_record(
     record_id: int,
     update_data: UpdateDescriptionRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update the description of a record.
@@ -214,19 +734,18 @@ def update_record(
     Returns:
         Updated record
     """
-    record = db.query(Record).filter(Record.id == record_id).first()
+    record = await db.get(Record, record_id)
     if not record:
         raise HTTPException(status_code=404, detail="Record not found")
 
     record.description = update_data.description
-    db.commit()
-    db.refresh(record)
+    await db.commit()
 
     return RecordResponse.from_record(record)
 
 
 @app.delete("/records/{record_id}")
-def delete_record(record_id: int, db: Session = Depends(get_db)):
+async def delete_record(record_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Delete a record and its associated image file.
 
@@ -236,7 +755,7 @@ def delete_record(record_id: int, db: Session = Depends(get_db)):
     Returns:
         Success message
     """
-    record = db.query(Record).filter(Record.id == record_id).first()
+    record = await db.get(Record, record_id)
     if not record:
         raise HTTPException(status_code=404, detail="Record not found")
 
@@ -244,14 +763,234 @@ def delete_record(record_id: int, db: Session = Depends(get_db)):
     image_path = os.path.join(UPLOADS_DIR, record.image_filename)
     if os.path.exists(image_path):
         os.remove(image_path)
+    delete_raw_outputs(record.image_filename)
 
     # Delete database record
-    db.delete(record)
-    db.commit()
+    await db.delete(record)
+    await db.commit()
 
     return {"message": "Record deleted successfully"}
 
 
+@app.post("/records/rescore")
+def rescore_records(request: BulkRescoreRequest, db: Session = Depends(get_db)):
+    """
+    Rescore many records from their stored raw model outputs.
+
+    Records without stored outputs (e.g. created before they were kept) or
+    whose image is gone are reported under "skipped".
+
+    Args:
+        request: Record ids, optional confidence threshold and detection mode
+
+    Returns:
+        Old and new totals per rescored record, and the skipped ids with reasons
+    """
+    return rescore.rescore_records(
+        db, get_rescorer(), request.record_ids, UPLOADS_DIR,
+        confidence_threshold=request.confidence_threshold, mode=request.mode
+    )
+
+
+@app.post("/records/{record_id}/rescore", response_model=RecordResponse, response_model_exclude_none=True)
+def rescore_record(
+    record_id: int,
+    request: RescoreRequest,
+    http_request: Request,
+    include_timings: bool = Query(False),
+    format: Optional[str] = Query(None, pattern=PAYLOAD_FORMAT_PATTERN),
+    db: Session = Depends(get_db)
+):
+    """
+    Re-apply threshold, cage filtering and color classification to a record without new inference.
+
+    Args:
+        record_id: Record ID
+        request: Optional confidence threshold (default: the API's) and detection mode
+        include_timings: Add the per-stage latency breakdown (ms) to the response
+        format: "compact" or "msgpack" for detections as parallel arrays (or send a matching Accept header)
+
+    Returns:
+        Updated record
+    """
+    payload_format = payload.negotiate_format(http_request, format)
+    record = db.get(Record, record_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+
+    try:
+        result = rescore.rescore_record(
+            get_rescorer(), record, UPLOADS_DIR,
+            confidence_threshold=request.confidence_threshold, mode=request.mode
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+
+    response = RecordResponse.from_record(record)
+    if include_timings:
+        response.timings = result["timings"]
+    if payload_format != "json":
+        return payload.compact_response(http_request, response.model_dump(exclude_none=True), payload_format)
+    return response
+
+
+@app.get("/records/{record_id}/versions", response_model=List[RecordVersionResponse])
+def get_record_versions(record_id: int, db: Session = Depends(get_db)):
+    """
+    Counts for a record from re-processing runs with newer models (the record keeps its original counts).
+
+    Args:
+        record_id: Record ID
+
+    Returns:
+        Versions, oldest first
+    """
+    if not db.get(Record, record_id):
+        raise HTTPException(status_code=404, detail="Record not found")
+    versions = db.execute(
+        select(RecordVersion).where(RecordVersion.record_id == record_id).order_by(RecordVersion.id)
+    ).scalars().all()
+    return [
+        RecordVersionResponse(
+            id=version.id,
+            run_id=version.run_id,
+            model_sha256=version.model_sha256,
+            total_count=version.total_count,
+            color_counts=version.color_counts,
+            detections=version.raw_detection,
+            created_at=version.created_at
+        )
+        for version in versions
+    ]
+
+
+@app.post("/reprocess", response_model=ReprocessRunResponse, status_code=202)
+def start_reprocessing(request: ReprocessRequest, db: Session = Depends(get_db)):
+    """
+    Start re-counting every stored upload with a (new) model in the background.
+
+    Results are stored as record versions next to the original counts. Only
+    one run can be active at a time.
+
+    Args:
+        request: Model weights (default: the API's best.pt), detection mode, batch size and worker count
+
+    Returns:
+        The new run with its progress
+    """
+    try:
+        run = reprocess_manager.start_run(
+            db, request.model_path or MODEL_PATH, mode=request.mode,
+            batch_size=request.batch_size, workers=request.workers
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return reprocess.run_progress(db, run)
+
+
+@app.get("/reprocess", response_model=List[ReprocessRunResponse])
+def list_reprocessing_runs(db: Session = Depends(get_db)):
+    """All re-processing runs, newest first."""
+    runs = db.execute(select(ReprocessRun).order_by(ReprocessRun.id.desc())).scalars().all()
+    return [reprocess.run_progress(db, run) for run in runs]
+
+
+@app.get("/reprocess/{run_id}", response_model=ReprocessRunResponse)
+def get_reprocessing_run(run_id: int, db: Session = Depends(get_db)):
+    """
+    Progress of a re-processing run.
+
+    Returns:
+        Processed/failed counts, throughput over the last minute and ETA in seconds
+    """
+    run = db.get(ReprocessRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return reprocess.run_progress(db, run)
+
+
+@app.post("/reprocess/{run_id}/pause", response_model=ReprocessRunResponse)
+def pause_reprocessing_run(run_id: int, db: Session = Depends(get_db)):
+    """Pause a run after its in-flight batches; resume it later from its checkpoint."""
+    run = db.get(ReprocessRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    try:
+        reprocess_manager.pause(db, run)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return reprocess.run_progress(db, run)
+
+
+@app.post("/reprocess/{run_id}/resume", response_model=ReprocessRunResponse)
+def resume_reprocessing_run(run_id: int, db: Session = Depends(get_db)):
+    """Resume a paused or failed run from its checkpoint."""
+    run = db.get(ReprocessRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    try:
+        reprocess_manager.resume(db, run)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return reprocess.run_progress(db, run)
+
+
+@app.get("/stats/colors", response_model=List[StatsBucketResponse])
+async def get_color_stats(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user: Optional[str] = None,
+    by_user: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Roll totals and color breakdown per hour or day, served from the rollup tables.
+
+    Args:
+        granularity: "hour" or "day"
+        start: Only buckets containing or after this time (UTC)
+        end: Only buckets starting before this time (UTC)
+        user: Only records from this user
+        by_user: Split each bucket per user
+
+    Returns:
+        List of buckets ordered by time
+    """
+    return await db.run_sync(
+        stats.color_stats, granularity=granularity, start=start, end=end, user=user, by_user=by_user
+    )
+
+
+@app.get("/stats/users", response_model=List[UserStatsResponse])
+async def get_user_stats(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Roll totals and color breakdown per user over a time range (day resolution).
+
+    Returns:
+        List of users ordered by roll count
+    """
+    return await db.run_sync(stats.user_stats, start=start, end=end)
+
+
+@app.post("/stats/rebuild")
+async def rebuild_stats(db: AsyncSession = Depends(get_async_db)):
+    """
+    Recompute all rollup tables from the records table.
+
+    Returns:
+        Number of rollup rows written
+    """
+    return await db.run_sync(stats.rebuild_rollups)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
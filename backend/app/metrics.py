@@ -0,0 +1,232 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+import os
+import threading
+import time
+
+# Stage latencies are mostly sub-second except YOLO/Hough on large photos
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = Histogram(
+    "thread_roll_stage_seconds",
+    "Time spent in each detection / request stage",
+    ["stage", "path"],
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "thread_roll_request_seconds",
+    "End-to-end HTTP handler latency",
+    ["method", "route", "status"],
+    buckets=STAGE_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "thread_roll_requests_in_progress",
+    "HTTP requests currently being handled",
+)
+
+PREDICTS_IN_PROGRESS = Gauge(
+    "thread_roll_predicts_in_progress",
+    "Live /predict requests currently running detection",
+)
+
+LANE_QUEUE_DEPTH = Gauge(
+    "thread_roll_lane_queue_depth",
+    "Predictions waiting for the detector, per priority lane",
+    ["lane"],
+)
+LANE_WAIT_SECONDS = Histogram(
+    "thread_roll_lane_wait_seconds",
+    "Time a prediction waited for the detector, per priority lane",
+    ["lane"],
+    buckets=STAGE_BUCKETS,
+)
+LANE_SLO_MISSES = Counter(
+    "thread_roll_lane_slo_misses",
+    "Predictions whose wait plus detection time exceeded their lane's SLO",
+    ["lane"],
+)
+
+_current_timings: ContextVar[Optional["StageTimings"]] = ContextVar("stage_timings", default=None)
+_observe_timings: ContextVar[bool] = ContextVar("observe_timings", default=True)
+
+
+class StageTimings:
+    """
+    Per-request accumulator of stage durations.
+
+    Stages that run several times (e.g. color classification per roll) are
+    summed. Durations are only pushed to Prometheus in observe(), once the
+    detector path (yolo/hough) that labels them is known.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.path = "none"
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def observe(self):
+        """Export the collected stage durations as histogram samples."""
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.labels(stage=name, path=self.path).observe(seconds)
+
+    def as_dict(self) -> Dict:
+        """Stage durations in milliseconds plus the detector path taken."""
+        timings = {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+        timings["path"] = self.path
+        return timings
+
+
+@contextmanager
+def collect_timings() -> Iterator[StageTimings]:
+    """
+    Make a StageTimings the target of stage() calls in this context.
+
+    Nested use reuses the outer collector, so a request handler and the
+    detector it calls share one breakdown. The outermost collector observes
+    its stages on exit.
+    """
+    timings = _current_timings.get()
+    if timings is not None:
+        yield timings
+        return
+
+    timings = StageTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+        if _observe_timings.get():
+            timings.observe()
+
+
+@contextmanager
+def deferred_timings() -> Iterator[None]:
+    """
+    Collectors opened in this block don't observe their stages.
+
+    For work done on behalf of several requests (batched detection): the
+    caller hands each result's timings to its request with merge_timings(),
+    where they are observed once.
+    """
+    token = _observe_timings.set(False)
+    try:
+        yield
+    finally:
+        _observe_timings.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block into the active StageTimings (no-op outside collect_timings())."""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    with timings.stage(name):
+        yield
+
+
+def add_stage(name: str, seconds: float):
+    """Add a duration measured elsewhere (e.g. queueing) to the active StageTimings."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.stages[name] = timings.stages.get(name, 0.0) + seconds
+
+
+def set_path(path: str):
+    """Record which detector path (yolo/hough) produced the current result."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.path = path
+
+
+def merge_timings(timings: Optional[Dict]):
+    """Add stage durations measured elsewhere (StageTimings.as_dict(), ms) to the active StageTimings."""
+    if not timings:
+        return
+    for name, value in timings.items():
+        if name == "path":
+            set_path(value)
+        else:
+            add_stage(name, value / 1000)
+
+
+# API processes serving a live /predict keep a file named after their pid here, so
+# background work in any process (reprocess runs) sees every uvicorn worker's traffic
+LIVE_PREDICTS_DIR = os.environ.get(
+    "THREAD_ROLL_LIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".live_predicts"))
+
+_live_predicts = 0
+_live_predicts_lock = threading.Lock()
+
+
+def _mark_live(live: bool, pid: Optional[int] = None):
+    """Create or remove a process's marker in LIVE_PREDICTS_DIR (best effort; default this process)."""
+    path = os.path.join(LIVE_PREDICTS_DIR, str(pid or os.getpid()))
+    try:
+        if live:
+            os.makedirs(LIVE_PREDICTS_DIR, exist_ok=True)
+            open(path, "w").close()
+        else:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+@contextmanager
+def live_predict() -> Iterator[None]:
+    """Mark a live /predict as running, so background work can back off (see live_predicts())."""
+    global _live_predicts
+    with _live_predicts_lock:
+        _live_predicts += 1
+        if _live_predicts == 1:
+            _mark_live(True)
+    PREDICTS_IN_PROGRESS.inc()
+    try:
+        yield
+    finally:
+        PREDICTS_IN_PROGRESS.dec()
+        with _live_predicts_lock:
+            _live_predicts -= 1
+            if _live_predicts == 0:
+                _mark_live(False)
+
+
+def live_predicts() -> int:
+    """
+    Live /predict requests in this process, plus one per other API process serving any.
+
+    Markers of processes that are gone (crashed mid-request) are removed.
+    """
+    others = 0
+    try:
+        names = os.listdir(LIVE_PREDICTS_DIR)
+    except OSError:
+        names = []
+    for name in names:
+        if not name.isdigit() or int(name) == os.getpid():
+            continue
+        try:
+            os.kill(int(name), 0)
+        except ProcessLookupError:
+            _mark_live(False, int(name))
+            continue
+        except PermissionError:
+            pass   # Alive, owned by another user
+        others += 1
+    return _live_predicts + others
+
+
+def render_metrics() -> tuple:
+    """Prometheus exposition payload and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,123 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import gzip
+import json
+
+from fastapi import HTTPException, Request, Response
+
+try:
+    import orjson
+except ImportError:  # Optional: faster compact JSON encoding
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional: enables the MessagePack payload
+    msgpack = None
+
+# Opt-in compact payloads: detections as parallel arrays instead of a list of objects
+COMPACT_JSON_MEDIA_TYPE = "application/vnd.thread-roll.compact+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+PAYLOAD_FORMATS = ("json", "compact", "msgpack")
+COMPACT_FORMAT_VERSION = 1
+
+COMPRESS_MIN_BYTES = 1400          # Bodies above about one packet are gzipped if the client accepts it
+COMPRESS_LEVEL = 6
+
+
+def negotiate_format(request: Request, requested: Optional[str] = None) -> str:
+    """
+    Payload format for a response: the ?format= flag, else the Accept header, else "json".
+
+    Raises:
+        HTTPException 406: MessagePack was asked for but msgpack is not installed
+    """
+    fmt = requested
+    if fmt is None:
+        accept = request.headers.get("accept", "")
+        if MSGPACK_MEDIA_TYPE in accept or "application/x-msgpack" in accept:
+            fmt = "msgpack"
+        elif COMPACT_JSON_MEDIA_TYPE in accept:
+            fmt = "compact"
+        else:
+            fmt = "json"
+    if fmt == "msgpack" and msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack payloads require the msgpack package")
+    return fmt
+
+
+def compact_detections(detections: List[Dict]) -> Dict:
+    """
+    Detections as parallel arrays.
+
+    bboxes is flat [x1, y1, x2, y2, ...] rounded to 0.1 px, confidences are
+    rounded to 3 decimals, colors and classes are indices into name
+    tables, and ids are implicit (1..n in order). centers is flat [x, y, ...]
+    for center-hole detections and null for YOLO ones.
+    """
+    # Count-only results have color None, which can't be ordered against names
+    color_names = sorted({d["color"] for d in detections}, key=str)
+    class_names = sorted({d.get("class", "thread_roll") for d in detections}, key=str)
+    color_index = {name: i for i, name in enumerate(color_names)}
+    class_index = {name: i for i, name in enumerate(class_names)}
+
+    bboxes, centers = [], []
+    for d in detections:
+        bboxes.extend(round(float(v), 1) for v in d["bbox"])
+        if "center" in d:
+            centers.extend(int(v) for v in d["center"])
+    return {
+        "count": len(detections),
+        "bboxes": bboxes,
+        "centers": centers if detections and len(centers) == 2 * len(detections) else None,
+        "confidences": [round(float(d["confidence"]), 3) for d in detections],
+        "color_names": color_names,
+        "colors": [color_index[d["color"]] for d in detections],
+        "class_names": class_names,
+        "classes": [class_index[d.get("class", "thread_roll")] for d in detections],
+    }
+
+
+def compact_record(record: Dict) -> Dict:
+    """A record response dict with its detections as compact_detections(); "v" is the layout version."""
+    compact = {key: value for key, value in record.items() if key != "detections" and value is not None}
+    if isinstance(compact.get("created_at"), datetime):
+        compact["created_at"] = compact["created_at"].isoformat()
+    compact["detections"] = compact_detections(record.get("detections") or [])
+    compact["v"] = COMPACT_FORMAT_VERSION
+    return compact
+
+
+def _encode(content, fmt: str) -> Tuple[bytes, str]:
+    if fmt == "msgpack":
+        return msgpack.packb(content, use_bin_type=True), MSGPACK_MEDIA_TYPE
+    if orjson is not None:
+        return orjson.dumps(content), COMPACT_JSON_MEDIA_TYPE
+    return json.dumps(content, separators=(",", ":")).encode(), COMPACT_JSON_MEDIA_TYPE
+
+
+def encode_body(request: Request, body: bytes, media_type: str, headers: Optional[Dict] = None) -> Response:
+    """Response for an encoded body, gzipped when large enough and the client accepts gzip."""
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept, Accept-Encoding"
+    if len(body) > COMPRESS_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def compact_response(request: Request, content, fmt: str) -> Response:
+    """
+    Encode record dict(s) in a compact format.
+
+    Args:
+        request: Incoming request (for Accept-Encoding)
+        content: A record dict, or a list of them
+        fmt: "compact" or "msgpack" (see negotiate_format())
+    """
+    if isinstance(content, list):
+        payload = [compact_record(record) for record in content]
+    else:
+        payload = compact_record(content)
+    body, media_type = _encode(payload, fmt)
+    return encode_body(request, body, media_type)
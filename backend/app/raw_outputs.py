@@ -0,0 +1,88 @@
+from typing import Dict, Optional
+import os
+import uuid
+
+import numpy as np
+
+# Sidecars live outside uploads/, which is served as static files
+RAW_OUTPUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "raw_outputs")
+RAW_OUTPUTS_SUFFIX = ".raw.npz"
+
+
+def raw_outputs_path(image_filename: str) -> str:
+    """Sidecar file for the record whose upload is image_filename."""
+    return os.path.join(RAW_OUTPUTS_DIR, image_filename + RAW_OUTPUTS_SUFFIX)
+
+
+def pack_raw_outputs(raw: Dict) -> Dict[str, np.ndarray]:
+    """
+    Raw detector outputs as compact numpy arrays.
+
+    Boxes become float32 (N, 4) coordinates, float32 scores and int16
+    indices into a class-name table; circles int32 (M, 3). A few hundred
+    boxes take a few kilobytes.
+    """
+    arrays = {}
+    boxes = raw.get("boxes")
+    if boxes is not None:
+        class_names = sorted({box["class"] for box in boxes})
+        arrays["boxes"] = np.array([box["bbox"] for box in boxes], dtype=np.float32).reshape(-1, 4)
+        arrays["scores"] = np.array([box["confidence"] for box in boxes], dtype=np.float32)
+        arrays["classes"] = np.array([class_names.index(box["class"]) for box in boxes], dtype=np.int16)
+        arrays["class_names"] = np.array(class_names, dtype=np.str_)
+        arrays["capture_confidence"] = np.float32(raw["capture_confidence"])
+    if raw.get("circles") is not None:
+        arrays["circles"] = np.array(raw["circles"], dtype=np.int32).reshape(-1, 3)
+    if "cage_bbox" in raw:
+        # An empty array records "no cage found", which differs from "not computed"
+        cage_bbox = raw["cage_bbox"]
+        arrays["cage_bbox"] = np.array(cage_bbox if cage_bbox else [], dtype=np.int32)
+    return arrays
+
+
+def unpack_raw_outputs(arrays) -> Dict:
+    """Inverse of pack_raw_outputs(): the dict format of process_image(..., keep_raw=True)."""
+    raw = {}
+    if "boxes" in arrays:
+        class_names = [str(name) for name in arrays["class_names"]]
+        raw["boxes"] = [
+            {"bbox": [float(v) for v in bbox], "confidence": float(score), "class": class_names[cls]}
+            for bbox, score, cls in zip(arrays["boxes"], arrays["scores"], arrays["classes"])
+        ]
+        raw["capture_confidence"] = round(float(arrays["capture_confidence"]), 6)
+    if "circles" in arrays:
+        raw["circles"] = [tuple(int(v) for v in circle) for circle in arrays["circles"]]
+    if "cage_bbox" in arrays:
+        cage_bbox = arrays["cage_bbox"]
+        raw["cage_bbox"] = tuple(int(v) for v in cage_bbox) if cage_bbox.size else None
+    return raw
+
+
+def save_raw_outputs(path: str, raw: Dict):
+    """
+    Write raw detector outputs (see pack_raw_outputs()) as a compressed .npz.
+
+    The file is written next to its final name (under a name of its own, so
+    concurrent writers don't share it) and renamed, so readers never see a
+    partial sidecar.
+    """
+    arrays = pack_raw_outputs(raw)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_raw_outputs(path: str) -> Optional[Dict]:
+    """Read a sidecar back into the dict format of process_image(..., keep_raw=True), or None."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return unpack_raw_outputs(data)
+
+
+def delete_raw_outputs(image_filename: str):
+    path = raw_outputs_path(image_filename)
+    if os.path.exists(path):
+        os.remove(path)
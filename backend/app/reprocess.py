@@ -0,0 +1,278 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from sqlalchemy import and_, exists, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+import os
+import socket
+import threading
+
+from database import Record, RecordVersion, ReprocessCheckpoint, ReprocessRun, SessionLocal
+from metrics import live_predicts
+from routing import model_digest
+from worker_pool import create_detector_pool, default_workers, detect_batch
+
+REPROCESS_BATCH_SIZE = 8           # Images per batched YOLO call
+REPROCESS_NICENESS = 10            # Worker CPU priority below the API process
+BUSY_MAX_INFLIGHT_BATCHES = 1      # Batches in flight while live /predict requests run
+HEARTBEAT_INTERVAL = 5.0           # Seconds between progress/heartbeat updates
+HEARTBEAT_STALE = timedelta(seconds=60)   # Runs without a heartbeat this long are taken over
+RATE_WINDOW = timedelta(seconds=60)       # Throughput (and so ETA) is measured over this window
+ACTIVE_STATUSES = ("pending", "running")
+
+
+def run_progress(db: Session, run: ReprocessRun) -> Dict:
+    """Progress, recent throughput and ETA of a run (works from any API process)."""
+    since = datetime.utcnow() - RATE_WINDOW
+    recent = db.execute(
+        select(func.count()).select_from(ReprocessCheckpoint)
+        .where(ReprocessCheckpoint.run_id == run.id, ReprocessCheckpoint.processed_at >= since)
+    ).scalar_one()
+    images_per_sec = recent / RATE_WINDOW.total_seconds()
+    remaining = max(0, run.total - run.processed)
+    eta = None
+    if run.status == "running" and images_per_sec > 0:
+        eta = remaining / images_per_sec
+
+    return {
+        "id": run.id,
+        "status": run.status,
+        "model_path": run.model_path,
+        "model_sha256": run.model_sha256,
+        "mode": run.mode,
+        "total": run.total,
+        "processed": run.processed,
+        "failed": run.failed,
+        "percent": round(100 * run.processed / run.total, 1) if run.total else 100.0,
+        "images_per_sec": round(images_per_sec, 3),
+        "eta_seconds": round(eta) if eta is not None else None,
+        "error": run.error,
+        "created_at": run.created_at,
+        "started_at": run.started_at,
+        "finished_at": run.finished_at,
+    }
+
+
+class ReprocessManager:
+    """
+    Re-counts historical uploads with a new model in the background.
+
+    A run covers every record that existed when it was created. A driver
+    thread feeds batches of uploads to a niced process pool and stores each
+    result as a RecordVersion; the Record keeps its original counts. Every
+    finished record gets a checkpoint row in the same transaction, so a run
+    interrupted by a restart resumes where it stopped. While live /predict
+    requests are running only one batch is kept in flight.
+
+    Runs are owned through a heartbeat, so with several API processes only
+    one drives a given run and a crashed owner's run is taken over.
+    """
+
+    def __init__(self, uploads_dir: str, confidence_threshold: float):
+        self.uploads_dir = uploads_dir
+        self.confidence_threshold = confidence_threshold
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads: Dict[int, Tuple[threading.Thread, threading.Event]] = {}
+        self._lock = threading.Lock()
+
+    def start_run(self, db: Session, model_path: str, mode: str = "hybrid",
+                  batch_size: int = REPROCESS_BATCH_SIZE, workers: Optional[int] = None) -> ReprocessRun:
+        """Create a run over all current records and start driving it. Raises ValueError if one is active."""
+        if not os.path.exists(model_path):
+            raise ValueError(f"Model file not found at {model_path}")
+        active = db.execute(select(ReprocessRun.id).where(ReprocessRun.status.in_(ACTIVE_STATUSES))).first()
+        if active:
+            raise ValueError(f"Re-processing run {active.id} is still active")
+
+        max_record_id = db.execute(select(func.max(Record.id))).scalar() or 0
+        run = ReprocessRun(
+            model_path=os.path.abspath(model_path),
+            model_sha256=model_digest(model_path),
+            mode=mode,
+            batch_size=batch_size,
+            workers=workers or default_workers(reserve=1),
+            status="pending",
+            max_record_id=max_record_id,
+            total=db.execute(select(func.count()).select_from(Record).where(Record.id <= max_record_id)).scalar_one(),
+        )
+        db.add(run)
+        db.commit()
+        self._launch(run.id)
+        return run
+
+    def pause(self, db: Session, run: ReprocessRun):
+        if run.status not in ACTIVE_STATUSES:
+            raise ValueError(f"Run {run.id} is {run.status}")
+        run.status = "paused"
+        db.commit()
+        self._signal_stop(run.id)
+
+    def resume(self, db: Session, run: ReprocessRun):
+        if run.status not in ("paused", "failed"):
+            raise ValueError(f"Run {run.id} is {run.status}")
+        active = db.execute(
+            select(ReprocessRun.id).where(ReprocessRun.status.in_(ACTIVE_STATUSES), ReprocessRun.id != run.id)
+        ).first()
+        if active:
+            raise ValueError(f"Re-processing run {active.id} is still active")
+        run.status = "pending"
+        run.error = None
+        run.owner = None
+        db.commit()
+        self._launch(run.id)
+
+    def resume_interrupted(self):
+        """Pick up active runs whose owner went away (e.g. after a server restart)."""
+        with SessionLocal() as db:
+            run_ids = db.execute(select(ReprocessRun.id).where(ReprocessRun.status.in_(ACTIVE_STATUSES))).scalars().all()
+        for run_id in run_ids:
+            self._launch(run_id)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop driver threads after their in-flight batches; their runs resume on next start."""
+        with self._lock:
+            threads = list(self._threads.values())
+        for _, stop in threads:
+            stop.set()
+        for thread, _ in threads:
+            thread.join(timeout)
+
+    def _signal_stop(self, run_id: int):
+        with self._lock:
+            entry = self._threads.get(run_id)
+        if entry:
+            entry[1].set()
+
+    def _launch(self, run_id: int):
+        with self._lock:
+            entry = self._threads.get(run_id)
+            if entry and entry[0].is_alive():
+                return
+            stop = threading.Event()
+            thread = threading.Thread(target=self._drive, args=(run_id, stop), name=f"reprocess-{run_id}", daemon=True)
+            self._threads[run_id] = (thread, stop)
+        thread.start()
+
+    def _claim(self, db: Session, run_id: int) -> bool:
+        """Take ownership of a run unless another live process holds it."""
+        now = datetime.utcnow()
+        claimed = db.execute(
+            ReprocessRun.__table__.update()
+            .where(
+                ReprocessRun.id == run_id,
+                ReprocessRun.status.in_(ACTIVE_STATUSES),
+                (ReprocessRun.owner.is_(None)) | (ReprocessRun.owner == self.owner)
+                | (ReprocessRun.heartbeat_at < now - HEARTBEAT_STALE),
+            )
+            .values(owner=self.owner, heartbeat_at=now, status="running")
+        ).rowcount
+        db.commit()
+        return claimed == 1
+
+    def _next_batch(self, db: Session, run: ReprocessRun, after_id: int) -> List[Tuple[int, str]]:
+        """Next records of the run without a checkpoint, in id order."""
+        done = exists().where(and_(ReprocessCheckpoint.run_id == run.id, ReprocessCheckpoint.record_id == Record.id))
+        rows = db.execute(
+            select(Record.id, Record.image_filename)
+            .where(Record.id > after_id, Record.id <= run.max_record_id, ~done)
+            .order_by(Record.id)
+            .limit(run.batch_size)
+        ).all()
+        return [(row.id, row.image_filename) for row in rows]
+
+    def _save(self, db: Session, run: ReprocessRun, outcomes: List[Tuple[int, Dict]]):
+        """Store versions and checkpoints for finished records and refresh the run counters, atomically."""
+        now = datetime.utcnow()
+        versions, checkpoints = [], []
+        for record_id, result in outcomes:
+            error = result.get("error")
+            checkpoints.append({"run_id": run.id, "record_id": record_id, "ok": error is None,
+                                "error": error, "processed_at": now})
+            if error is None:
+                versions.append({
+                    "record_id": record_id,
+                    "run_id": run.id,
+                    "model_sha256": run.model_sha256,
+                    "total_count": result["total_count"],
+                    "color_counts": result["color_counts"],
+                    "raw_detection": result["detections"],
+                    "created_at": now,
+                })
+
+        # A batch replayed after a crash hits the unique keys and is ignored
+        if versions:
+            db.execute(sqlite_insert(RecordVersion).on_conflict_do_nothing(
+                index_elements=["record_id", "run_id"]), versions)
+        db.execute(sqlite_insert(ReprocessCheckpoint).on_conflict_do_nothing(), checkpoints)
+        counts = db.execute(
+            select(func.count(), func.count().filter(ReprocessCheckpoint.ok.is_(False)))
+            .where(ReprocessCheckpoint.run_id == run.id)
+        ).one()
+        run.processed, run.failed = counts
+        run.heartbeat_at = now
+        db.commit()
+
+    def _drive(self, run_id: int, stop: threading.Event):
+        with SessionLocal() as db:
+            if not self._claim(db, run_id):
+                return
+            run = db.get(ReprocessRun, run_id)
+            run.started_at = run.started_at or datetime.utcnow()
+            db.commit()
+
+            pool = create_detector_pool(run.model_path, workers=run.workers,
+                                        confidence_threshold=self.confidence_threshold,
+                                        niceness=REPROCESS_NICENESS)
+            in_flight = {}
+            after_id = 0
+            exhausted = False
+            try:
+                while True:
+                    if not stop.is_set():
+                        limit = run.workers if live_predicts() == 0 else BUSY_MAX_INFLIGHT_BATCHES
+                        while not exhausted and len(in_flight) < limit:
+                            batch = self._next_batch(db, run, after_id)
+                            if not batch:
+                                exhausted = True
+                                break
+                            after_id = batch[-1][0]
+
+                            present, missing = [], []
+                            for record_id, filename in batch:
+                                path = os.path.join(self.uploads_dir, filename)
+                                (present if os.path.exists(path) else missing).append((record_id, path))
+                            if missing:
+                                self._save(db, run, [(record_id, {"error": "Image file missing"})
+                                                     for record_id, _ in missing])
+                            if present:
+                                future = pool.submit(detect_batch, [path for _, path in present], run.mode)
+                                in_flight[future] = [record_id for record_id, _ in present]
+
+                    if not in_flight and (exhausted or stop.is_set()):
+                        break
+
+                    done, _ = wait(in_flight, timeout=HEARTBEAT_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record_ids = in_flight.pop(future)
+                        self._save(db, run, list(zip(record_ids, future.result())))
+
+                    # Heartbeat, and notice a pause requested through another process
+                    run.heartbeat_at = datetime.utcnow()
+                    db.commit()
+                    db.refresh(run)
+                    if run.status != "running":
+                        stop.set()
+
+                db.refresh(run)
+                if exhausted and run.status == "running":
+                    run.status = "completed"
+                    run.finished_at = datetime.utcnow()
+            except Exception as e:
+                db.rollback()
+                run.status = "failed"
+                run.error = f"{type(e).__name__}: {e}"
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+                run.owner = None
+                db.commit()
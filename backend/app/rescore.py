@@ -0,0 +1,74 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+import os
+
+from database import Record
+from raw_outputs import load_raw_outputs, raw_outputs_path, save_raw_outputs
+
+MAX_RESCORE_BATCH = 500          # Record ids per bulk rescore request
+RESCORE_COMMIT_EVERY = 50        # Bulk rescoring commits in chunks of this many records
+
+
+def rescore_record(detector, record: Record, uploads_dir: str, confidence_threshold: Optional[float] = None,
+                   mode: str = "hybrid") -> Dict:
+    """
+    Recompute a record's detections from its raw-output sidecar and update it in place.
+
+    Raises FileNotFoundError when the record has no sidecar or its image is
+    gone, and ValueError when the threshold/mode cannot be served from the
+    stored outputs. The caller commits.
+    """
+    sidecar_path = raw_outputs_path(record.image_filename)
+    raw = load_raw_outputs(sidecar_path)
+    if raw is None:
+        raise FileNotFoundError(f"Record {record.id} has no stored model outputs")
+    image_path = os.path.join(uploads_dir, record.image_filename)
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image for record {record.id} no longer exists")
+
+    had_circles = raw.get("circles") is not None
+    had_cage = "cage_bbox" in raw
+    result = detector.rescore(image_path, raw, confidence_threshold=confidence_threshold, mode=mode)
+    # Hough/cage results computed on demand are cached for the next rescore
+    if (not had_circles and raw.get("circles") is not None) or (not had_cage and "cage_bbox" in raw):
+        save_raw_outputs(sidecar_path, raw)
+
+    record.total_count = result["total_count"]
+    record.color_counts = result["color_counts"]
+    record.raw_detection = result["detections"]
+    return result
+
+
+def rescore_records(db: Session, detector, record_ids: List[int], uploads_dir: str,
+                    confidence_threshold: Optional[float] = None, mode: str = "hybrid") -> Dict:
+    """
+    Rescore many records, skipping (not failing on) records that cannot be rescored.
+
+    Returns {"rescored": [{"id", "previous_total_count", "total_count", "path"}],
+             "skipped": [{"id", "reason"}]}.
+    """
+    rescored, skipped = [], []
+    found = set()
+    for start in range(0, len(record_ids), RESCORE_COMMIT_EVERY):
+        chunk = record_ids[start:start + RESCORE_COMMIT_EVERY]
+        records = db.execute(select(Record).where(Record.id.in_(chunk)).order_by(Record.id)).scalars().all()
+        for record in records:
+            found.add(record.id)
+            previous = record.total_count
+            try:
+                result = rescore_record(detector, record, uploads_dir, confidence_threshold, mode)
+            except (FileNotFoundError, ValueError) as e:
+                skipped.append({"id": record.id, "reason": str(e)})
+                continue
+            rescored.append({
+                "id": record.id,
+                "previous_total_count": previous,
+                "total_count": result["total_count"],
+                "path": result["path"],
+            })
+        db.commit()
+
+    skipped += [{"id": record_id, "reason": "Record not found"}
+                for record_id in dict.fromkeys(record_ids) if record_id not in found]
+    return {"rescored": rescored, "skipped": skipped}
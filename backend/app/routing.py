@@ -0,0 +1,235 @@
+"""
+Per-image choice of detection pipeline for hybrid mode.
+
+Hybrid detection used to run YOLO on every image and fall back to
+center-hole (Hough) detection whenever YOLO found YOLO_MIN_DETECTIONS or
+fewer rolls, so sparse cages always paid for both. PipelineRouter puts
+each image in a bucket from cheap thumbnail features (cage found, density
+of dark blobs the size of center holes, brightness; see
+detection_v2.thumbnail_features) and picks the cheapest route expected to
+give the hybrid answer:
+
+    yolo    YOLO only
+    hough   center holes only
+    both    YOLO and center holes, the old count rule picks the answer
+
+Accuracy is learned at runtime: whenever both paths run, each path's
+count is compared with the answer the count rule picks, per bucket.
+Latency is a moving average per path. Buckets with too few comparisons,
+and every ROUTE_RECHECK_EVERY-th image of a routed bucket, run both.
+
+Routers opened with a decision log append every decision to it as one
+JSON line (model sha256, features, bucket, route, reason, the estimates it
+was based on, the counts and latencies that followed). The tail of the log
+is replayed at startup, so restarts and every API detector process share
+what was learned; entries of other model weights are ignored. The log is
+rotated to "<log>.1" when it reaches ROUTE_LOG_MAX_BYTES. Only the API
+opts in (DEFAULT_ROUTE_LOG); scripts, workers and benchmarks learn in
+memory.
+"""
+
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+import hashlib
+import json
+import os
+import threading
+
+PATHS = ("yolo", "hough")
+ROUTES = PATHS + ("both",)
+
+DENSITY_BINS = (30, 90)            # Dark blobs per 10k thumbnail pixels: sparse / medium / dense
+BRIGHTNESS_BINS = (90, 170)        # Mean thumbnail gray level: dark / normal / bright
+ROUTE_TOLERANCE = 0.05             # Relative count error a single path may have against the hybrid answer
+ROUTE_MIN_SAMPLES = 5              # Images of a bucket that run both paths before it is routed
+ROUTE_RECHECK_EVERY = 20           # Afterwards every Nth image of the bucket runs both again
+ROUTE_WINDOW = 50                  # Recent comparisons per bucket the error estimates use
+LATENCY_SMOOTHING = 0.1            # Weight of a new sample in the per-path latency average
+ROUTE_LOG_REPLAY_BYTES = 2 << 20   # Tail of the decision log replayed at startup
+ROUTE_LOG_MAX_BYTES = 16 << 20     # The log is rotated to "<log>.1" at this size
+
+# Decision log of the API's detector; THREAD_ROLL_ROUTE_LOG="" turns it (and its replay) off
+DEFAULT_ROUTE_LOG = os.environ.get(
+    "THREAD_ROLL_ROUTE_LOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "route_decisions.jsonl"))
+
+
+def model_digest(path: str) -> str:
+    """sha256 of a weights file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def feature_bucket(features: Dict) -> str:
+    """Bucket key such as "cage/dense/normal" for thumbnail features."""
+    density = features["dark_blob_density"]
+    brightness = features["brightness"]
+    return "/".join((
+        "cage" if features["cage_found"] else "nocage",
+        "sparse" if density < DENSITY_BINS[0] else "medium" if density < DENSITY_BINS[1] else "dense",
+        "dark" if brightness < BRIGHTNESS_BINS[0] else "normal" if brightness < BRIGHTNESS_BINS[1] else "bright",
+    ))
+
+
+class PipelineRouter:
+    """
+    Chooses yolo / hough / both per image from its bucket's runtime statistics.
+
+    Thread-safe; each process has its own instance, warmed from the shared
+    decision log if it has one.
+
+    Args:
+        log_path: Decision log to replay and append to; None keeps the statistics in memory
+        model: sha256 of the YOLO weights; only log entries of the same model are replayed
+    """
+
+    def __init__(self, log_path: Optional[str] = None, model: Optional[str] = None,
+                 tolerance: float = ROUTE_TOLERANCE, min_samples: int = ROUTE_MIN_SAMPLES,
+                 recheck_every: int = ROUTE_RECHECK_EVERY):
+        self.log_path = log_path
+        self.model = model
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.recheck_every = recheck_every
+        self.errors: Dict[str, Dict[str, deque]] = {}   # bucket -> path -> recent relative errors
+        self.decisions: Dict[str, int] = {}             # bucket -> decisions made by this process
+        self.latency_ms: Dict[str, float] = {}          # path -> moving average
+        self._lock = threading.Lock()
+        if log_path:
+            self.replay(log_path)
+
+    def choose(self, features: Dict, image: Optional[str] = None) -> Dict:
+        """
+        Route for an image with these thumbnail features.
+
+        Returns:
+            Decision dict (bucket, route, reason, features, estimates) to pass to record()
+        """
+        bucket = feature_bucket(features)
+        with self._lock:
+            self.decisions[bucket] = self.decisions.get(bucket, 0) + 1
+            estimates = self._estimates(bucket)
+            samples = estimates["yolo"]["samples"]
+            if samples < self.min_samples:
+                route, reason = "both", f"exploring: {samples}/{self.min_samples} comparisons in {bucket}"
+            elif self.decisions[bucket] % self.recheck_every == 0:
+                route, reason = "both", f"periodic re-check of {bucket}"
+            else:
+                route, reason = self._cheapest(bucket, estimates)
+
+        return {
+            "image": os.path.basename(image) if isinstance(image, str) else None,
+            "bucket": bucket,
+            "route": route,
+            "reason": reason,
+            "features": features,
+            "estimates": estimates,
+        }
+
+    def _estimates(self, bucket: str) -> Dict:
+        errors = self.errors.get(bucket, {})
+        estimates = {}
+        for path in PATHS:
+            recent = errors.get(path, ())
+            estimates[path] = {
+                "error": round(sum(recent) / len(recent), 4) if recent else None,
+                "samples": len(recent),
+                "latency_ms": round(self.latency_ms[path], 1) if path in self.latency_ms else None,
+            }
+        return estimates
+
+    def _cheapest(self, bucket: str, estimates: Dict):
+        accurate = [path for path in PATHS if estimates[path]["error"] <= self.tolerance]
+        if not accurate:
+            errors = ", ".join(f"{path} {estimates[path]['error']:.1%}" for path in PATHS)
+            return "both", f"no single path within {self.tolerance:.0%} in {bucket} ({errors})"
+
+        # A path never timed yet counts as slowest
+        route = min(accurate, key=lambda path: estimates[path]["latency_ms"]
+                    if estimates[path]["latency_ms"] is not None else float("inf"))
+        chosen = estimates[route]
+        reason = (f"{route} within {self.tolerance:.0%} in {bucket} "
+                  f"(error {chosen['error']:.1%} over {chosen['samples']} images")
+        other = estimates[PATHS[1 - PATHS.index(route)]]
+        if chosen["latency_ms"] is not None and other["latency_ms"] is not None:
+            reason += f", ~{chosen['latency_ms']:.0f} ms vs ~{other['latency_ms']:.0f} ms"
+        return route, reason + ")"
+
+    def record(self, decision: Dict, path: str, counts: Dict[str, int], latency_ms: Dict[str, float],
+               source: str = "detect"):
+        """
+        Learn from a routed image and append the decision and its outcome to the log.
+
+        Args:
+            decision: From choose()
+            path: Path whose detections were returned
+            counts: Roll count of every path that ran
+            latency_ms: Time of every path that ran; empty when not representative (e.g. rescoring)
+            source: What made the decision ("detect" or "rescore"), for the log
+        """
+        entry = dict(decision, time=datetime.utcnow().isoformat(), model=self.model, source=source, path=path,
+                     counts=counts, latency_ms={p: round(ms, 1) for p, ms in latency_ms.items()})
+        with self._lock:
+            self._learn(entry)
+            if self.log_path:
+                try:
+                    self._rotate_log()
+                    with open(self.log_path, "a") as f:
+                        f.write(json.dumps(entry) + "\n")
+                except OSError as e:
+                    print(f"⚠️  Could not write route decision log: {e}")
+
+    def _rotate_log(self):
+        """Move a full decision log to "<log>.1", replacing the previous one."""
+        try:
+            size = os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return
+        if size >= ROUTE_LOG_MAX_BYTES:
+            # Another process may have rotated it first
+            try:
+                os.replace(self.log_path, self.log_path + ".1")
+            except FileNotFoundError:
+                pass
+
+    def _learn(self, entry: Dict):
+        counts = entry.get("counts") or {}
+        if all(path in counts for path in PATHS):
+            answer = max(counts[entry["path"]], 1)
+            errors = self.errors.setdefault(entry["bucket"], {})
+            for path in PATHS:
+                errors.setdefault(path, deque(maxlen=ROUTE_WINDOW)).append(
+                    abs(counts[path] - counts[entry["path"]]) / answer)
+        for path, ms in (entry.get("latency_ms") or {}).items():
+            previous = self.latency_ms.get(path)
+            self.latency_ms[path] = ms if previous is None else previous + LATENCY_SMOOTHING * (ms - previous)
+
+    def replay(self, log_path: str):
+        """Learn from the tail of an existing decision log (unreadable lines and other models' are skipped)."""
+        if not os.path.exists(log_path):
+            return
+        offset = max(0, os.path.getsize(log_path) - ROUTE_LOG_REPLAY_BYTES)
+        with open(log_path, "rb") as f:
+            f.seek(offset)
+            lines = f.read().split(b"\n")
+        if offset:
+            lines = lines[1:]  # Started mid-line
+        with self._lock:
+            for line in lines:
+                try:
+                    entry = json.loads(line)
+                    if entry.get("model") == self.model:
+                        self._learn(entry)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    continue
+
+    def snapshot(self) -> Dict:
+        """Current estimates per bucket and per-path latency (for inspection)."""
+        with self._lock:
+            return {
+                "buckets": {bucket: self._estimates(bucket) for bucket in sorted(self.errors)},
+                "latency_ms": dict(self.latency_ms),
+            }
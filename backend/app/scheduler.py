@@ -0,0 +1,221 @@
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Optional
+import contextvars
+import threading
+import time
+
+from metrics import (LANE_QUEUE_DEPTH, LANE_SLO_MISSES, LANE_WAIT_SECONDS, add_stage, collect_timings,
+                     deferred_timings, merge_timings)
+
+# Share of detector time each lane gets while both have work queued
+LANE_WEIGHTS = {"interactive": 8, "bulk": 1}
+# Images per detector call; bulk work is batched, and only yields to other lanes between batches
+LANE_BATCH_SIZES = {"interactive": 1, "bulk": 4}
+# Lanes with a latency objective (seconds from submit to result)
+LANE_SLOS = {"interactive": 2.0}
+LANES = tuple(LANE_WEIGHTS)
+
+SERVICE_TIME_SMOOTHING = 0.2   # EWMA factor for the per-image detection time of each lane
+
+
+class _Request:
+    __slots__ = ("lane", "image_path", "mode", "keep_raw", "colors", "context", "future", "enqueued_at",
+                 "finish_tag")
+
+    def __init__(self, lane: str, image_path: str, mode: str, keep_raw: bool, colors: bool = True):
+        self.lane = lane
+        self.image_path = image_path
+        self.mode = mode
+        self.keep_raw = keep_raw
+        self.colors = colors
+        # Run in the submitter's context so its collect_timings() sees the detector stages
+        self.context = contextvars.copy_context()
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.finish_tag = 0.0
+
+
+def _options(request: _Request):
+    """Detector options a batch must share."""
+    return request.mode, request.keep_raw, request.colors
+
+
+class InferenceScheduler:
+    """
+    Priority lanes with weighted fair queuing in front of one detector.
+
+    The detector is driven by a single dispatcher thread. Each lane has its
+    own queue; requests get a virtual finish tag of 1/weight after the
+    lane's previous one (self-clocked fair queuing), and the dispatcher
+    serves the lane whose head has the smallest tag, so a busy bulk lane
+    cannot starve interactive requests and vice versa. A lane head about to
+    miss its lane's SLO is served first regardless of tags.
+
+    Bulk requests run in batches (one batched YOLO pass); the next lane is
+    picked between batches, which is where interactive requests preempt.
+    """
+
+    def __init__(self, get_detector: Callable, weights: Dict[str, float] = LANE_WEIGHTS,
+                 batch_sizes: Dict[str, int] = LANE_BATCH_SIZES, slos: Dict[str, float] = LANE_SLOS):
+        self._get_detector = get_detector
+        self.weights = dict(weights)
+        self.batch_sizes = {lane: batch_sizes.get(lane, 1) for lane in self.weights}
+        self.slos = {lane: slo for lane, slo in slos.items() if lane in self.weights}
+        self._queues: Dict[str, Deque[_Request]] = {lane: deque() for lane in self.weights}
+        self._last_finish = {lane: 0.0 for lane in self.weights}
+        self._service_time = {lane: 0.0 for lane in self.weights}
+        self._virtual_time = 0.0
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """Start the dispatcher thread (idempotent)."""
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Finish queued requests and stop the dispatcher thread."""
+        with self._condition:
+            thread = self._thread
+            self._thread = None
+            self._stopping = True
+            self._condition.notify()
+        if thread is not None and thread.is_alive():
+            thread.join()
+
+    def submit(self, image_path: str, lane: str = "interactive", mode: str = "hybrid",
+               keep_raw: bool = False, colors: bool = True) -> Future:
+        """
+        Queue an image for detection.
+
+        Args:
+            image_path: Path to the input image, or the decoded BGR image
+            lane: Priority lane, one of LANES
+            mode: Detection mode, see ThreadRollDetectorV2.detect_rolls()
+            keep_raw: Also return the raw model outputs (see process_image())
+            colors: Classify colors (see process_image())
+
+        Returns:
+            Future resolving to the process_image() result
+        """
+        if lane not in self._queues:
+            raise ValueError(f"Unknown lane: {lane}")
+        self.start()
+        request = _Request(lane, image_path, mode, keep_raw, colors)
+        with self._condition:
+            start = max(self._virtual_time, self._last_finish[lane])
+            request.finish_tag = start + 1.0 / self.weights[lane]
+            self._last_finish[lane] = request.finish_tag
+            self._queues[lane].append(request)
+            LANE_QUEUE_DEPTH.labels(lane=lane).set(len(self._queues[lane]))
+            self._condition.notify()
+        return request.future
+
+    def depths(self) -> Dict[str, int]:
+        """Requests waiting in each lane."""
+        with self._condition:
+            return {lane: len(queue) for lane, queue in self._queues.items()}
+
+    def _pick_lane(self) -> Optional[str]:
+        """Lane to serve next (lock held): an SLO lane at risk, else the smallest finish tag."""
+        now = time.monotonic()
+        for lane, slo in self.slos.items():
+            queue = self._queues[lane]
+            if queue and now - queue[0].enqueued_at + self._service_time[lane] >= slo:
+                return lane
+        heads = [(queue[0].finish_tag, lane) for lane, queue in self._queues.items() if queue]
+        return min(heads)[1] if heads else None
+
+    def _next_batch(self) -> List[_Request]:
+        """Pop the next batch (lock held): same-lane requests with the same options, up to the lane's batch size."""
+        lane = self._pick_lane()
+        if lane is None:
+            return []
+        queue = self._queues[lane]
+        batch = [queue.popleft()]
+        while (queue and len(batch) < self.batch_sizes[lane]
+               and _options(queue[0]) == _options(batch[0])):
+            batch.append(queue.popleft())
+        self._virtual_time = max(self._virtual_time, batch[-1].finish_tag)
+        LANE_QUEUE_DEPTH.labels(lane=lane).set(len(queue))
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                batch = self._next_batch()
+                while not batch:
+                    if self._stopping:
+                        return
+                    self._condition.wait()
+                    batch = self._next_batch()
+
+            # Requests whose caller went away (future cancelled) are dropped here
+            batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch: List[_Request]):
+        lane = batch[0].lane
+        started = time.monotonic()
+        waits = [started - request.enqueued_at for request in batch]
+        for wait in waits:
+            LANE_WAIT_SECONDS.labels(lane=lane).observe(wait)
+
+        try:
+            detector = self._get_detector()
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        if len(batch) == 1 or not hasattr(detector, "process_batch"):
+            for request, wait in zip(batch, waits):
+                request.context.run(self._process_one, detector, request, wait)
+        else:
+            try:
+                # Per-image timings are observed once they are merged into each request's context
+                with deferred_timings():
+                    results = detector.process_batch([r.image_path for r in batch], mode=batch[0].mode,
+                                                     keep_raw=batch[0].keep_raw, colors=batch[0].colors)
+            except Exception:
+                # One bad image fails the whole batch; retry one at a time so it only fails itself
+                for request, wait in zip(batch, waits):
+                    request.context.run(self._process_one, detector, request, wait)
+            else:
+                for request, result, wait in zip(batch, results, waits):
+                    request.context.run(self._complete_batched, request, result, wait)
+
+        elapsed = time.monotonic() - started
+        per_image = elapsed / len(batch)
+        previous = self._service_time[lane]
+        self._service_time[lane] = (per_image if previous == 0.0
+                                    else previous + SERVICE_TIME_SMOOTHING * (per_image - previous))
+        slo = self.slos.get(lane)
+        if slo is not None:
+            for wait in waits:
+                if wait + elapsed > slo:
+                    LANE_SLO_MISSES.labels(lane=lane).inc()
+
+    def _process_one(self, detector, request: _Request, wait: float):
+        add_stage("queue_wait", wait)
+        try:
+            result = detector.process_image(request.image_path, mode=request.mode, keep_raw=request.keep_raw,
+                                            colors=request.colors)
+        except Exception as e:
+            request.future.set_exception(e)
+        else:
+            request.future.set_result(result)
+
+    @staticmethod
+    def _complete_batched(request: _Request, result: Dict, wait: float):
+        """Resolve a batched request in its own context, with its queue wait and detector stages."""
+        with collect_timings():
+            add_stage("queue_wait", wait)
+            merge_timings(result.get("timings"))
+        request.future.set_result(result)
@@ -0,0 +1,110 @@
+from sqlalchemy import column, exists, literal_column, select, table
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from database import Record, RecordColor
+
+# Full-text index over Record.description, maintained by triggers (see database.SEARCH_SCHEMA)
+records_fts = table("records_fts", column("rowid"))
+
+MAX_SEARCH_LIMIT = 500
+
+
+def parse_color_filter(value: str) -> Tuple[str, int]:
+    """
+    Parse a color filter of the form "pink" (present) or "pink:10" (at least 10 pink rolls).
+
+    Returns:
+        (color, minimum count)
+    """
+    color, _, minimum = value.partition(":")
+    color = color.strip()
+    if not color:
+        raise ValueError(f"Invalid color filter: {value!r}")
+    if not minimum:
+        return color, 1
+    try:
+        count = int(minimum)
+    except ValueError:
+        raise ValueError(f"Invalid minimum count in color filter: {value!r}")
+    # "pink:0" would match every record, pink or not
+    if count < 1:
+        raise ValueError(f"Minimum count in color filter must be at least 1: {value!r}")
+    return color, count
+
+
+def to_fts_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 query matching records that contain every word.
+
+    Words are quoted so punctuation cannot be read as FTS syntax; a trailing
+    "*" keeps its prefix-match meaning.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def search_records(
+    db: Session,
+    q: Optional[str] = None,
+    user: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    min_total: Optional[int] = None,
+    max_total: Optional[int] = None,
+    colors: Optional[List[Tuple[str, int]]] = None,
+    limit: int = 50,
+    offset: int = 0,
+) -> List[Record]:
+    """
+    Find records by description keywords and indexed filters.
+
+    Args:
+        db: Database session
+        q: Words that must all appear in the description
+        user: Exact user name
+        start: Created at or after this time
+        end: Created before this time
+        min_total: Minimum total_count
+        max_total: Maximum total_count
+        colors: (color, minimum count) pairs that must all hold
+        limit: Page size
+        offset: Rows to skip
+
+    Returns:
+        Matching records, most recent (highest id) first
+    """
+    query = select(Record)
+    order_by = Record.id.desc()
+
+    fts_query = to_fts_query(q) if q else ""
+    if fts_query:
+        # Drive the scan from the FTS index, which yields matches in rowid order
+        query = query.join(records_fts, records_fts.c.rowid == Record.id)
+        query = query.where(literal_column("records_fts").op("MATCH")(fts_query))
+        order_by = records_fts.c.rowid.desc()
+    if user is not None:
+        query = query.where(Record.user == user)
+    if start is not None:
+        query = query.where(Record.created_at >= start)
+    if end is not None:
+        query = query.where(Record.created_at < end)
+    if min_total is not None:
+        query = query.where(Record.total_count >= min_total)
+    if max_total is not None:
+        query = query.where(Record.total_count <= max_total)
+    for color, minimum in colors or []:
+        # Correlated EXISTS probes the (record_id, color) key and stops at the page limit
+        query = query.where(exists().where(
+            RecordColor.record_id == Record.id, RecordColor.color == color, RecordColor.count >= minimum
+        ))
+
+    query = query.order_by(order_by)
+    query = query.limit(min(limit, MAX_SEARCH_LIMIT)).offset(offset)
+    return list(db.scalars(query))
@@ -0,0 +1,167 @@
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database import (
+    ANONYMOUS_USER,
+    ROLLUP_BUCKET_FORMATS,
+    ROLLUP_GRANULARITIES,
+    ColorRollup,
+    Record,
+    RollupBucket,
+    rollup_bucket_start,
+)
+
+
+def _bucket_filters(model, granularity: str, start: Optional[datetime], end: Optional[datetime],
+                    user: Optional[str]) -> List:
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}")
+
+    filters = [model.granularity == granularity]
+    if start is not None:
+        filters.append(model.bucket_start >= rollup_bucket_start(start, granularity))
+    if end is not None:
+        filters.append(model.bucket_start < end)
+    if user is not None:
+        filters.append(model.user == user)
+    return filters
+
+
+def color_stats(
+    db: Session,
+    granularity: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user: Optional[str] = None,
+    by_user: bool = False,
+) -> List[Dict]:
+    """
+    Record, roll and per-color totals per time bucket, read from the rollup tables.
+
+    Args:
+        db: Database session
+        granularity: "hour" or "day"
+        start: Include buckets containing or after this time
+        end: Include buckets starting before this time
+        user: Only count records from this user
+        by_user: Split every bucket per user instead of summing across users
+
+    Returns:
+        List of bucket dictionaries ordered by bucket_start
+    """
+    group_by = [RollupBucket.bucket_start] + ([RollupBucket.user] if by_user else [])
+    bucket_rows = db.execute(
+        select(*group_by, func.sum(RollupBucket.record_count), func.sum(RollupBucket.roll_count))
+        .where(*_bucket_filters(RollupBucket, granularity, start, end, user))
+        .group_by(*group_by)
+        .having(func.sum(RollupBucket.record_count) > 0)
+        .order_by(*group_by)
+    ).all()
+
+    color_group_by = [ColorRollup.bucket_start] + ([ColorRollup.user] if by_user else [])
+    color_rows = db.execute(
+        select(*color_group_by, ColorRollup.color, func.sum(ColorRollup.roll_count))
+        .where(*_bucket_filters(ColorRollup, granularity, start, end, user))
+        .group_by(*color_group_by, ColorRollup.color)
+        .having(func.sum(ColorRollup.roll_count) != 0)
+    ).all()
+
+    colors: Dict[tuple, Dict[str, int]] = {}
+    for row in color_rows:
+        *key, color, count = row
+        colors.setdefault(tuple(key), {})[color] = count
+
+    buckets = []
+    for row in bucket_rows:
+        *key, record_count, roll_count = row
+        bucket = {
+            "bucket_start": key[0],
+            "record_count": record_count,
+            "roll_count": roll_count,
+            "color_counts": colors.get(tuple(key), {}),
+        }
+        if by_user:
+            bucket["user"] = key[1] or None
+        buckets.append(bucket)
+    return buckets
+
+
+def user_stats(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
+    """
+    Record, roll and per-color totals per user over a time range (day resolution).
+
+    Returns:
+        List of per-user dictionaries ordered by roll count, largest first
+    """
+    bucket_rows = db.execute(
+        select(RollupBucket.user, func.sum(RollupBucket.record_count), func.sum(RollupBucket.roll_count))
+        .where(*_bucket_filters(RollupBucket, "day", start, end, None))
+        .group_by(RollupBucket.user)
+        .having(func.sum(RollupBucket.record_count) > 0)
+        .order_by(func.sum(RollupBucket.roll_count).desc())
+    ).all()
+
+    color_rows = db.execute(
+        select(ColorRollup.user, ColorRollup.color, func.sum(ColorRollup.roll_count))
+        .where(*_bucket_filters(ColorRollup, "day", start, end, None))
+        .group_by(ColorRollup.user, ColorRollup.color)
+        .having(func.sum(ColorRollup.roll_count) != 0)
+    ).all()
+
+    colors: Dict[str, Dict[str, int]] = {}
+    for user, color, count in color_rows:
+        colors.setdefault(user, {})[color] = count
+
+    return [
+        {
+            "user": user or None,
+            "record_count": record_count,
+            "roll_count": roll_count,
+            "color_counts": colors.get(user, {}),
+        }
+        for user, record_count, roll_count in bucket_rows
+    ]
+
+
+def rebuild_rollups(db: Session) -> Dict:
+    """
+    Recompute every rollup bucket from the records table and commit.
+
+    Returns:
+        Number of bucket and color rows written
+    """
+    db.execute(delete(ColorRollup))
+    db.execute(delete(RollupBucket))
+
+    for granularity in ROLLUP_GRANULARITIES:
+        params = {"granularity": granularity, "fmt": ROLLUP_BUCKET_FORMATS[granularity], "anon": ANONYMOUS_USER}
+        db.execute(text(
+            "INSERT INTO rollup_buckets (granularity, bucket_start, user, record_count, roll_count) "
+            "SELECT :granularity, strftime(:fmt, created_at), COALESCE(user, :anon), COUNT(*), SUM(total_count) "
+            "FROM records WHERE created_at IS NOT NULL "
+            "GROUP BY strftime(:fmt, created_at), COALESCE(user, :anon)"
+        ), params)
+        db.execute(text(
+            "INSERT INTO color_rollups (granularity, bucket_start, user, color, roll_count) "
+            "SELECT :granularity, strftime(:fmt, r.created_at), COALESCE(r.user, :anon), j.key, SUM(j.value) "
+            "FROM records AS r, json_each(r.color_counts) AS j WHERE r.created_at IS NOT NULL "
+            "GROUP BY strftime(:fmt, r.created_at), COALESCE(r.user, :anon), j.key"
+        ), params)
+
+    db.commit()
+    return {
+        "buckets": db.scalar(select(func.count()).select_from(RollupBucket)),
+        "color_buckets": db.scalar(select(func.count()).select_from(ColorRollup)),
+    }
+
+
+def backfill_rollups(db: Session) -> bool:
+    """Rebuild the rollups if they are empty but records exist (e.g. a database from before rollups)."""
+    has_rollups = db.scalar(select(RollupBucket.granularity).limit(1)) is not None
+    has_records = db.scalar(select(Record.id).limit(1)) is not None
+    if has_records and not has_rollups:
+        rebuild_rollups(db)
+        return True
+    return False
@@ -0,0 +1,77 @@
+from typing import Dict, List
+import random
+import time
+
+import cv2
+import numpy as np
+
+from metrics import collect_timings, set_path, stage
+
+STUB_COLORS = ["yellow", "pink", "orange_brown", "white"]
+
+
+class StubDetector:
+    """
+    Stand-in for ThreadRollDetectorV2 that needs no model weights.
+
+    Selected with THREAD_ROLL_DETECTOR=stub so the HTTP stack can be
+    load-tested in isolation. It decodes the image like the real detector
+    (so upload size still matters), sleeps for a fixed "inference" time and
+    returns a deterministic grid of detections in the same result format.
+    """
+
+    def __init__(self, latency_ms: float = 50.0, rolls: int = 60):
+        self.latency_ms = latency_ms
+        self.rolls = rolls
+
+    def detect_rolls(self, image_path: str, mode: str = "hybrid", colors: bool = True) -> List[Dict]:
+        with stage("decode"):
+            image = image_path if isinstance(image_path, np.ndarray) else cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Could not read image: {image_path}")
+        height, width = image.shape[:2]
+
+        set_path("stub")
+        with stage("inference"):
+            time.sleep(self.latency_ms / 1000)
+
+        rng = random.Random(width * height)
+        columns = max(1, int(self.rolls ** 0.5))
+        cell_w, cell_h = width / columns, height / (self.rolls / columns + 1)
+        detections = []
+        for i in range(self.rolls):
+            cx = (i % columns + 0.5) * cell_w
+            cy = (i // columns + 0.5) * cell_h
+            detections.append({
+                "id": i + 1,
+                "bbox": [cx - cell_w / 2, cy - cell_h / 2, cx + cell_w / 2, cy + cell_h / 2],
+                "confidence": round(rng.uniform(0.5, 1.0), 3),
+                "color": rng.choice(STUB_COLORS) if colors else None,
+                "center": (int(cx), int(cy)),
+                "class": "thread_roll"
+            })
+        return detections
+
+    def process_image(self, image_path: str, mode: str = "hybrid", keep_raw: bool = False,
+                      colors: bool = True) -> Dict:
+        # No raw outputs: stub records cannot be rescored
+        with collect_timings() as timings:
+            with timings.stage("detect"):
+                detections = self.detect_rolls(image_path, mode=mode, colors=colors)
+
+        color_counts = {}
+        for detection in detections:
+            if detection["color"] is not None:
+                color_counts[detection["color"]] = color_counts.get(detection["color"], 0) + 1
+
+        return {
+            "total_count": len(detections),
+            "color_counts": color_counts,
+            "detections": detections,
+            "timings": timings.as_dict()
+        }
+
+    def process_batch(self, image_paths: List[str], mode: str = "hybrid", keep_raw: bool = False,
+                      colors: bool = True) -> List[Dict]:
+        return [self.process_image(image_path, mode=mode, keep_raw=keep_raw, colors=colors)
+                for image_path in image_paths]
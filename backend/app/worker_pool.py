@@ -0,0 +1,102 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import contextlib
+import io
+import multiprocessing
+import os
+import signal
+
+import cv2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Detector owned by this worker process, loaded once by the pool initializer
+_detector = None
+
+
+def is_image(path: str) -> bool:
+    """Image file the detector can read, judged by extension (hidden files are skipped)."""
+    name = os.path.basename(path)
+    return not name.startswith(".") and name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def default_workers(reserve: int = 0) -> int:
+    """Worker count for a pool: one per core, minus cores reserved for other work."""
+    return max(1, (os.cpu_count() or 1) - reserve)
+
+
+def load_detector(model_path: str, confidence_threshold: float, route_log: Optional[str] = None):
+    """
+    The detector selected by THREAD_ROLL_DETECTOR ("stub" = weight-free StubDetector for load tests).
+
+    route_log is the hybrid router's decision log (see routing.py); only the API passes one.
+    """
+    if os.environ.get("THREAD_ROLL_DETECTOR", "yolo") == "stub":
+        from stub_detector import StubDetector
+        return StubDetector(latency_ms=float(os.environ.get("THREAD_ROLL_STUB_LATENCY_MS", "50")))
+
+    from detection_v2 import ThreadRollDetectorV2
+    return ThreadRollDetectorV2(model_path, confidence_threshold=confidence_threshold, route_log=route_log)
+
+
+def _init_worker(model_path: str, confidence_threshold: float, niceness: int):
+    global _detector
+    # The parent shuts the pool down; don't die mid-batch on a terminal Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if niceness:
+        os.nice(niceness)
+    # Parallelism comes from the pool; avoid every worker spawning a thread per core
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        _detector = load_detector(model_path, confidence_threshold)
+
+
+def _error_result(error: Exception) -> Dict:
+    return {"error": f"{type(error).__name__}: {error}"}
+
+
+def detect_batch(image_paths: List[str], mode: str = "hybrid", keep_raw: bool = False) -> List[Dict]:
+    """
+    Run the worker's detector over a batch (one batched YOLO pass).
+
+    If the batch fails (e.g. one unreadable image), the images are retried
+    one at a time so a single bad file only fails itself; its result is
+    {"error": "..."} instead of a detection result.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            return _detector.process_batch(image_paths, mode=mode, keep_raw=keep_raw)
+        except Exception as e:
+            if len(image_paths) == 1:
+                return [_error_result(e)]
+
+        results = []
+        for image_path in image_paths:
+            try:
+                results.append(_detector.process_image(image_path, mode=mode, keep_raw=keep_raw))
+            except Exception as e:
+                results.append(_error_result(e))
+        return results
+
+
+def create_detector_pool(model_path: str, workers: Optional[int] = None, confidence_threshold: float = 0.5,
+                         niceness: int = 0) -> ProcessPoolExecutor:
+    """
+    Process pool whose workers each load their own ThreadRollDetectorV2.
+
+    Submit work with pool.submit(detect_batch, image_paths, mode). Workers
+    are spawned (not forked) so no model or DB state leaks in from the
+    parent; niceness > 0 lowers their CPU priority below the API process.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers or default_workers(),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model_path, confidence_threshold, niceness),
+    )
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Before/after benchmark for the async database path.
+
+Serves the same record lookup three ways and drives each with concurrent
+in-process HTTP requests:
+
+  sync        - `def` handler with a blocking Session (runs in the threadpool)
+  async-sync  - `async def` handler with a blocking Session (the old /predict
+                commit: DB I/O on the event loop)
+  async       - `async def` handler with an AsyncSession (aiosqlite)
+
+Besides throughput and latency it reports the worst event-loop stall seen
+while the load ran, which is what the old paths inflate.
+
+Usage:
+    python benchmarks/async_db_concurrency.py --concurrency 64 --requests 2000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+_tmp_dir = tempfile.mkdtemp(prefix="thread_roll_bench_")
+os.environ["THREAD_ROLL_DB_PATH"] = os.path.join(_tmp_dir, "bench.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI, HTTPException  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from database import Record, SessionLocal, async_engine, get_async_db, get_db, init_db  # noqa: E402
+
+SEED_RECORDS = 500
+
+
+def seed():
+    init_db()
+    db = SessionLocal()
+    try:
+        detections = [{"id": i, "bbox": [0.0, 0.0, 40.0, 40.0], "confidence": 0.9,
+                       "color": "yellow", "class": "thread_roll"} for i in range(1, 101)]
+        db.add_all([
+            Record(image_filename=f"seed_{i}.jpg", total_count=100, color_counts={"yellow": 100},
+                   raw_detection=detections, created_at=datetime.utcnow())
+            for i in range(SEED_RECORDS)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    def _payload(record):
+        if record is None:
+            raise HTTPException(status_code=404)
+        return {"id": record.id, "total_count": record.total_count, "detections": len(record.raw_detection)}
+
+    @app.get("/sync/{record_id}")
+    def sync_lookup(record_id: int, db: Session = Depends(get_db)):
+        return _payload(db.get(Record, record_id))
+
+    @app.get("/async-sync/{record_id}")
+    async def async_sync_lookup(record_id: int, db: Session = Depends(get_db)):
+        return _payload(db.get(Record, record_id))
+
+    @app.get("/async/{record_id}")
+    async def async_lookup(record_id: int, db: AsyncSession = Depends(get_async_db)):
+        return _payload(await db.get(Record, record_id))
+
+    return app
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Return the worst delay between scheduled and actual wake-ups of a ticker task."""
+    worst = 0.0
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - expected)
+    return worst
+
+
+async def run(client: httpx.AsyncClient, route: str, concurrency: int, total: int, quiet: bool = False) -> dict:
+    latencies = []
+    counter = iter(range(total))
+
+    async def worker():
+        for n in counter:
+            start = time.perf_counter()
+            response = await client.get(f"/{route}/{n % SEED_RECORDS + 1}")
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    worst_lag = await lag_task
+
+    latencies.sort()
+    stats = {
+        "route": route,
+        "requests_per_sec": total / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "max_loop_lag_ms": worst_lag * 1000,
+    }
+    if quiet:
+        return stats
+    print(f"{route:>10}: {stats['requests_per_sec']:8.1f} req/s | p50 {stats['p50_ms']:7.2f} ms | "
+          f"p95 {stats['p95_ms']:7.2f} ms | worst loop stall {stats['max_loop_lag_ms']:7.2f} ms")
+    return stats
+
+
+async def main_async(args):
+    app = build_app()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for route in ("sync", "async-sync", "async"):
+            await run(client, route, 4, 40, quiet=True)  # warm up pools
+            await run(client, route, args.concurrency, args.requests)
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent in-flight requests")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per route")
+    args = parser.parse_args()
+
+    seed()
+    print("=" * 60)
+    print(f"Async DB benchmark: {args.requests} requests at concurrency {args.concurrency}")
+    print("=" * 60)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
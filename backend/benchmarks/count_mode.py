@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Latency of POST /predict in full mode vs the count-only fast path.
+
+Uploads the same images one at a time with each variant in turn (so drift
+in the server or machine affects all variants alike):
+
+    full          default /predict (detections, colors, raw outputs, image kept)
+    count         ?mode=count (no detections, no colors, no raw outputs)
+    count+colors  ?mode=count&colors=true
+    count-image   ?mode=count&save_image=false (upload decoded in memory only)
+
+Reports client latency, server handling time (X-Process-Time-Ms), response
+size and the mean per-stage breakdown from include_timings. Created records
+are deleted afterwards unless --keep is given.
+
+Usage:
+    python benchmarks/count_mode.py --start-server --stub --rounds 20
+    python benchmarks/count_mode.py --url http://localhost:8000 --rounds 10
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from load_test import DEFAULT_IMAGES, distribution, httpx, load_images, start_server  # noqa: E402
+
+VARIANTS = {
+    "full": {},
+    "count": {"mode": "count"},
+    "count+colors": {"mode": "count", "colors": "true"},
+    "count-image": {"mode": "count", "save_image": "false"},
+}
+
+
+def run(args, images):
+    samples = {name: [] for name in VARIANTS}
+    created = []
+    with httpx.Client(base_url=args.url, timeout=args.timeout) as client:
+        # One warm-up upload loads the model before anything is timed
+        name, data = images[0]
+        response = client.post("/predict", files={"file": (f"warmup_{name}", data, "image/jpeg")})
+        response.raise_for_status()
+        created.append(response.json()["id"])
+
+        for round_number in range(args.rounds):
+            for index, (name, data) in enumerate(images[:args.images_per_round]):
+                for variant, params in VARIANTS.items():
+                    files = {"file": (f"count{round_number}_{index}_{variant}_{name}", data, "image/jpeg")}
+                    start = time.perf_counter()
+                    response = client.post("/predict", params=dict(params, include_timings="true"), files=files)
+                    latency_ms = (time.perf_counter() - start) * 1000
+                    response.raise_for_status()
+                    body = response.json()
+                    created.append(body["id"])
+                    samples[variant].append({
+                        "latency_ms": latency_ms,
+                        "server_ms": float(response.headers.get("x-process-time-ms", "nan")),
+                        "bytes": len(response.content),
+                        "total_count": body["total_count"],
+                        "timings": body.get("timings", {}),
+                    })
+
+        if not args.keep:
+            for record_id in created:
+                client.delete(f"/records/{record_id}")
+    return samples
+
+
+def summarize(variant_samples):
+    stages = {}
+    for sample in variant_samples:
+        for stage, value in sample["timings"].items():
+            if isinstance(value, (int, float)):
+                stages.setdefault(stage, []).append(value)
+    return {
+        "requests": len(variant_samples),
+        "latency_ms": distribution([s["latency_ms"] for s in variant_samples]),
+        "server_ms": distribution([s["server_ms"] for s in variant_samples]),
+        "mean_bytes": sum(s["bytes"] for s in variant_samples) / len(variant_samples),
+        "stages_ms": {stage: sum(values) / len(values) for stage, values in sorted(stages.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API base URL")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Directory of images to upload")
+    parser.add_argument("--images-per-round", type=int, default=5, help="Images uploaded per round")
+    parser.add_argument("--rounds", type=int, default=10, help="Passes over the images")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--keep", action="store_true", help="Keep the records created by the benchmark")
+    parser.add_argument("--start-server", action="store_true", help="Start uvicorn locally on a scratch database")
+    parser.add_argument("--stub", action="store_true", help="Serve a weight-free stub detector (--start-server)")
+    parser.add_argument("--stub-latency-ms", type=float, default=50, help="Simulated inference time of the stub")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+    args.server_workers = 1
+
+    images = load_images(args.images)
+    if not images:
+        print(f"❌ No images found in {args.images}")
+        return 1
+
+    server = start_server(args) if args.start_server else None
+    try:
+        samples = run(args, images)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {variant: summarize(variant_samples) for variant, variant_samples in samples.items()}
+    baseline = report["full"]["latency_ms"]["p50"]
+
+    print("=" * 78)
+    print(f"/predict full vs count mode: {args.url} | {args.rounds} rounds x {args.images_per_round} images")
+    print("=" * 78)
+    for variant, summary in report.items():
+        latency, server_ms = summary["latency_ms"], summary["server_ms"]
+        print(f"{variant:>13}: p50 {latency['p50']:7.1f} p95 {latency['p95']:7.1f} ms | "
+              f"server p50 {server_ms['p50']:7.1f} ms | {summary['mean_bytes']:8.0f} B | "
+              f"{(latency['p50'] - baseline) / baseline:+6.1%} vs full")
+        print(" " * 15 + "  ".join(f"{stage} {ms:.1f}" for stage, ms in summary["stages_ms"].items()))
+
+    if args.output:
+        report = {
+            "created_at": datetime.utcnow().isoformat(),
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+            "variants": report,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
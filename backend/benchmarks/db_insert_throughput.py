@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark Record insert throughput under concurrent load.
+
+Compares the old per-request path (add + commit + refresh on its own session)
+with the group-committing RecordWriter. Runs against a throwaway database so
+the real thread_rolls.db is never touched.
+
+Usage:
+    python benchmarks/db_insert_throughput.py --threads 16 --inserts 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Point the app at a scratch database before it is imported
+_tmp_dir = tempfile.mkdtemp(prefix="thread_roll_bench_")
+os.environ["THREAD_ROLL_DB_PATH"] = os.path.join(_tmp_dir, "bench.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from database import SessionLocal, Record, RecordWriter, init_db  # noqa: E402
+
+SAMPLE_DETECTIONS = [
+    {"id": i, "bbox": [10.0 * i, 20.0, 10.0 * i + 40.0, 60.0], "confidence": 0.95,
+     "color": "yellow", "class": "thread_roll"}
+    for i in range(1, 101)
+]
+
+
+def sample_values(worker: int, n: int) -> dict:
+    return {
+        "image_filename": f"bench_{worker}_{n}.jpg",
+        "total_count": len(SAMPLE_DETECTIONS),
+        "color_counts": {"yellow": 60, "pink": 40},
+        "raw_detection": SAMPLE_DETECTIONS,
+        "description": None,
+        "user": f"worker-{worker}",
+        "created_at": datetime.utcnow(),
+    }
+
+
+def insert_direct(values: dict):
+    """The pre-writer /predict path: one transaction per record."""
+    db = SessionLocal()
+    try:
+        record = Record(**values)
+        db.add(record)
+        db.commit()
+        db.refresh(record)
+    finally:
+        db.close()
+
+
+def run(label: str, insert_fn, threads: int, inserts: int) -> dict:
+    latencies = []
+    lock = threading.Lock()
+    errors = []
+
+    def worker(idx: int):
+        local = []
+        for n in range(inserts):
+            start = time.perf_counter()
+            try:
+                insert_fn(sample_values(idx, n))
+            except Exception as e:  # "database is locked" shows up here
+                errors.append(str(e))
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    total = threads * inserts
+    stats = {
+        "mode": label,
+        "records": total,
+        "seconds": elapsed,
+        "records_per_sec": total / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "errors": len(errors),
+    }
+    print(f"{label:>8}: {stats['records_per_sec']:8.1f} rec/s | "
+          f"p50 {stats['p50_ms']:7.2f} ms | p99 {stats['p99_ms']:7.2f} ms | "
+          f"errors {stats['errors']}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent inserting threads")
+    parser.add_argument("--inserts", type=int, default=200, help="Inserts per thread")
+    args = parser.parse_args()
+
+    init_db()
+
+    print("=" * 60)
+    print(f"Record insert benchmark: {args.threads} threads x {args.inserts} inserts")
+    print(f"Database: {os.environ['THREAD_ROLL_DB_PATH']}")
+    print("=" * 60)
+
+    run("direct", insert_direct, args.threads, args.inserts)
+
+    writer = RecordWriter()
+    writer.start()
+    try:
+        run("writer", writer.insert, args.threads, args.inserts)
+    finally:
+        writer.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for the Thread Roll Counter API.
+
+Replays sample_images_for_training against POST /predict and mixes in
+/records reads, either closed-loop (--concurrency clients back to back) or
+open-loop (--rate Poisson arrivals per second, capped at --concurrency in
+flight). Reports throughput, p50/p95/p99 latency and error rates per
+endpoint. Server-side queueing is measured from the X-Process-Time-Ms
+response header (client latency minus handler time) and by sampling the
+thread_roll_requests_in_progress gauge on /metrics.
+
+Latency in open-loop mode is measured from the scheduled arrival time, so
+requests that waited for a free slot are not under-reported.
+
+Usage:
+    python benchmarks/load_test.py --start-server --stub --duration 30 --concurrency 8
+    python benchmarks/load_test.py --url http://localhost:8000 --rate 4 --read-fraction 0.5
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import httpx
+except ImportError:
+    sys.exit("❌ The load test needs httpx: pip install httpx")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "app")
+DEFAULT_IMAGES = os.path.join(BENCH_DIR, "..", "..", "sample_images_for_training")
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+METRICS_INTERVAL = 0.5         # Seconds between /metrics samples
+IN_PROGRESS_METRIC = "thread_roll_requests_in_progress"
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def distribution(values):
+    return {
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None,
+    }
+
+
+def load_images(directory):
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(directory, pattern)))
+    images = []
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            images.append((os.path.basename(path), f.read()))
+    return images
+
+
+class LoadTest:
+    def __init__(self, args, images):
+        self.args = args
+        self.images = images
+        self.rng = random.Random(args.seed)
+        self.samples = []
+        self.in_progress = []
+        self.record_ids = []
+        self.sequence = 0
+
+    def choose(self):
+        """Pick the next request kind according to the read/list mix."""
+        if self.rng.random() >= self.args.read_fraction:
+            return "predict"
+        if not self.record_ids or self.rng.random() < self.args.list_fraction:
+            return "records_list"
+        return "record_get"
+
+    async def send(self, client, kind):
+        self.sequence += 1
+        if kind == "predict":
+            name, data = self.images[self.sequence % len(self.images)]
+            # Unique names: the API derives the stored filename from the upload name
+            files = {"file": (f"load{self.sequence}_{name}", data, "image/jpeg")}
+            return await client.post("/predict", files=files, data={"user": "loadtest"})
+        if kind == "records_list":
+            return await client.get("/records")
+        return await client.get(f"/records/{self.rng.choice(self.record_ids)}")
+
+    async def request(self, client, kind, scheduled, semaphore=None):
+        """Run one request and record its latency breakdown (all in ms)."""
+        sample = {"kind": kind, "offset_s": scheduled - self.started, "status": None, "error": None}
+        if semaphore is not None:
+            await semaphore.acquire()
+        sent = time.perf_counter()
+        sample["client_wait_ms"] = (sent - scheduled) * 1000
+        try:
+            response = await self.send(client, kind)
+            done = time.perf_counter()
+            sample["status"] = response.status_code
+            server_ms = response.headers.get("X-Process-Time-Ms")
+            if server_ms is not None:
+                sample["server_ms"] = float(server_ms)
+                sample["queue_ms"] = max(0.0, (done - sent) * 1000 - float(server_ms))
+            if kind == "predict" and response.status_code == 200:
+                self.record_ids.append(response.json()["id"])
+        except httpx.HTTPError as e:
+            done = time.perf_counter()
+            sample["error"] = type(e).__name__
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+        sample["latency_ms"] = (done - scheduled) * 1000
+        self.samples.append(sample)
+
+    async def closed_loop(self, client, deadline):
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self.request(client, self.choose(), time.perf_counter())
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+
+    async def open_loop(self, client, deadline):
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        tasks = []
+        next_arrival = time.perf_counter()
+        while next_arrival < deadline:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.request(client, self.choose(), next_arrival, semaphore)))
+            next_arrival += self.rng.expovariate(self.args.rate)
+        await asyncio.gather(*tasks)
+
+    async def sample_metrics(self, client, stop):
+        while not stop.is_set():
+            try:
+                response = await client.get("/metrics")
+                for line in response.text.splitlines():
+                    if line.startswith(IN_PROGRESS_METRIC + " "):
+                        # Minus one for this /metrics request itself
+                        self.in_progress.append(max(0.0, float(line.split()[1]) - 1))
+            except httpx.HTTPError:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), METRICS_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        limits = httpx.Limits(max_connections=self.args.concurrency + 1)
+        timeout = httpx.Timeout(self.args.timeout)
+        async with httpx.AsyncClient(base_url=self.args.url, limits=limits, timeout=timeout) as client:
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(self.sample_metrics(client, stop))
+            self.started = time.perf_counter()
+            deadline = self.started + self.args.duration
+            if self.args.rate:
+                await self.open_loop(client, deadline)
+            else:
+                await self.closed_loop(client, deadline)
+            self.elapsed = time.perf_counter() - self.started
+            stop.set()
+            await sampler
+
+            if not self.args.keep:
+                for record_id in self.record_ids:
+                    try:
+                        await client.delete(f"/records/{record_id}")
+                    except httpx.HTTPError:
+                        pass
+
+    def summarize(self, samples):
+        ok = [s for s in samples if s["error"] is None and s["status"] is not None and s["status"] < 400]
+        failed = len(samples) - len(ok)
+        return {
+            "requests": len(samples),
+            "errors": failed,
+            "error_rate": failed / len(samples) if samples else None,
+            "status_codes": {str(code): sum(1 for s in samples if s["status"] == code)
+                             for code in sorted({s["status"] for s in samples if s["status"]})},
+            "exceptions": {name: sum(1 for s in samples if s["error"] == name)
+                           for name in sorted({s["error"] for s in samples if s["error"]})},
+            "throughput_rps": len(ok) / self.elapsed,
+            "latency_ms": distribution([s["latency_ms"] for s in ok]),
+            "server_ms": distribution([s["server_ms"] for s in ok if "server_ms" in s]),
+            "queue_ms": distribution([s["queue_ms"] for s in ok if "queue_ms" in s]),
+            "client_wait_ms": distribution([s["client_wait_ms"] for s in ok]),
+        }
+
+    def report(self):
+        kinds = sorted({s["kind"] for s in self.samples})
+        return {
+            "overall": self.summarize(self.samples),
+            "endpoints": {kind: self.summarize([s for s in self.samples if s["kind"] == kind]) for kind in kinds},
+            "server_in_progress": {
+                "mean": sum(self.in_progress) / len(self.in_progress) if self.in_progress else None,
+                "max": max(self.in_progress) if self.in_progress else None,
+                "samples": len(self.in_progress),
+            },
+        }
+
+
+def start_server(args):
+    """Start uvicorn on a scratch database; returns the process once / answers."""
+    env = dict(os.environ)
+    env.setdefault("THREAD_ROLL_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="thread_roll_load_"), "load.db"))
+    if args.stub:
+        env["THREAD_ROLL_DETECTOR"] = "stub"
+        env["THREAD_ROLL_STUB_LATENCY_MS"] = str(args.stub_latency_ms)
+    port = args.url.rsplit(":", 1)[-1].rstrip("/")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", port,
+         "--workers", str(args.server_workers), "--log-level", "warning"],
+        cwd=APP_DIR, env=env,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"❌ Server exited with code {process.returncode}")
+        try:
+            httpx.get(args.url + "/", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.25)
+    process.terminate()
+    sys.exit("❌ Server did not start within 60s")
+
+
+def print_summary(name, summary):
+    latency, queue = summary["latency_ms"], summary["queue_ms"]
+    print(f"{name:>13}: {summary['requests']:6d} req | {summary['throughput_rps']:7.2f} rps | "
+          f"err {summary['error_rate'] * 100:5.1f}%", end="")
+    if latency["p50"] is not None:
+        print(f" | p50 {latency['p50']:7.1f} p95 {latency['p95']:7.1f} p99 {latency['p99']:7.1f} ms", end="")
+    if queue["p50"] is not None:
+        print(f" | queue p95 {queue['p95']:6.1f} ms", end="")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API base URL")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Directory of images to upload")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clients (closed loop) / max in flight (open loop)")
+    parser.add_argument("--rate", type=float, default=0, help="Open-loop arrivals per second (0 = closed loop)")
+    parser.add_argument("--read-fraction", type=float, default=0.3, help="Share of requests that are /records reads")
+    parser.add_argument("--list-fraction", type=float, default=0.2,
+                        help="Share of reads that list GET /records (the rest fetch one record)")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the request mix")
+    parser.add_argument("--keep", action="store_true", help="Keep the records created by the test")
+    parser.add_argument("--start-server", action="store_true", help="Start uvicorn locally on a scratch database")
+    parser.add_argument("--server-workers", type=int, default=1, help="uvicorn --workers for --start-server")
+    parser.add_argument("--stub", action="store_true", help="Serve a weight-free stub detector (--start-server)")
+    parser.add_argument("--stub-latency-ms", type=float, default=50, help="Simulated inference time of the stub")
+    parser.add_argument("--output", help="Write the JSON report (with per-request samples) here")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        print(f"❌ No images found in {args.images}")
+        return 1
+
+    server = start_server(args) if args.start_server else None
+    try:
+        mode = f"open loop {args.rate:g} req/s" if args.rate else "closed loop"
+        print("=" * 60)
+        print(f"Load test: {args.url} | {mode} | concurrency {args.concurrency} | {args.duration:g}s")
+        print(f"{len(images)} images, {args.read_fraction:.0%} reads")
+        print("=" * 60)
+
+        test = LoadTest(args, images)
+        asyncio.run(test.run())
+        report = test.report()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    for kind, summary in report["endpoints"].items():
+        print_summary(kind, summary)
+    print_summary("overall", report["overall"])
+    in_progress = report["server_in_progress"]
+    if in_progress["samples"]:
+        print(f"Server in-flight requests: mean {in_progress['mean']:.1f}, max {in_progress['max']:.0f}")
+
+    if args.output:
+        report.update({
+            "created_at": datetime.utcnow().isoformat(),
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+            "samples": test.samples,
+        })
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Size and serialization time of record payload formats.
+
+Builds records with synthetic detections (YOLO-like boxes, or center-hole
+detections with centers) and encodes them the way the API does: the
+default JSON response (pydantic model -> jsonable_encoder -> JSONResponse)
+and the opt-in compact layouts (payload.compact_response()) as JSON and,
+if msgpack is installed, MessagePack. Reports bytes before and after gzip
+and the median encode time.
+
+Usage:
+    python benchmarks/payload_formats.py
+    python benchmarks/payload_formats.py --detections 50 200 1000 --repeat 50
+"""
+
+import argparse
+import gzip
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+
+import payload  # noqa: E402
+
+COLORS = ["yellow", "pink", "orange", "orange_brown", "white", "other"]
+
+
+class RecordResponse(BaseModel):
+    # Same fields as main.RecordResponse (not imported: main starts the app)
+    id: int
+    image_filename: str
+    total_count: int
+    color_counts: dict
+    detections: list
+    description: str = None
+    user: str = None
+    created_at: datetime
+
+
+def make_record(count, hough, seed=0):
+    rng = random.Random(seed)
+    detections = []
+    for i in range(count):
+        x, y = rng.uniform(0, 1500), rng.uniform(0, 1100)
+        size = rng.uniform(40, 90)
+        detection = {
+            "id": i + 1,
+            "bbox": [x, y, x + size, y + size],
+            "confidence": 0.95 if hough else rng.uniform(0.5, 1.0),
+            "color": rng.choice(COLORS),
+            "class": "thread_roll",
+        }
+        if hough:
+            detection["center"] = (int(x + size / 2), int(y + size / 2))
+        detections.append(detection)
+    color_counts = {}
+    for d in detections:
+        color_counts[d["color"]] = color_counts.get(d["color"], 0) + 1
+    return {
+        "id": 1,
+        "image_filename": "20250118_120000_image.jpg",
+        "total_count": count,
+        "color_counts": color_counts,
+        "detections": detections,
+        "description": "Batch A",
+        "user": "John Doe",
+        "created_at": datetime(2025, 1, 18, 12, 0, 0),
+    }
+
+
+def encode_json(record):
+    return JSONResponse(jsonable_encoder(RecordResponse(**record))).body
+
+
+def encode_compact(fmt):
+    def encode(record):
+        body, _ = payload._encode(payload.compact_record(record), fmt)
+        return body
+    return encode
+
+
+def median_ms(fn, record, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(record)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--detections", type=int, nargs="+", default=[50, 200, 1000], help="Detections per record")
+    parser.add_argument("--repeat", type=int, default=30, help="Encodes per measurement")
+    args = parser.parse_args()
+
+    formats = [("json", encode_json), ("compact", encode_compact("compact"))]
+    if payload.msgpack is not None:
+        formats.append(("msgpack", encode_compact("msgpack")))
+
+    print("=" * 78)
+    print("Payload Format Benchmark")
+    print("=" * 78)
+    print(f"compact JSON encoder: {'orjson' if payload.orjson else 'json'}; "
+          f"msgpack: {'yes' if payload.msgpack else 'not installed'}")
+    print(f"\n{'detections':>10} {'kind':>6} {'format':>8} {'bytes':>9} {'gzip':>8} {'encode ms':>10} {'+gzip ms':>9}")
+    for count in args.detections:
+        for hough in (False, True):
+            record = make_record(count, hough)
+            for name, encode in formats:
+                body = encode(record)
+                compressed = gzip.compress(body, compresslevel=payload.COMPRESS_LEVEL)
+                encode_ms = median_ms(encode, record, args.repeat)
+                gzip_ms = median_ms(lambda r: gzip.compress(encode(r), compresslevel=payload.COMPRESS_LEVEL),
+                                    record, args.repeat)
+                print(f"{count:>10} {'hough' if hough else 'yolo':>6} {name:>8} {len(body):>9} "
+                      f"{len(compressed):>8} {encode_ms:>10.2f} {gzip_ms:>9.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark /records/search queries against a large synthetic records table.
+
+Seeds a scratch database (default 1M records) through plain INSERTs so the
+search triggers build the FTS and record_colors indexes exactly as in
+production, then times a set of representative searches.
+
+Usage:
+    python benchmarks/search_queries.py --records 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_tmp_dir = tempfile.mkdtemp(prefix="thread_roll_bench_")
+os.environ["THREAD_ROLL_DB_PATH"] = os.path.join(_tmp_dir, "bench.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from database import SessionLocal, engine, init_db  # noqa: E402
+from search import search_records  # noqa: E402
+
+USERS = [f"operator{i}" for i in range(40)] + [None]
+COLORS = ["yellow", "pink", "orange_brown", "white", "orange", "other"]
+WORDS = ["dock", "cage", "morning", "night", "shift", "batch", "return", "damaged", "rework", "supplier",
+         "inbound", "outbound", "recount", "audit", "sample", "urgent"]
+SEED_CHUNK = 20000
+
+
+def seed(total: int):
+    rng = random.Random(42)
+    start = datetime(2025, 1, 1)
+    insert = (
+        "INSERT INTO records (image_filename, total_count, color_counts, raw_detection, description, user, created_at) "
+        "VALUES (?, ?, ?, '[]', ?, ?, ?)"
+    )
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for chunk_start in range(0, total, SEED_CHUNK):
+            rows = []
+            for i in range(chunk_start, min(total, chunk_start + SEED_CHUNK)):
+                colors = {c: rng.randint(1, 60) for c in rng.sample(COLORS, rng.randint(1, 3))}
+                description = " ".join(rng.sample(WORDS, 3)) + f" dock-{rng.randint(1, 20)}" if rng.random() < 0.7 else None
+                created = start + timedelta(seconds=i * 30)
+                rows.append((f"img_{i}.jpg", sum(colors.values()), json.dumps(colors), description,
+                             rng.choice(USERS), created.strftime("%Y-%m-%d %H:%M:%S.%f")))
+            cursor.executemany(insert, rows)
+            raw.commit()
+            print(f"  seeded {min(total, chunk_start + SEED_CHUNK):>9,} records", end="\r")
+        print()
+    finally:
+        raw.close()
+
+
+QUERIES = {
+    "keyword": dict(q="damaged"),
+    "keyword + user": dict(q="audit", user="operator7"),
+    "prefix keyword": dict(q="recou*"),
+    "user + 1 week": dict(user="operator3", start=datetime(2025, 3, 1), end=datetime(2025, 3, 8)),
+    "total range": dict(min_total=150, max_total=160),
+    "contains pink": dict(colors=[("pink", 1)]),
+    "pink >= 55": dict(colors=[("pink", 55)]),
+    "pink >= 50 + white >= 50": dict(colors=[("pink", 50), ("white", 50)]),
+    "keyword + color + range": dict(q="urgent", colors=[("yellow", 30)], start=datetime(2025, 2, 1)),
+    "deep page": dict(offset=5000),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=1_000_000, help="Synthetic records to seed")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query (best is reported)")
+    args = parser.parse_args()
+
+    init_db()
+    print("=" * 60)
+    print(f"Search benchmark over {args.records:,} records")
+    print("=" * 60)
+    seed_start = time.perf_counter()
+    seed(args.records)
+    print(f"Seeding took {time.perf_counter() - seed_start:.1f}s\n")
+
+    with SessionLocal() as db:
+        for name, filters in QUERIES.items():
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                rows = search_records(db, limit=50, **filters)
+                best = min(best, time.perf_counter() - start)
+                db.expunge_all()
+            print(f"{name:>26}: {best * 1000:8.2f} ms  ({len(rows)} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Shared inference server vs. one model per API worker.
+
+Simulates N API worker processes that each run --requests detections back
+to back over the sample images, once with every worker loading its own
+detector and once with all of them using a single inference_server.py
+through shared memory. Reports throughput, per-request latency and the
+total memory (PSS, so shared pages are not double counted) of all
+processes involved.
+
+Usage:
+    python benchmarks/shared_inference.py --workers 4 --requests 20
+    python benchmarks/shared_inference.py --stub --workers 8
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "app"))
+DEFAULT_IMAGES = os.path.join(BENCH_DIR, "..", "..", "sample_images_for_training")
+DEFAULT_MODEL = os.path.join(APP_DIR, "models_weights", "best.pt")
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+SERVER_START_TIMEOUT = 120
+
+sys.path.insert(0, APP_DIR)
+
+
+def memory_mb(pid):
+    """Proportional set size of a process in MB (falls back to RSS)."""
+    for path, key in ((f"/proc/{pid}/smaps_rollup", "Pss:"), (f"/proc/{pid}/status", "VmRSS:")):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(key):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            continue
+    return None
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def worker(kind, model, conf, address, images, requests, start, results):
+    """One simulated API worker: load (or connect), wait for the start signal, run requests."""
+    import contextlib
+    import io
+
+    if kind == "per-worker":
+        from worker_pool import load_detector
+        with contextlib.redirect_stdout(io.StringIO()):
+            detector = load_detector(model, conf)
+
+        def detect(path):
+            return detector.process_image(path)
+    else:
+        from inference_server import InferenceClient
+        client = InferenceClient(address)
+
+        def detect(path):
+            return client.submit(path).result()
+
+    # Warm up (first YOLO call, connection) outside the measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        detect(images[0])
+    results.put(("ready", os.getpid(), None))
+    start.wait()
+
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(requests):
+            began = time.perf_counter()
+            detect(images[i % len(images)])
+            latencies.append(time.perf_counter() - began)
+    results.put(("done", os.getpid(), (latencies, memory_mb(os.getpid()))))
+
+
+def start_server(args, address):
+    env = dict(os.environ, THREAD_ROLL_INFERENCE_SERVER=address)
+    server = subprocess.Popen(
+        [sys.executable, "inference_server.py", "--model", args.model, "--conf", str(args.conf)],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while not os.path.exists(address):
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            raise RuntimeError("Inference server did not start")
+        time.sleep(0.1)
+    return server
+
+
+def run(kind, args, images):
+    context = multiprocessing.get_context("spawn")
+    start, results = context.Event(), context.Queue()
+    address = os.path.join(tempfile.mkdtemp(), "inference.sock")
+    server = start_server(args, address) if kind == "shared" else None
+
+    processes = [
+        context.Process(target=worker, args=(kind, args.model, args.conf, address, images, args.requests,
+                                             start, results))
+        for _ in range(args.workers)
+    ]
+    try:
+        for process in processes:
+            process.start()
+        for _ in processes:
+            results.get()
+        began = time.perf_counter()
+        start.set()
+        reports = [results.get()[2] for _ in processes]
+        elapsed = time.perf_counter() - began
+        server_mb = memory_mb(server.pid) if server else 0.0
+    finally:
+        for process in processes:
+            process.join()
+        if server:
+            server.terminate()
+            server.wait()
+
+    latencies = [latency for worker_latencies, _ in reports for latency in worker_latencies]
+    worker_mb = [mb for _, mb in reports if mb is not None]
+    return {
+        "kind": kind,
+        "workers": args.workers,
+        "requests": len(latencies),
+        "images_per_sec": len(latencies) / elapsed,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "max": max(latencies) * 1000,
+        },
+        "memory_mb": {
+            "workers": sum(worker_mb),
+            "server": server_mb,
+            "total": sum(worker_mb) + (server_mb or 0.0),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Directory of test images")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="YOLO weights")
+    parser.add_argument("--conf", type=float, default=0.5, help="Confidence threshold")
+    parser.add_argument("--workers", type=int, default=4, help="Simulated API workers")
+    parser.add_argument("--requests", type=int, default=10, help="Detections per worker")
+    parser.add_argument("--stub", action="store_true", help="Use the weight-free stub detector")
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if args.stub:
+        os.environ["THREAD_ROLL_DETECTOR"] = "stub"
+    images = []
+    for pattern in IMAGE_PATTERNS:
+        images.extend(glob.glob(os.path.join(args.images, pattern)))
+    images = sorted(os.path.abspath(path) for path in images)
+    if not images:
+        print(f"❌ No images found in {args.images}")
+        return 1
+
+    print("=" * 60)
+    print("Shared Inference Benchmark")
+    print("=" * 60)
+    print(f"📊 {args.workers} workers x {args.requests} requests, {len(images)} images")
+
+    reports = []
+    for kind in ("per-worker", "shared"):
+        report = run(kind, args, images)
+        reports.append(report)
+        latency, memory = report["latency_ms"], report["memory_mb"]
+        print(f"\n{kind}:")
+        print(f"   {report['images_per_sec']:.2f} images/s | p50 {latency['p50']:.0f} ms | "
+              f"p95 {latency['p95']:.0f} ms | max {latency['max']:.0f} ms")
+        print(f"   memory {memory['total']:.0f} MB (workers {memory['workers']:.0f} MB, "
+              f"server {memory['server']:.0f} MB)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"created_at": datetime.utcnow().isoformat(), "stub": args.stub, "runs": reports}, f, indent=2)
+        print(f"\n✓ Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,7 +7,7 @@ import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
 
-from detection import ThreadRollDetector
+from detection_v2 import ThreadRollDetectorV2
 import glob
 
 def test_uploaded_images():
@@ -35,34 +35,39 @@ def test_uploaded_images():
 
     print(f"\nFound {len(image_files)} uploaded images\n")
 
-    # Test each confidence threshold
+    # Test each confidence threshold (one YOLO pass per image covers all of them)
     thresholds = [0.15, 0.25, 0.35, 0.5]
 
-    for threshold in thresholds:
+    detector = ThreadRollDetectorV2(model_path, confidence_threshold=min(thresholds))
+
+    for img_path in image_files[:3]:  # Test first 3 images
+        filename = os.path.basename(img_path)
         print(f"\n{'=' * 60}")
-        print(f"Testing with confidence threshold: {threshold}")
+        print(f"📸 Image: {filename}")
         print('=' * 60)
 
-        detector = ThreadRollDetector(model_path, confidence_threshold=threshold)
-
-        for img_path in image_files[:3]:  # Test first 3 images
-            filename = os.path.basename(img_path)
-            print(f"\n📸 Image: {filename}")
-
-            try:
-                detections = detector.detect_rolls(img_path)
-
-                if detections:
-                    print(f"   ✓ Found {len(detections)} objects:")
-                    for i, det in enumerate(detections, 1):
-                        print(f"      {i}. {det.get('class', 'unknown')} - "
-                              f"{det['color']} "
-                              f"(conf: {det['confidence']:.2f})")
-                else:
-                    print("   ✗ No objects detected")
-
-            except Exception as e:
-                print(f"   ✗ Error: {e}")
+        try:
+            sweep = detector.sweep_thresholds(img_path, thresholds, mode="yolo")
+        except Exception as e:
+            print(f"   ✗ Error: {e}")
+            continue
+
+        for threshold in thresholds:
+            detections = sweep["results"][threshold]["detections"]
+            print(f"\nConfidence threshold: {threshold}")
+
+            if detections:
+                print(f"   ✓ Found {len(detections)} objects:")
+                for i, det in enumerate(detections, 1):
+                    print(f"      {i}. {det.get('class', 'unknown')} - "
+                          f"{det['color']} "
+                          f"(conf: {det['confidence']:.2f})")
+            else:
+                print("   ✗ No objects detected")
+
+        print("\n📈 Count vs. threshold:")
+        for point in sweep["curve"]:
+            print(f"   {point['threshold']:.2f}: {point['count']}")
 
     print("\n" + "=" * 60)
     print("Recommendations:")
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Reproducible detection benchmark over thread_roll_dataset
+
+Runs ThreadRollDetectorV2 in each detector mode over the train/val splits
+and measures per-stage latency, images/sec, peak RSS and count error
+against the YOLO label files. Results are written as JSON; --compare
+checks a new run against a baseline and exits non-zero on regressions.
+
+Usage:
+    python benchmark_detection.py --output bench/baseline.json
+    python benchmark_detection.py --output bench/candidate.json
+    python benchmark_detection.py --compare bench/baseline.json bench/candidate.json
+"""
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(REPO_DIR, 'backend/app'))
+
+DEFAULT_DATASET = os.path.join(REPO_DIR, "thread_roll_dataset")
+DEFAULT_MODEL = os.path.join(REPO_DIR, "backend/app/models_weights/best.pt")
+DEFAULT_MODES = ["hybrid", "yolo", "hough"]
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+# Regression thresholds for --compare
+DEFAULT_MAX_MAE_INCREASE = 1.0         # rolls per image
+DEFAULT_MAX_SLOWDOWN = 0.10            # fraction of images/sec lost
+DEFAULT_MAX_RSS_INCREASE = 0.15        # fraction of peak RSS gained
+
+
+def find_images(dataset_dir, splits):
+    """List (split, image_path, label_path) for every image that has a label file."""
+    samples = []
+    for split in splits:
+        image_dir = os.path.join(dataset_dir, split, "images")
+        label_dir = os.path.join(dataset_dir, split, "labels")
+        images = []
+        for pattern in IMAGE_PATTERNS:
+            images.extend(glob.glob(os.path.join(image_dir, pattern)))
+        for image_path in sorted(images):
+            stem = os.path.splitext(os.path.basename(image_path))[0]
+            label_path = os.path.join(label_dir, f"{stem}.txt")
+            if os.path.exists(label_path):
+                samples.append((split, image_path, label_path))
+    return samples
+
+
+def count_labels(label_path):
+    """Number of objects in a YOLO label file (one box per non-empty line)."""
+    with open(label_path) as f:
+        return sum(1 for line in f if line.strip())
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_mode(mode, model_path, confidence, samples, warmup, repeat):
+    """Benchmark one detector mode in a fresh process so peak RSS is per mode."""
+    from detection_v2 import ThreadRollDetectorV2
+
+    quiet = io.StringIO()
+    load_start = time.perf_counter()
+    with contextlib.redirect_stdout(quiet):
+        # No route decision log: each run learns from scratch, and never feeds the API's statistics
+        detector = ThreadRollDetectorV2(model_path, confidence_threshold=confidence, route_log=None)
+    load_seconds = time.perf_counter() - load_start
+
+    with contextlib.redirect_stdout(quiet):
+        for _, image_path, _ in samples[:warmup]:
+            detector.process_image(image_path, mode=mode)
+
+    images = []
+    for split, image_path, label_path in samples:
+        expected = count_labels(label_path)
+        for _ in range(repeat):
+            quiet.seek(0)
+            quiet.truncate()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(quiet):
+                result = detector.process_image(image_path, mode=mode)
+            elapsed = time.perf_counter() - start
+            images.append({
+                "split": split,
+                "image": os.path.relpath(image_path, REPO_DIR),
+                "expected": expected,
+                "count": result["total_count"],
+                "error": result["total_count"] - expected,
+                "latency_ms": elapsed * 1000,
+                "path": result["timings"].get("path"),
+                "stages_ms": {k: v for k, v in result["timings"].items() if k != "path"},
+            })
+
+    return {
+        "mode": mode,
+        "model_load_ms": load_seconds * 1000,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "images": images,
+    }
+
+
+def summarize(run):
+    images = run["images"]
+    latencies = [image["latency_ms"] for image in images]
+    errors = [image["error"] for image in images]
+    stage_names = sorted({stage for image in images for stage in image["stages_ms"]})
+    total_seconds = sum(latencies) / 1000
+
+    summary = {
+        "images": len(images),
+        "images_per_sec": len(images) / total_seconds if total_seconds else None,
+        "latency_ms": {
+            "mean": statistics.mean(latencies) if latencies else None,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "max": max(latencies) if latencies else None,
+        },
+        "stages_ms_mean": {
+            stage: statistics.mean(image["stages_ms"].get(stage, 0.0) for image in images)
+            for stage in stage_names
+        },
+        "count_mae": statistics.mean(abs(e) for e in errors) if errors else None,
+        "count_bias": statistics.mean(errors) if errors else None,
+        "count_mape": statistics.mean(
+            abs(image["error"]) / image["expected"] for image in images if image["expected"]
+        ) if any(image["expected"] for image in images) else None,
+        "exact_matches": sum(1 for e in errors if e == 0),
+        "paths": {path: sum(1 for image in images if image["path"] == path)
+                  for path in sorted({image["path"] for image in images})},
+        "peak_rss_mb": run["peak_rss_mb"],
+        "model_load_ms": run["model_load_ms"],
+    }
+    return summary
+
+
+def file_digest(path):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def environment_info(model_path):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import cv2
+    import numpy
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": numpy.__version__,
+        "model_sha256": file_digest(model_path),
+    }
+
+
+def run_benchmark(args):
+    samples = find_images(args.dataset, args.splits)
+    if args.limit:
+        samples = samples[:args.limit]
+    if not samples:
+        print(f"❌ No labeled images found in {args.dataset} ({', '.join(args.splits)})")
+        return 1
+
+    print("=" * 60)
+    print("Thread Roll Detection Benchmark")
+    print("=" * 60)
+    print(f"📊 {len(samples)} labeled images from {', '.join(args.splits)}")
+    print(f"🤖 Model: {args.model} (conf={args.conf})")
+
+    context = multiprocessing.get_context("spawn")
+    results = {
+        "created_at": datetime.utcnow().isoformat(),
+        "dataset": os.path.relpath(args.dataset, REPO_DIR),
+        "splits": args.splits,
+        "confidence_threshold": args.conf,
+        "repeat": args.repeat,
+        "environment": environment_info(args.model),
+        "modes": {},
+    }
+
+    for mode in args.modes:
+        print(f"\n🔍 Mode: {mode}")
+        # One single-use worker per mode; errors in it (e.g. missing weights) are re-raised here
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            future = pool.submit(run_mode, mode, args.model, args.conf, samples, args.warmup, args.repeat)
+            try:
+                run = future.result()
+            except Exception as e:
+                print(f"❌ {mode} benchmark failed: {type(e).__name__}: {e}")
+                return 1
+
+        summary = summarize(run)
+        results["modes"][mode] = {"summary": summary, "images": run["images"]}
+        print(f"   {summary['images_per_sec']:.2f} img/s | p50 {summary['latency_ms']['p50']:.0f} ms | "
+              f"p95 {summary['latency_ms']['p95']:.0f} ms | MAE {summary['count_mae']:.2f} | "
+              f"bias {summary['count_bias']:+.2f} | peak RSS {summary['peak_rss_mb']:.0f} MB")
+        stages = ", ".join(f"{k} {v:.0f}" for k, v in summary["stages_ms_mean"].items())
+        print(f"   stages (mean ms): {stages}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results written to {args.output}")
+    return 0
+
+
+def compare(baseline_path, candidate_path, max_mae_increase, max_slowdown, max_rss_increase):
+    """Print a per-mode comparison and return the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    print("=" * 60)
+    print(f"Baseline:  {baseline_path} ({baseline['environment'].get('git_commit')})")
+    print(f"Candidate: {candidate_path} ({candidate['environment'].get('git_commit')})")
+    print("=" * 60)
+
+    regressions = 0
+    for mode, entry in candidate["modes"].items():
+        if mode not in baseline["modes"]:
+            print(f"\n{mode}: not in baseline, skipped")
+            continue
+        old, new = baseline["modes"][mode]["summary"], entry["summary"]
+        checks = [
+            ("count MAE", old["count_mae"], new["count_mae"],
+             new["count_mae"] - old["count_mae"] > max_mae_increase),
+            ("images/sec", old["images_per_sec"], new["images_per_sec"],
+             new["images_per_sec"] < old["images_per_sec"] * (1 - max_slowdown)),
+            ("p95 latency ms", old["latency_ms"]["p95"], new["latency_ms"]["p95"],
+             new["latency_ms"]["p95"] > old["latency_ms"]["p95"] * (1 + max_slowdown)),
+            ("peak RSS MB", old["peak_rss_mb"], new["peak_rss_mb"],
+             new["peak_rss_mb"] > old["peak_rss_mb"] * (1 + max_rss_increase)),
+        ]
+        print(f"\n{mode}:")
+        for name, before, after, regressed in checks:
+            flag = "✗ REGRESSION" if regressed else "✓"
+            print(f"   {name:>15}: {before:10.2f} -> {after:10.2f}  {flag}")
+            regressions += int(regressed)
+
+    print("\n" + "=" * 60)
+    print("✗ Regressions found" if regressions else "✓ No regressions")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="YOLO dataset directory")
+    parser.add_argument("--splits", nargs="+", default=["train", "val"], help="Dataset splits to use")
+    parser.add_argument("--modes", nargs="+", default=DEFAULT_MODES, choices=DEFAULT_MODES,
+                        help="Detector modes to benchmark")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="YOLO weights")
+    parser.add_argument("--conf", type=float, default=0.5, help="Confidence threshold (the API uses 0.5)")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed images per mode before measuring")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per image")
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N images (0 = all)")
+    parser.add_argument("--output", default=f"bench/detection_{datetime.now():%Y%m%d_%H%M%S}.json",
+                        help="Where to write the JSON results")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="Compare two result files instead of running")
+    parser.add_argument("--max-mae-increase", type=float, default=DEFAULT_MAX_MAE_INCREASE)
+    parser.add_argument("--max-slowdown", type=float, default=DEFAULT_MAX_SLOWDOWN)
+    parser.add_argument("--max-rss-increase", type=float, default=DEFAULT_MAX_RSS_INCREASE)
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.max_mae_increase, args.max_slowdown, args.max_rss_increase)
+        return 1 if regressions else 0
+    return run_benchmark(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Pre-tile thread_roll_dataset into a memory-mapped training set
+
+Photos of a full cage are far larger than the 640 px YOLO trains at, so
+every epoch re-decodes and downsizes them and small rolls lose most of
+their pixels. This cuts every labeled image once into overlapping
+640x640 tiles at full resolution and stores them as one uint8 array per
+split (a .npy file, opened memory-mapped) plus a JSON index with each
+tile's source image, offset and YOLO labels remapped to the tile.
+
+A box is kept in a tile when at least --min-visibility of its area lies
+inside it (clipped to the tile edge). Tiles without boxes are mostly
+background, so only --empty-ratio of them (relative to the tiles with
+boxes, picked at random with a fixed seed) are kept.
+
+Images are decoded and tiled on a process pool; workers write straight
+into the memory-mapped array. Output files are renamed into place when
+complete, index last. train_thread_rolls.py --tiles <output> trains on it.
+
+Usage:
+    python build_tiles.py
+    python build_tiles.py --overlap 160 --empty-ratio 0.05 --output /data/thread_roll_tiles
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmark_detection import find_images
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATASET = os.path.join(REPO_DIR, "thread_roll_dataset")
+DEFAULT_OUTPUT = os.path.join(DEFAULT_DATASET, "tiles")
+SPLITS = ("train", "val")
+TILE_SIZE = 640
+TILE_OVERLAP = 128        # Pixels shared by neighbouring tiles, so rolls on a seam are whole in one of them
+MIN_VISIBILITY = 0.5      # Share of a box's area that must be inside a tile to label it there
+EMPTY_RATIO = 0.1         # Empty tiles kept per tile with boxes
+PAD_VALUE = 114           # Gray padding for images smaller than a tile (as YOLO letterboxing)
+EXIF_TRANSPOSED = (5, 6, 7, 8)  # EXIF orientations that swap width and height
+
+
+def image_size(image_path):
+    """(width, height) as cv2.imread returns the image (EXIF rotation applied), without decoding it."""
+    with Image.open(image_path) as im:
+        width, height = im.size
+        if im.getexif().get(0x0112) in EXIF_TRANSPOSED:
+            width, height = height, width
+    return width, height
+
+
+def read_labels(label_path, width, height):
+    """YOLO label file as pixel boxes [(class, x1, y1, x2, y2)]."""
+    boxes = []
+    with open(label_path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cls, xc, yc, w, h = int(parts[0]), *(float(v) for v in parts[1:5])
+            boxes.append((cls, (xc - w / 2) * width, (yc - h / 2) * height,
+                          (xc + w / 2) * width, (yc + h / 2) * height))
+    return boxes
+
+
+def tile_offsets(length, tile_size, overlap):
+    """Tile start positions covering [0, length), the last one flush with the end."""
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    offsets = list(range(0, length - tile_size, stride))
+    offsets.append(length - tile_size)
+    return offsets
+
+
+def tile_labels(boxes, x, y, tile_size, min_visibility):
+    """Boxes visible in the tile at (x, y) as YOLO labels [class, xc, yc, w, h] normalized to the tile."""
+    labels = []
+    for cls, x1, y1, x2, y2 in boxes:
+        cx1, cy1 = max(x1, x), max(y1, y)
+        cx2, cy2 = min(x2, x + tile_size), min(y2, y + tile_size)
+        if cx2 <= cx1 or cy2 <= cy1:
+            continue
+        area = (x2 - x1) * (y2 - y1)
+        if area <= 0 or (cx2 - cx1) * (cy2 - cy1) / area < min_visibility:
+            continue
+        labels.append([cls,
+                       round(((cx1 + cx2) / 2 - x) / tile_size, 6), round(((cy1 + cy2) / 2 - y) / tile_size, 6),
+                       round((cx2 - cx1) / tile_size, 6), round((cy2 - cy1) / tile_size, 6)])
+    return labels
+
+
+def plan_tiles(pairs, dataset_dir, tile_size, overlap, min_visibility, empty_ratio, seed):
+    """
+    Tiles to build for one split, from image sizes and labels only (no decoding).
+
+    Returns:
+        [{"image", "x", "y", "labels"}] in image order, and the number of empty tiles dropped
+    """
+    tiles = []
+    for image_path, label_path in pairs:
+        width, height = image_size(image_path)
+        boxes = read_labels(label_path, width, height)
+        image = os.path.relpath(image_path, dataset_dir)
+        for y in tile_offsets(height, tile_size, overlap):
+            for x in tile_offsets(width, tile_size, overlap):
+                tiles.append({"image": image, "x": x, "y": y,
+                              "labels": tile_labels(boxes, x, y, tile_size, min_visibility)})
+
+    empty = [i for i, tile in enumerate(tiles) if not tile["labels"]]
+    keep_empty = min(len(empty), int(round(empty_ratio * (len(tiles) - len(empty)))))
+    dropped = set(empty) - set(random.Random(seed).sample(empty, keep_empty))
+    return [tile for i, tile in enumerate(tiles) if i not in dropped], len(dropped)
+
+
+def _write_image_tiles(args):
+    """Decode one image and write its tiles into the memory-mapped array (runs in a worker)."""
+    array_path, image_path, slots, tile_size = args
+    cv2.setNumThreads(1)  # Parallelism comes from the pool
+    image = cv2.imread(image_path)
+    if image is None:
+        return f"Could not read image: {image_path}"
+    array = np.load(array_path, mmap_mode="r+")
+    for index, x, y in slots:
+        crop = image[y:y + tile_size, x:x + tile_size]
+        if crop.shape[:2] != (tile_size, tile_size):
+            tile = np.full((tile_size, tile_size, 3), PAD_VALUE, dtype=np.uint8)
+            tile[:crop.shape[0], :crop.shape[1]] = crop
+            crop = tile
+        array[index] = crop
+    array.flush()
+    return None
+
+
+def write_split(output_dir, split, tiles, dataset_dir, tile_size, pool):
+    """Write the tiles of one split to <split>.npy and <split>.json (atomically, index last)."""
+    array_path = os.path.join(output_dir, f"{split}.npy")
+    tmp_array = os.path.join(output_dir, f".{split}.npy.tmp")
+    np.lib.format.open_memmap(tmp_array, mode="w+", dtype=np.uint8,
+                              shape=(len(tiles), tile_size, tile_size, 3)).flush()
+
+    slots = {}
+    for index, tile in enumerate(tiles):
+        slots.setdefault(tile["image"], []).append((index, tile["x"], tile["y"]))
+    jobs = [(tmp_array, os.path.join(dataset_dir, image), image_slots, tile_size)
+            for image, image_slots in slots.items()]
+    errors = [error for error in pool.map(_write_image_tiles, jobs) if error]
+    if errors:
+        os.remove(tmp_array)
+        raise RuntimeError("; ".join(errors))
+    os.replace(tmp_array, array_path)
+
+    index = {
+        "array": os.path.basename(array_path),
+        "tile_size": tile_size,
+        "shape": [len(tiles), tile_size, tile_size, 3],
+        "dtype": "uint8",
+        "channels": "bgr",
+        "tiles": tiles,
+    }
+    index_path = os.path.join(output_dir, f"{split}.json")
+    with open(f"{index_path}.tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(f"{index_path}.tmp", index_path)
+
+
+def create_data_yaml(output_dir):
+    """data.yaml for the tiles (train/val point at the arrays; see train_thread_rolls.py --tiles)."""
+    yaml_content = """# Thread Roll Tiles (written by build_tiles.py)
+# Train with: python train_thread_rolls.py --tiles <this folder>
+train: train.npy
+val: val.npy
+
+# Classes
+nc: 1  # number of classes
+names: ['thread_roll']  # class names
+"""
+    with open(os.path.join(output_dir, "data.yaml"), "w") as f:
+        f.write(yaml_content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="YOLO dataset folder (train/, val/)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Folder for the tile arrays and indexes")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="Tile side in pixels (= training imgsz)")
+    parser.add_argument("--overlap", type=int, default=TILE_OVERLAP, help="Overlap between neighbouring tiles")
+    parser.add_argument("--min-visibility", type=float, default=MIN_VISIBILITY,
+                        help="Share of a box that must be inside a tile to label it there")
+    parser.add_argument("--empty-ratio", type=float, default=EMPTY_RATIO,
+                        help="Empty tiles kept per tile with boxes")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for picking the empty tiles kept")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    args = parser.parse_args()
+
+    if not 0 <= args.overlap < args.tile_size:
+        parser.error("--overlap must be smaller than --tile-size")
+
+    print("=" * 60)
+    print("Thread Roll Tile Builder")
+    print("=" * 60)
+
+    plans = {}
+    for split in SPLITS:
+        pairs = [(image_path, label_path) for _, image_path, label_path in find_images(args.dataset, [split])]
+        if not pairs:
+            print(f"❌ No labeled images in {os.path.join(args.dataset, split)}")
+            return 1
+        tiles, dropped = plan_tiles(pairs, args.dataset, args.tile_size, args.overlap,
+                                    args.min_visibility, args.empty_ratio, args.seed)
+        plans[split] = tiles
+        boxes = sum(len(tile["labels"]) for tile in tiles)
+        print(f"✓ {split}: {len(pairs)} images → {len(tiles)} tiles ({boxes} boxes), {dropped} empty tiles dropped")
+
+    os.makedirs(args.output, exist_ok=True)
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.workers or os.cpu_count() or 1,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        for split, tiles in plans.items():
+            write_split(args.output, split, tiles, args.dataset, args.tile_size, pool)
+    create_data_yaml(args.output)
+
+    total = sum(len(tiles) for tiles in plans.values())
+    size_mb = total * args.tile_size * args.tile_size * 3 / 1e6
+    print(f"\n✓ Wrote {total} tiles ({size_mb:.0f} MB) to {args.output} in {time.monotonic() - started:.1f}s")
+    print("\n🚀 Train on them with:")
+    print(f"   python train_thread_rolls.py --tiles {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
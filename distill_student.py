@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Distill the deployed YOLO model into a smaller, faster CPU student
+
+Three steps, run in order (each can be re-run on its own):
+
+  label    The teacher (the deployed best.pt) pseudo-labels the uploads
+           people made through the app. This is auto_annotate.py pointed at
+           backend/app/uploads, so it is incremental: only new uploads are
+           labeled, and uploads already in thread_roll_dataset are skipped.
+           The distill dataset trains on the pseudo-labels plus the
+           hand-labeled train split and validates on the hand-labeled val
+           split only.
+
+  train    The student starts from the teacher with --prune of its conv
+           channels removed (L2-magnitude structured pruning via
+           torch-pruning; the detection head and attention blocks are left
+           alone) and is fine-tuned on the distill dataset at a lower
+           resolution (--imgsz), which the weights remember for inference.
+           --student starts from other weights instead (e.g. yolo11n.pt
+           with --prune 0).
+
+  promote  Runs benchmark_detection.py on teacher and student over the
+           held-out val split. The student is deployed (the teacher kept as
+           best.prev.pt) only if, in every benchmarked mode, its count MAE is
+           within --tolerance of the teacher's and its median latency is lower.
+
+Usage:
+    python distill_student.py label
+    python distill_student.py train --prune 0.3 --imgsz 480
+    python distill_student.py promote --tolerance 1.0
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+from datetime import datetime
+
+import auto_annotate
+from benchmark_detection import DEFAULT_MAX_MAE_INCREASE
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(REPO_DIR, "backend/app/models_weights")
+DEFAULT_TEACHER = os.path.join(MODEL_DIR, "best.pt")
+DEFAULT_UPLOADS = os.path.join(REPO_DIR, "backend/app/uploads")
+DEFAULT_LABELED = os.path.join(REPO_DIR, "thread_roll_dataset")
+DEFAULT_DISTILL = os.path.join(REPO_DIR, "distill_dataset")
+DEFAULT_STUDENT = os.path.join(REPO_DIR, "runs/distill/student/weights/best.pt")
+PSEUDO_LABEL_CONFIDENCE = 0.25   # Higher than auto_annotate's 0.1: nobody reviews pseudo-labels
+STUDENT_IMGSZ = 480
+PRUNE_RATIO = 0.3                # Share of conv channels removed
+# Module types whose channels stay: the head's outputs are fixed, attention reshapes by head count
+PRUNE_IGNORED = ("Detect", "Attention", "C2PSA", "PSA")
+
+try:
+    import torch_pruning as tp
+except ImportError:  # Optional: only needed for --prune
+    tp = None
+
+
+def label(args):
+    """Pseudo-label new uploads with the teacher and write the distill data.yaml."""
+    cache = auto_annotate.HashCache(os.path.join(args.dataset, auto_annotate.CACHE_FILENAME))
+    os.makedirs(args.dataset, exist_ok=True)
+    hand_labeled, _ = auto_annotate.labeled_hashes(args.labeled, cache)
+    cache.save()
+
+    annotate_args = argparse.Namespace(
+        images=args.uploads, dataset=args.dataset, model=args.teacher, conf=args.conf,
+        merge_holes=args.merge_holes, workers=args.workers, batch_size=auto_annotate.ANNOTATE_BATCH_SIZE,
+        val_fraction=0.0, force=False,
+    )
+    status = auto_annotate.auto_annotate(annotate_args, skip_hashes=hand_labeled)
+    write_distill_yaml(args.dataset, args.labeled)
+    return status
+
+
+def write_distill_yaml(dataset_dir, labeled_dir):
+    """data.yaml training on pseudo-labels + hand labels and validating on hand labels (relative paths)."""
+    labeled = os.path.relpath(labeled_dir, dataset_dir)
+    yaml_content = f"""# Thread Roll Distillation Dataset (written by distill_student.py)
+# Paths are relative to this file; pass its absolute path to YOLO
+train:
+  - train/images
+  - {labeled}/train/images
+val: {labeled}/val/images
+
+# Classes
+nc: 1  # number of classes
+names: ['thread_roll']  # class names
+"""
+    auto_annotate.write_atomic(os.path.join(dataset_dir, "data.yaml"), yaml_content)
+    print(f"✓ Distill dataset: {os.path.join(dataset_dir, 'data.yaml')}")
+
+
+def prune_model(model, ratio, imgsz):
+    """Remove the lowest-magnitude conv channels in place; returns (params, MACs) before and after."""
+    import torch
+
+    for parameter in model.parameters():
+        parameter.requires_grad_(True)
+    model.eval()
+    example = torch.randn(1, 3, imgsz, imgsz)
+    ignored = [module for module in model.modules() if type(module).__name__ in PRUNE_IGNORED]
+    macs_before, params_before = tp.utils.count_ops_and_params(model, example)
+    pruner = tp.pruner.MagnitudePruner(model, example, importance=tp.importance.MagnitudeImportance(p=2),
+                                       pruning_ratio=ratio, ignored_layers=ignored)
+    pruner.step()
+    macs_after, params_after = tp.utils.count_ops_and_params(model, example)
+    return (params_before, macs_before), (params_after, macs_after)
+
+
+def pruned_trainer(model):
+    """DetectionTrainer that fine-tunes the given (pruned) model as is."""
+    from ultralytics.models.yolo.detect import DetectionTrainer
+
+    class PrunedTrainer(DetectionTrainer):
+        def get_model(self, cfg=None, weights=None, verbose=True):
+            # The default rebuilds the model from its yaml, which would restore the pruned channels
+            return model
+
+    return PrunedTrainer
+
+
+def train(args):
+    """Prune and fine-tune the student on the distill dataset."""
+    from ultralytics import YOLO
+
+    data_yaml = os.path.join(os.path.abspath(args.dataset), "data.yaml")
+    if not os.path.exists(data_yaml):
+        print("❌ Distill dataset not found! Run `python distill_student.py label` first")
+        return 1
+    if args.prune and tp is None:
+        print("❌ Channel pruning needs torch-pruning (pip install torch-pruning), or use --prune 0")
+        return 1
+
+    start = args.student or args.teacher
+    print("=" * 60)
+    print("Thread Roll Student Distillation")
+    print("=" * 60)
+    print(f"📊 Dataset: {data_yaml}")
+    print(f"🤖 Start: {start} | prune {args.prune:.0%} | imgsz {args.imgsz}")
+
+    model = YOLO(start)
+    trainer = None
+    if args.prune:
+        (params_before, macs_before), (params_after, macs_after) = prune_model(model.model, args.prune, args.imgsz)
+        print(f"✂️  Pruned: {params_before / 1e6:.2f}M → {params_after / 1e6:.2f}M params, "
+              f"{macs_before / 1e9:.2f} → {macs_after / 1e9:.2f} GMACs at {args.imgsz}px")
+        trainer = pruned_trainer(model.model)
+
+    model.train(
+        data=data_yaml,
+        trainer=trainer,
+        epochs=args.epochs,
+        patience=20,
+        batch=8,
+        imgsz=args.imgsz,
+        device='cpu',
+        workers=4,
+        lr0=0.001,               # Fine-tuning: start low
+        lrf=0.01,
+        warmup_epochs=1,
+        mosaic=1.0,
+        close_mosaic=5,
+        single_cls=True,
+        amp=False,
+        seed=42,
+        deterministic=True,
+        project=os.path.join(REPO_DIR, 'runs/distill'),
+        name='student',
+        exist_ok=True,
+    )
+
+    print("\n✓ Student trained: runs/distill/student/weights/best.pt")
+    print("   Next: python distill_student.py promote")
+    return 0
+
+
+def run_benchmark(model_path, output, args):
+    command = [sys.executable, os.path.join(REPO_DIR, "benchmark_detection.py"), "--model", model_path,
+               "--modes", *args.modes, "--splits", *args.splits, "--repeat", str(args.repeat),
+               "--output", output]
+    subprocess.run(command, check=True)
+    with open(output) as f:
+        return json.load(f)
+
+
+def promotion_checks(teacher, student, tolerance):
+    """[(mode, teacher summary, student summary, MAE ok, faster)] for every benchmarked mode."""
+    checks = []
+    for mode, entry in student["modes"].items():
+        old, new = teacher["modes"][mode]["summary"], entry["summary"]
+        checks.append((mode, old, new,
+                       new["count_mae"] - old["count_mae"] <= tolerance,
+                       new["latency_ms"]["p50"] < old["latency_ms"]["p50"]))
+    return checks
+
+
+def promote(args):
+    """Benchmark teacher and student; deploy the student only if it passes."""
+    if not os.path.exists(args.student):
+        print(f"❌ Student weights not found at {args.student}. Run `python distill_student.py train` first")
+        return 1
+
+    stamp = f"{datetime.now():%Y%m%d_%H%M%S}"
+    bench_dir = os.path.join(REPO_DIR, "bench")
+    print("🔍 Benchmarking teacher...")
+    teacher = run_benchmark(args.teacher, os.path.join(bench_dir, f"distill_teacher_{stamp}.json"), args)
+    print("\n🔍 Benchmarking student...")
+    student = run_benchmark(args.student, os.path.join(bench_dir, f"distill_student_{stamp}.json"), args)
+
+    print("\n" + "=" * 60)
+    print(f"Promotion check (count MAE within +{args.tolerance:g}, lower p50 latency)")
+    print("=" * 60)
+    passed = True
+    for mode, old, new, mae_ok, faster in promotion_checks(teacher, student, args.tolerance):
+        print(f"{mode:>8}: MAE {old['count_mae']:.2f} -> {new['count_mae']:.2f} {'✓' if mae_ok else '✗'} | "
+              f"p50 {old['latency_ms']['p50']:.0f} -> {new['latency_ms']['p50']:.0f} ms {'✓' if faster else '✗'}")
+        passed &= mae_ok and faster
+
+    if not passed:
+        print("\n✗ Student not promoted")
+        return 1
+    if args.dry_run:
+        print("\n✓ Student passes (dry run: not deployed)")
+        return 0
+
+    backup = os.path.join(os.path.dirname(args.teacher), "best.prev.pt")
+    shutil.copy2(args.teacher, backup)
+    tmp_path = os.path.join(os.path.dirname(args.teacher), ".best.pt.tmp")
+    shutil.copyfile(args.student, tmp_path)
+    os.replace(tmp_path, args.teacher)
+    print(f"\n✓ Student promoted to {args.teacher} (previous model kept as {backup})")
+    print("   Re-count stored uploads with the new model through POST /reprocess if needed")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teacher", default=DEFAULT_TEACHER, help="Deployed YOLO weights (the teacher)")
+    parser.add_argument("--dataset", default=DEFAULT_DISTILL, help="Distill dataset folder")
+    subparsers = parser.add_subparsers(dest="step", required=True)
+
+    label_parser = subparsers.add_parser("label", help="Pseudo-label new uploads with the teacher")
+    label_parser.add_argument("--uploads", default=DEFAULT_UPLOADS, help="Folder of unlabeled photos")
+    label_parser.add_argument("--labeled", default=DEFAULT_LABELED, help="Hand-labeled YOLO dataset")
+    label_parser.add_argument("--conf", type=float, default=PSEUDO_LABEL_CONFIDENCE, help="Teacher confidence")
+    label_parser.add_argument("--merge-holes", action="store_true",
+                              help="Also label center-hole detections that no teacher box covers")
+    label_parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    label_parser.set_defaults(func=label)
+
+    train_parser = subparsers.add_parser("train", help="Prune and fine-tune the student")
+    train_parser.add_argument("--student", help="Start from these weights instead of the teacher")
+    train_parser.add_argument("--prune", type=float, default=PRUNE_RATIO, help="Share of conv channels removed")
+    train_parser.add_argument("--imgsz", type=int, default=STUDENT_IMGSZ, help="Student input size")
+    train_parser.add_argument("--epochs", type=int, default=60, help="Fine-tuning epochs")
+    train_parser.set_defaults(func=train)
+
+    promote_parser = subparsers.add_parser("promote", help="Deploy the student if the benchmark allows")
+    promote_parser.add_argument("--student", default=DEFAULT_STUDENT, help="Student weights")
+    promote_parser.add_argument("--tolerance", type=float, default=DEFAULT_MAX_MAE_INCREASE,
+                                help="Allowed count MAE increase (rolls per image)")
+    promote_parser.add_argument("--modes", nargs="+", default=["yolo", "hybrid"], help="Detector modes to compare")
+    # The student trains on the hand-labeled train split, so only val is held out
+    promote_parser.add_argument("--splits", nargs="+", default=["val"], help="Dataset splits to benchmark on")
+    promote_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per image")
+    promote_parser.add_argument("--dry-run", action="store_true", help="Check only, don't deploy")
+    promote_parser.set_defaults(func=promote)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,9 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import ImageUpload from './components/ImageUpload';
 import Results from './components/Results';
 import RecordsList from './components/RecordsList';
-import { predictImage } from './api';
+import { getRecord, predictImage } from './api';
+import { toOriginalCoordinates } from './imageResize';
 import './index.css';
 
 function App() {
@@ -11,14 +12,30 @@ function App() {
   const [error, setError] = useState(null);
   const [refreshTrigger, setRefreshTrigger] = useState(0);
 
-  const handleSubmit = async (file, user, description) => {
+  // Release the local copy of the last uploaded image when the result changes
+  useEffect(() => {
+    return () => {
+      if (result && result.localImageUrl) URL.revokeObjectURL(result.localImageUrl);
+    };
+  }, [result]);
+
+  const handleSubmit = async (file, user, description, upload) => {
     setLoading(true);
     setError(null);
     setResult(null);
 
     try {
       const data = await predictImage(file, user, description);
-      setResult(data);
+      if (upload) {
+        // Draw on the original the user picked (no image download), in its pixel coordinates
+        setResult({
+          ...data,
+          detections: toOriginalCoordinates(data.detections, upload.scale),
+          localImageUrl: URL.createObjectURL(upload.original),
+        });
+      } else {
+        setResult(data);
+      }
       // Trigger refresh of records list
       setRefreshTrigger(prev => prev + 1);
     } catch (err) {
@@ -32,10 +49,18 @@ function App() {
     }
   };
 
-  const handleRecordClick = (record) => {
-    setResult(record);
-    // Scroll to top to show results
-    window.scrollTo({ top: 0, behavior: 'smooth' });
+  const handleRecordClick = async (record) => {
+    // The list only has summaries; detections are fetched when a record is opened
+    setError(null);
+    try {
+      const fullRecord = await getRecord(record.id);
+      setResult(fullRecord);
+      // Scroll to top to show results
+      window.scrollTo({ top: 0, behavior: 'smooth' });
+    } catch (err) {
+      console.error('Error fetching record:', err);
+      setError('Failed to load record');
+    }
   };
 
   return (
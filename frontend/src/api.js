@@ -32,6 +32,33 @@ export const predictImage = async (file, user = '', description = '') => {
   return response.data;
 };
 
+// Used until GET /config answers (or if it fails): the backend's defaults
+const DEFAULT_UPLOAD_CONFIG = {
+  max_dimension: 1600,
+  mime_type: 'image/jpeg',
+  quality: 0.9,
+};
+
+let uploadConfigPromise = null;
+
+/**
+ * Get the upload settings the backend prefers (fetched once per page load)
+ * @returns {Promise} { max_dimension, mime_type, quality }
+ */
+export const getUploadConfig = () => {
+  if (!uploadConfigPromise) {
+    uploadConfigPromise = api
+      .get('/config')
+      .then((response) => response.data.upload)
+      .catch((err) => {
+        console.error('Error fetching upload config:', err);
+        uploadConfigPromise = null;  // Retry on the next upload
+        return DEFAULT_UPLOAD_CONFIG;
+      });
+  }
+  return uploadConfigPromise;
+};
+
 /**
  * Get all records
  * @returns {Promise} List of all detection records
@@ -41,6 +68,19 @@ export const getRecords = async () => {
   return response.data;
 };
 
+/**
+ * Get one page of records, newest first, without detections
+ * @param {number|null} beforeId - Cursor: next_before_id of the previous page (null for the first)
+ * @param {number} limit - Page size
+ * @returns {Promise} { items, next_before_id, total } (total on the first page only)
+ */
+export const getRecordsPage = async (beforeId = null, limit = 50) => {
+  const params = { limit };
+  if (beforeId) params.before_id = beforeId;
+  const response = await api.get('/records/page', { params });
+  return response.data;
+};
+
 /**
  * Get single record by ID
  * @param {number} id - Record ID
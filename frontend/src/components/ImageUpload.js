@@ -1,21 +1,42 @@
-import React, { useState, useRef } from 'react';
+import React, { useState, useRef, useEffect } from 'react';
+import { getUploadConfig } from '../api';
+import { prepareUpload } from '../imageResize';
+
+const formatSize = (bytes) =>
+  bytes >= 1024 * 1024 ? `${(bytes / (1024 * 1024)).toFixed(1)} MB` : `${Math.round(bytes / 1024)} KB`;
 
 const ImageUpload = ({ onImageSelect, onSubmit, loading }) => {
   const [selectedFile, setSelectedFile] = useState(null);
   const [previewUrl, setPreviewUrl] = useState(null);
+  const [upload, setUpload] = useState(null);
   const [user, setUser] = useState('');
   const [description, setDescription] = useState('');
   const [dragging, setDragging] = useState(false);
   const fileInputRef = useRef(null);
+  const uploadRef = useRef(null);
+
+  // Object URLs hold the file in memory until revoked
+  useEffect(() => {
+    return () => {
+      if (previewUrl) URL.revokeObjectURL(previewUrl);
+    };
+  }, [previewUrl]);
 
   const handleFileSelect = (file) => {
     if (file && file.type.startsWith('image/')) {
       setSelectedFile(file);
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        setPreviewUrl(reader.result);
-      };
-      reader.readAsDataURL(file);
+      setPreviewUrl(URL.createObjectURL(file));
+      setUpload(null);
+
+      // Resize/re-encode in the background while the user fills in the form
+      const prepared = getUploadConfig().then((config) => prepareUpload(file, config));
+      uploadRef.current = prepared;
+      prepared
+        .then((result) => {
+          if (uploadRef.current === prepared) setUpload(result);
+        })
+        .catch((err) => console.error('Error resizing image:', err));
+
       if (onImageSelect) onImageSelect(file);
     }
   };
@@ -45,16 +66,25 @@ const ImageUpload = ({ onImageSelect, onSubmit, loading }) => {
     setDragging(false);
   };
 
-  const handleSubmit = (e) => {
+  const handleSubmit = async (e) => {
     e.preventDefault();
     if (selectedFile && onSubmit) {
-      onSubmit(selectedFile, user, description);
+      let prepared;
+      try {
+        prepared = await uploadRef.current;
+      } catch (err) {
+        // Could not resize here (e.g. undecodable format): let the backend handle the original
+        prepared = null;
+      }
+      onSubmit(prepared ? prepared.file : selectedFile, user, description, prepared);
     }
   };
 
   const handleReset = () => {
     setSelectedFile(null);
     setPreviewUrl(null);
+    setUpload(null);
+    uploadRef.current = null;
     setUser('');
     setDescription('');
     if (fileInputRef.current) {
@@ -93,6 +123,12 @@ const ImageUpload = ({ onImageSelect, onSubmit, loading }) => {
         ) : (
           <div className="image-preview">
             <img src={previewUrl} alt="Preview" />
+            {upload && upload.scale !== 1 && (
+              <p style={{ marginTop: '0.5rem', fontSize: '0.85rem', color: '#6c757d' }}>
+                Uploading {upload.width}×{upload.height} ({formatSize(upload.file.size)},
+                original {formatSize(upload.original.size)})
+              </p>
+            )}
             <button
               type="button"
               onClick={handleReset}
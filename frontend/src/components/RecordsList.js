@@ -1,21 +1,60 @@
-import React, { useState, useEffect } from 'react';
-import { getRecords } from '../api';
+import React, { useState, useEffect, useRef, useCallback } from 'react';
+import { getRecordsPage } from '../api';
+
+const PAGE_SIZE = 50;
+const ROW_HEIGHT = 132;        // Fixed card height + gap (px); cards clip to it
+const VIEWPORT_HEIGHT = 640;   // Max height of the scrolling list (px)
+const OVERSCAN = 4;            // Extra rows rendered above and below the viewport
+const LOAD_AHEAD = 10;         // Fetch the next page when this close to the last loaded row
+
+// Small cache of fetched pages keyed by cursor, so remounts and refreshes reuse
+// pages that can't have changed (pages other than the first are keyed by id)
+const PAGE_CACHE_SIZE = 8;
+const PAGE_CACHE_TTL = 60 * 1000;
+const pageCache = new Map();
+
+const fetchPage = async (beforeId) => {
+  const key = beforeId || 'first';
+  const cached = pageCache.get(key);
+  if (cached && Date.now() - cached.fetchedAt < PAGE_CACHE_TTL) {
+    // Re-insert to keep least recently used pages first in the Map
+    pageCache.delete(key);
+    pageCache.set(key, cached);
+    return cached.page;
+  }
+
+  const page = await getRecordsPage(beforeId, PAGE_SIZE);
+  pageCache.set(key, { page, fetchedAt: Date.now() });
+  while (pageCache.size > PAGE_CACHE_SIZE) {
+    pageCache.delete(pageCache.keys().next().value);
+  }
+  return page;
+};
 
 const RecordsList = ({ onRecordClick, refreshTrigger }) => {
   const [records, setRecords] = useState([]);
+  const [total, setTotal] = useState(null);
+  const [nextBeforeId, setNextBeforeId] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
+  const [scrollTop, setScrollTop] = useState(0);
+  const loadingMoreRef = useRef(false);
 
   useEffect(() => {
-    fetchRecords();
+    // A new prediction only changes the first page
+    pageCache.delete('first');
+    fetchFirstPage();
   }, [refreshTrigger]);
 
-  const fetchRecords = async () => {
+  const fetchFirstPage = async () => {
     try {
       setLoading(true);
       setError(null);
-      const data = await getRecords();
-      setRecords(data);
+      const page = await fetchPage(null);
+      setRecords(page.items);
+      setTotal(page.total ?? page.items.length);
+      setNextBeforeId(page.next_before_id ?? null);
     } catch (err) {
       setError('Failed to load records');
       console.error('Error fetching records:', err);
@@ -24,6 +63,36 @@ const RecordsList = ({ onRecordClick, refreshTrigger }) => {
     }
   };
 
+  const fetchNextPage = useCallback(async () => {
+    if (!nextBeforeId || loadingMoreRef.current) return;
+    loadingMoreRef.current = true;
+    setLoadingMore(true);
+    try {
+      const page = await fetchPage(nextBeforeId);
+      setRecords((prev) => {
+        // Drop overlap with rows already shown (e.g. after a refresh of the first page)
+        const seen = new Set(prev.map((record) => record.id));
+        return prev.concat(page.items.filter((record) => !seen.has(record.id)));
+      });
+      setNextBeforeId(page.next_before_id ?? null);
+    } catch (err) {
+      console.error('Error fetching records:', err);
+    } finally {
+      loadingMoreRef.current = false;
+      setLoadingMore(false);
+    }
+  }, [nextBeforeId]);
+
+  // Only rows in (or near) the viewport are rendered
+  const firstRow = Math.max(0, Math.floor(scrollTop / ROW_HEIGHT) - OVERSCAN);
+  const lastRow = Math.min(records.length, Math.ceil((scrollTop + VIEWPORT_HEIGHT) / ROW_HEIGHT) + OVERSCAN);
+
+  useEffect(() => {
+    if (lastRow >= records.length - LOAD_AHEAD) {
+      fetchNextPage();
+    }
+  }, [lastRow, records.length, fetchNextPage]);
+
   const formatDate = (dateString) => {
     const date = new Date(dateString);
     return date.toLocaleDateString('en-US', {
@@ -35,7 +104,7 @@ const RecordsList = ({ onRecordClick, refreshTrigger }) => {
     });
   };
 
-  if (loading) {
+  if (loading && records.length === 0) {
     return (
       <div className="card">
         <h2 className="card-title">Past Records</h2>
@@ -66,47 +135,55 @@ const RecordsList = ({ onRecordClick, refreshTrigger }) => {
 
   return (
     <div className="card">
-      <h2 className="card-title">Past Records ({records.length})</h2>
-      <div className="records-list">
-        {records.map((record) => (
-          <div
-            key={record.id}
-            className="record-card"
-            onClick={() => onRecordClick && onRecordClick(record)}
-          >
-            <div className="record-header">
-              <div className="record-id">Record #{record.id}</div>
-              <div className="record-date">{formatDate(record.created_at)}</div>
-            </div>
-
-            <div className="record-stats">
-              <div className="record-stat">
-                <strong>Total:</strong> {record.total_count} rolls
+      <h2 className="card-title">Past Records ({total})</h2>
+      <div
+        className="records-viewport"
+        style={{ maxHeight: `${VIEWPORT_HEIGHT}px` }}
+        onScroll={(e) => setScrollTop(e.currentTarget.scrollTop)}
+      >
+        <div style={{ position: 'relative', height: `${records.length * ROW_HEIGHT}px` }}>
+          {records.slice(firstRow, lastRow).map((record, i) => (
+            <div
+              key={record.id}
+              className="record-card record-row"
+              style={{ top: `${(firstRow + i) * ROW_HEIGHT}px`, height: `${ROW_HEIGHT - 12}px` }}
+              onClick={() => onRecordClick && onRecordClick(record)}
+            >
+              <div className="record-header">
+                <div className="record-id">Record #{record.id}</div>
+                <div className="record-date">{formatDate(record.created_at)}</div>
               </div>
-              {record.user && (
+
+              <div className="record-stats">
                 <div className="record-stat">
-                  <strong>By:</strong> {record.user}
+                  <strong>Total:</strong> {record.total_count} rolls
                 </div>
-              )}
-            </div>
-
-            {/* Color breakdown */}
-            {record.color_counts && Object.keys(record.color_counts).length > 0 && (
-              <div style={{ display: 'flex', gap: '0.5rem', flexWrap: 'wrap', marginTop: '0.5rem' }}>
-                {Object.entries(record.color_counts).map(([color, count]) => (
-                  <div key={color} className="color-item" style={{ fontSize: '0.85rem', padding: '0.25rem 0.75rem' }}>
-                    <div className={`color-badge ${color}`} style={{ width: '16px', height: '16px' }}></div>
-                    <span>{color}: {count}</span>
+                {record.user && (
+                  <div className="record-stat">
+                    <strong>By:</strong> {record.user}
                   </div>
-                ))}
+                )}
               </div>
-            )}
 
-            {record.description && (
-              <div className="record-description">"{record.description}"</div>
-            )}
-          </div>
-        ))}
+              {/* Color breakdown */}
+              {record.color_counts && Object.keys(record.color_counts).length > 0 && (
+                <div style={{ display: 'flex', gap: '0.5rem', flexWrap: 'nowrap', overflow: 'hidden', marginTop: '0.5rem' }}>
+                  {Object.entries(record.color_counts).map(([color, count]) => (
+                    <div key={color} className="color-item" style={{ fontSize: '0.85rem', padding: '0.25rem 0.75rem' }}>
+                      <div className={`color-badge ${color}`} style={{ width: '16px', height: '16px' }}></div>
+                      <span>{color}: {count}</span>
+                    </div>
+                  ))}
+                </div>
+              )}
+
+              {record.description && (
+                <div className="record-description">"{record.description}"</div>
+              )}
+            </div>
+          ))}
+        </div>
+        {loadingMore && <div className="spinner" style={{ margin: '0.8rem auto' }}></div>}
       </div>
     </div>
   );
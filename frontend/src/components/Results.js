@@ -17,7 +17,7 @@ const Results = ({ result }) => {
     const ctx = canvas.getContext('2d');
     const img = new Image();
     img.crossOrigin = 'anonymous';
-    img.src = getImageUrl(result.image_filename);
+    img.src = result.localImageUrl || getImageUrl(result.image_filename);
 
     img.onload = () => {
       // Set canvas size to match image
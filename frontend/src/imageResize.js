@@ -0,0 +1,117 @@
+// Client-side resize/re-encode of uploads to the size the backend asks for (GET /config)
+
+let worker = null;
+let nextRequestId = 0;
+const pending = new Map();
+
+const supportsWorkerResize = () =>
+  typeof Worker !== 'undefined' &&
+  typeof OffscreenCanvas !== 'undefined' &&
+  typeof createImageBitmap !== 'undefined';
+
+const getWorker = () => {
+  if (!worker) {
+    worker = new Worker(new URL('./resizeWorker.js', import.meta.url));
+    worker.onmessage = (event) => {
+      const { id, error, ...result } = event.data;
+      const request = pending.get(id);
+      if (!request) return;
+      pending.delete(id);
+      if (error) {
+        request.reject(new Error(error));
+      } else {
+        request.resolve(result);
+      }
+    };
+  }
+  return worker;
+};
+
+const resizeInWorker = (file, options) =>
+  new Promise((resolve, reject) => {
+    const id = nextRequestId++;
+    pending.set(id, { resolve, reject });
+    getWorker().postMessage({ id, file, ...options });
+  });
+
+// File extension for an encoded upload; browsers that can't encode the requested
+// type fall back to PNG, so the blob's own type wins
+const MIME_EXTENSIONS = { 'image/jpeg': 'jpg', 'image/png': 'png', 'image/webp': 'webp' };
+const extensionFor = (mimeType) => MIME_EXTENSIONS[mimeType] || mimeType.split('/').pop().split('+')[0];
+
+// Fallback for browsers without OffscreenCanvas (older Safari): same steps on the main thread
+const resizeOnMainThread = async (file, { maxDimension, mimeType, quality }) => {
+  const url = URL.createObjectURL(file);
+  try {
+    const img = await new Promise((resolve, reject) => {
+      const image = new Image();
+      image.onload = () => resolve(image);
+      image.onerror = () => reject(new Error('Could not decode image'));
+      image.src = url;
+    });
+    const width = img.naturalWidth;
+    const height = img.naturalHeight;
+    const scale = Math.min(1, maxDimension / Math.max(width, height));
+    if (scale === 1 && file.type === mimeType) {
+      return { blob: null, width, height, scale };
+    }
+
+    const canvas = document.createElement('canvas');
+    canvas.width = Math.round(width * scale);
+    canvas.height = Math.round(height * scale);
+    canvas.getContext('2d').drawImage(img, 0, 0, canvas.width, canvas.height);
+    const blob = await new Promise((resolve) => canvas.toBlob(resolve, mimeType, quality));
+    return { blob, width, height, scale: canvas.width / width };
+  } finally {
+    URL.revokeObjectURL(url);
+  }
+};
+
+/**
+ * Resize an image so its long side is at most maxDimension and re-encode it
+ * @param {File} file - Original image file
+ * @param {Object} config - Upload settings from GET /config (max_dimension, mime_type, quality)
+ * @returns {Promise} { file, original, width, height, originalWidth, originalHeight, scale }
+ *   where scale maps original pixel coordinates to uploaded ones
+ */
+export const prepareUpload = async (file, config) => {
+  const options = {
+    maxDimension: config.max_dimension,
+    mimeType: config.mime_type,
+    quality: config.quality,
+  };
+  const { blob, width, height, scale } = supportsWorkerResize()
+    ? await resizeInWorker(file, options)
+    : await resizeOnMainThread(file, options);
+
+  // Keep the original when re-encoding would not make the upload smaller
+  const useOriginal = !blob || (scale === 1 && blob.size >= file.size);
+  const mimeType = (blob && blob.type) || options.mimeType;
+  const name = `${file.name.replace(/\.[^.]+$/, '')}.${extensionFor(mimeType)}`;
+  return {
+    file: useOriginal ? file : new File([blob], name, { type: mimeType }),
+    original: file,
+    width: useOriginal ? width : Math.round(width * scale),
+    height: useOriginal ? height : Math.round(height * scale),
+    originalWidth: width,
+    originalHeight: height,
+    scale: useOriginal ? 1 : scale,
+  };
+};
+
+/**
+ * Map detections from uploaded-image pixels back to the original image
+ * @param {Array} detections - Detections as returned by the API
+ * @param {number} scale - prepareUpload() scale (original -> uploaded)
+ * @returns {Array} Detections with bbox and center in original pixels
+ */
+export const toOriginalCoordinates = (detections, scale) => {
+  if (!detections || scale === 1) return detections;
+  return detections.map((detection) => ({
+    ...detection,
+    bbox: detection.bbox.map((v) => v / scale),
+    ...(detection.center && {
+      center: detection.center.map((v) => Math.round(v / scale)),
+    }),
+  }));
+};
@@ -0,0 +1,32 @@
+/* eslint-disable no-restricted-globals */
+// Resizes and re-encodes upload images off the main thread (see imageResize.js)
+
+self.onmessage = async (event) => {
+  const { id, file, maxDimension, mimeType, quality } = event.data;
+  try {
+    // Bake in the EXIF orientation: the re-encoded JPEG has no EXIF
+    const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+    const { width, height } = bitmap;
+    const scale = Math.min(1, maxDimension / Math.max(width, height));
+
+    // Already small enough and in the right format: upload the original untouched
+    if (scale === 1 && file.type === mimeType) {
+      bitmap.close();
+      self.postMessage({ id, blob: null, width, height, scale });
+      return;
+    }
+
+    const targetWidth = Math.round(width * scale);
+    const targetHeight = Math.round(height * scale);
+    const canvas = new OffscreenCanvas(targetWidth, targetHeight);
+    const ctx = canvas.getContext('2d');
+    ctx.imageSmoothingQuality = 'high';
+    ctx.drawImage(bitmap, 0, 0, targetWidth, targetHeight);
+    bitmap.close();
+
+    const blob = await canvas.convertToBlob({ type: mimeType, quality });
+    self.postMessage({ id, blob, width, height, scale: targetWidth / width });
+  } catch (error) {
+    self.postMessage({ id, error: error.message || String(error) });
+  }
+};
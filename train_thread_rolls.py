@@ -1,27 +1,125 @@
 #!/usr/bin/env python3
 """
 Train YOLOv11 model on thread roll dataset
+
+Usage:
+    python train_thread_rolls.py
+    python train_thread_rolls.py --tiles thread_roll_dataset/tiles   # pre-tiled set from build_tiles.py
 """
 
 from ultralytics import YOLO
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+import argparse
+import json
 import os
 
-def train_model():
-    """Train YOLOv11 on thread roll dataset."""
+import numpy as np
+
+
+class TiledYOLODataset(YOLODataset):
+    """
+    YOLODataset over build_tiles.py output: images come from the memory-mapped
+    tile array of a split and labels from its index, so nothing is decoded
+    or resized while training.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._tiles = None
+        super().__init__(*args, **kwargs)
+
+    def get_img_files(self, img_path):
+        # img_path is the split's tile array (train.npy / val.npy from data.yaml)
+        self.tiles_dir = os.path.dirname(img_path)
+        with open(os.path.join(self.tiles_dir, f"{os.path.splitext(os.path.basename(img_path))[0]}.json")) as f:
+            self.index = json.load(f)
+        # Names are only used in logs and plots
+        return [f"{os.path.splitext(tile['image'])[0]}_{tile['x']}_{tile['y']}.jpg" for tile in self.index["tiles"]]
+
+    def get_labels(self):
+        size = self.index["tile_size"]
+        labels = []
+        for im_file, tile in zip(self.im_files, self.index["tiles"]):
+            boxes = np.array(tile["labels"], dtype=np.float32).reshape(-1, 5)
+            labels.append({
+                "im_file": im_file,
+                "shape": (size, size),
+                "cls": boxes[:, :1],
+                "bboxes": boxes[:, 1:],
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        if self._tiles is None:
+            # Mapped on first use, so every dataloader worker maps the file itself
+            self._tiles = np.load(os.path.join(self.tiles_dir, self.index["array"]), mmap_mode="r")
+        im = np.ascontiguousarray(self._tiles[i])
+        if self.augment:
+            # Mosaic picks its other tiles from recently loaded ones
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer:
+                self.buffer.pop(0)
+        return im, im.shape[:2], im.shape[:2]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tiles"] = None
+        return state
+
+
+class TiledTrainer(DetectionTrainer):
+    """DetectionTrainer reading build_tiles.py output through TiledYOLODataset."""
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        model = getattr(self.model, "module", self.model)
+        stride = max(int(model.stride.max() if model else 0), 32)
+        return TiledYOLODataset(
+            img_path=img_path,
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=self.args,
+            rect=False,  # Tiles are all square
+            cache=None,
+            single_cls=self.args.single_cls or False,
+            stride=stride,
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=f"{mode}: ",
+            classes=self.args.classes,
+            data=self.data,
+        )
+
+
+def train_model(tiles_dir=None):
+    """Train YOLOv11 on thread roll dataset (or on its tiles from build_tiles.py)."""
 
     print("=" * 60)
     print("YOLOv11 Thread Roll Training")
     print("=" * 60)
 
     # Configuration
-    data_yaml = "thread_roll_dataset/data.yaml"
+    # Absolute, so YOLO resolves the relative train/val paths in data.yaml against the dataset folder
+    data_yaml = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thread_roll_dataset", "data.yaml")
     model_name = "yolo11n.pt"  # Using nano model for speed
+    trainer, imgsz = None, 640
+    if tiles_dir:
+        data_yaml = os.path.join(os.path.abspath(tiles_dir), "data.yaml")
+        trainer = TiledTrainer
 
     # Check if dataset exists
     if not os.path.exists(data_yaml):
-        print("❌ Dataset not found! Run auto_annotate.py first")
+        print("❌ Dataset not found! Run build_tiles.py first" if tiles_dir
+              else "❌ Dataset not found! Run auto_annotate.py first")
         return
 
+    if tiles_dir:
+        with open(os.path.join(os.path.abspath(tiles_dir), "train.json")) as f:
+            imgsz = json.load(f)["tile_size"]  # Train at tile resolution: no resizing
+
     print(f"\n📊 Dataset: {data_yaml}")
     print(f"🤖 Base model: {model_name}")
 
@@ -37,12 +135,13 @@ def train_model():
     results = model.train(
         # Data
         data=data_yaml,
+        trainer=trainer,
 
         # Training parameters
         epochs=100,              # Number of epochs (will use early stopping)
         patience=20,             # Early stopping patience
         batch=8,                 # Small batch for small dataset
-        imgsz=640,               # Image size
+        imgsz=imgsz,             # Image size
 
         # Model saving
         save=True,               # Save checkpoints
@@ -108,7 +207,8 @@ def train_model():
 
     # Validation
     print(f"\n🔍 Validating model...")
-    metrics = model.val()
+    # Tile arrays can only be read through TiledTrainer: reuse its final validation
+    metrics = model.metrics if tiles_dir else model.val()
 
     print(f"\n📈 Validation Metrics:")
     print(f"   - Precision: {metrics.box.p[0]:.3f}" if hasattr(metrics.box, 'p') else "   - Precision: N/A")
@@ -124,4 +224,6 @@ def train_model():
 
 
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiles", help="Train on a tile folder written by build_tiles.py")
+    train_model(parser.parse_args().tiles)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Parallel auto-tuner for center-hole (Hough) and color parameters
+
+Searches HoughCircles parameters against the labeled images in
+thread_roll_dataset with a process pool. Every worker decodes each image
+once and caches its grayscale image and cage boundary (from the edge
+map), so a trial costs only the HoughCircles call. Images OpenCV cannot
+read are skipped. The result is a
+Pareto front of count error against Hough latency.
+
+If per-image color counts are available (--color-labels, JSON mapping
+image filename to {"pink": 40, ...}), the HSV thresholds of
+map_hsv_to_label are tuned as well on cached roll colors (only then do
+workers also keep an RGB copy of every image).
+
+The chosen point can be written as detector_config.json, which
+ThreadRollDetectorV2 picks up from next to the model weights.
+
+Usage:
+    python tune_detector.py --search grid
+    python tune_detector.py --search random --trials 500 --write-config backend/app/models_weights/detector_config.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(REPO_DIR, 'backend/app'))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+from benchmark_detection import count_labels, find_images  # noqa: E402
+from detection_v2 import (  # noqa: E402
+    COLOR_RULES,
+    HOUGH_PARAMS,
+    find_cage_boundary,
+    find_center_circles,
+    is_inside_cage,
+    map_hsv_to_label,
+    roll_hsv,
+)
+
+DEFAULT_DATASET = os.path.join(REPO_DIR, "thread_roll_dataset")
+
+# Grid search space (every combination is tried)
+HOUGH_GRID = {
+    "dp": [1.0, 1.2, 1.5],
+    "minDist": [28, 33, 38],
+    "param1": [40, 50, 60],
+    "param2": [30, 32, 34.5, 37],
+    "minRadius": [4, 6, 8],
+    "maxRadius": [18, 22, 26],
+}
+
+# Random search space: (low, high) sampled uniformly, ints stay ints
+HOUGH_RANGES = {
+    "dp": (1.0, 2.0),
+    "minDist": (20, 45),
+    "param1": (30, 80),
+    "param2": (25.0, 45.0),
+    "minRadius": (3, 10),
+    "maxRadius": (15, 30),
+}
+
+# How far each color threshold may move from its default during color tuning
+COLOR_RULE_SPREAD = 25
+
+# Per-worker cache: [(image name, expected count, gray, rgb or None, cage bbox)]
+_CACHE = []
+
+
+def find_samples(dataset_dir, splits):
+    """[(image_path, expected count)] for every labeled image of the splits."""
+    return [(image_path, count_labels(label_path)) for _, image_path, label_path in find_images(dataset_dir, splits)]
+
+
+def readable_samples(samples):
+    """The samples OpenCV can decode (checked at 1/8 scale); the others are reported and dropped."""
+    readable = []
+    for image_path, expected in samples:
+        if cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_8) is None:
+            print(f"⚠️  Skipping unreadable image {image_path}")
+            continue
+        readable.append((image_path, expected))
+    return readable
+
+
+def _init_worker(samples, keep_rgb):
+    """Decode every image once per worker and cache what trials need (RGB only for color tuning)."""
+    cv2.setNumThreads(1)  # Parallelism comes from the pool
+    for image_path, expected in samples:
+        image = cv2.imread(image_path)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(gray, 50, 150)
+        cage = find_cage_boundary(image, edges=edges)
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if keep_rgb else None
+        _CACHE.append((os.path.basename(image_path), expected, gray, rgb, cage))
+
+
+def _circles_in_cage(gray, cage, params):
+    return [c for c in find_center_circles(gray, params) if is_inside_cage((c[0], c[1]), cage)]
+
+
+def _run_trial(params):
+    """Count rolls on every cached image with one parameter set."""
+    counts, latencies = [], []
+    for _, expected, gray, _, cage in _CACHE:
+        start = time.perf_counter()
+        circles = _circles_in_cage(gray, cage, params)
+        latencies.append(time.perf_counter() - start)
+        counts.append(len(circles))
+    errors = [count - expected for count, (_, expected, _, _, _) in zip(counts, _CACHE)]
+    return {
+        "params": params,
+        "counts": counts,
+        "count_mae": float(np.mean(np.abs(errors))),
+        "count_bias": float(np.mean(errors)),
+        "hough_ms": float(np.mean(latencies) * 1000),
+    }
+
+
+def _image_roll_hsvs(args):
+    """HSV of every in-cage roll of one cached image (for color tuning)."""
+    index, params = args
+    name, _, gray, rgb, cage = _CACHE[index]
+    hsvs = []
+    for cx, cy, r in _circles_in_cage(gray, cage, params):
+        hsv = roll_hsv(rgb, cx, cy, r)
+        if hsv is not None:
+            hsvs.append(tuple(int(x) for x in hsv))
+    return name, hsvs
+
+
+def grid_trials():
+    keys = list(HOUGH_GRID)
+    for values in itertools.product(*(HOUGH_GRID[k] for k in keys)):
+        params = dict(zip(keys, values))
+        if params["minRadius"] < params["maxRadius"]:
+            yield params
+
+
+def random_trials(count, seed):
+    rng = random.Random(seed)
+    yield dict(HOUGH_PARAMS)  # Always score the current defaults
+    for _ in range(count - 1):
+        params = {}
+        for key, (low, high) in HOUGH_RANGES.items():
+            params[key] = rng.randint(low, high) if isinstance(low, int) else round(rng.uniform(low, high), 2)
+        if params["minRadius"] < params["maxRadius"]:
+            yield params
+
+
+def pareto_front(trials):
+    """Trials not beaten on both count MAE and Hough latency, fastest first."""
+    front = []
+    best_mae = float("inf")
+    for trial in sorted(trials, key=lambda t: (t["hough_ms"], t["count_mae"])):
+        if trial["count_mae"] < best_mae:
+            front.append(trial)
+            best_mae = trial["count_mae"]
+    return front
+
+
+def pick_trial(front, strategy, mae_tolerance):
+    best = min(front, key=lambda t: (t["count_mae"], t["hough_ms"]))
+    if strategy == "accuracy":
+        return best
+    # balanced: fastest point within tolerance of the best error
+    return next(t for t in front if t["count_mae"] <= best["count_mae"] + mae_tolerance)
+
+
+def color_error(rules, roll_hsvs, color_labels):
+    error = 0
+    for name, hsvs in roll_hsvs.items():
+        predicted = {}
+        for hsv in hsvs:
+            label = map_hsv_to_label(hsv, rules)
+            predicted[label] = predicted.get(label, 0) + 1
+        expected = color_labels[name]
+        for color in set(predicted) | set(expected):
+            error += abs(predicted.get(color, 0) - expected.get(color, 0))
+    return error / max(1, len(roll_hsvs))
+
+
+def tune_colors(roll_hsvs, color_labels, trials, seed):
+    """Random local search over COLOR_RULES thresholds minimizing per-image color count error."""
+    rng = random.Random(seed)
+    best_rules = dict(COLOR_RULES)
+    best_error = color_error(best_rules, roll_hsvs, color_labels)
+    default_error = best_error
+    for _ in range(trials):
+        candidate = dict(best_rules)
+        for key in rng.sample(list(candidate), rng.randint(1, 3)):
+            low = max(0, COLOR_RULES[key] - COLOR_RULE_SPREAD)
+            high = min(255, COLOR_RULES[key] + COLOR_RULE_SPREAD)
+            candidate[key] = rng.randint(low, high)
+        error = color_error(candidate, roll_hsvs, color_labels)
+        if error < best_error:
+            best_rules, best_error = candidate, error
+    return best_rules, default_error, best_error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="YOLO dataset directory")
+    parser.add_argument("--splits", nargs="+", default=["train", "val"], help="Dataset splits to use")
+    parser.add_argument("--search", choices=["grid", "random"], default="grid", help="Search strategy")
+    parser.add_argument("--trials", type=int, default=300, help="Trials for random search")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--color-labels", help="JSON {image filename: {color: count}} to tune color rules")
+    parser.add_argument("--color-trials", type=int, default=2000, help="Color rule search iterations")
+    parser.add_argument("--pick", choices=["accuracy", "balanced"], default="balanced",
+                        help="Which Pareto point to report/write")
+    parser.add_argument("--mae-tolerance", type=float, default=0.5,
+                        help="'balanced' picks the fastest point within this MAE of the best")
+    parser.add_argument("--output", default=f"bench/tuning_{datetime.now():%Y%m%d_%H%M%S}.json",
+                        help="Where to write the full tuning report")
+    parser.add_argument("--write-config", help="Write the picked parameters to this detector config file")
+    args = parser.parse_args()
+
+    samples = readable_samples(find_samples(args.dataset, args.splits))
+    if not samples:
+        print(f"❌ No labeled images found in {args.dataset}")
+        return 1
+
+    trials = list(grid_trials() if args.search == "grid" else random_trials(args.trials, args.seed))
+
+    print("=" * 60)
+    print("Detector Auto-Tuner")
+    print("=" * 60)
+    print(f"📊 {len(samples)} labeled images, {len(trials)} {args.search} trials, {args.workers} workers")
+
+    start = time.perf_counter()
+    results = []
+    initargs = (samples, bool(args.color_labels))
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=initargs) as pool:
+        chunksize = max(1, len(trials) // (args.workers * 8))
+        for i, result in enumerate(pool.map(_run_trial, trials, chunksize=chunksize), 1):
+            results.append(result)
+            if i % max(1, len(trials) // 20) == 0 or i == len(trials):
+                print(f"   {i}/{len(trials)} trials", end="\r")
+        print()
+
+        front = pareto_front(results)
+        picked = pick_trial(front, args.pick, args.mae_tolerance)
+
+        color_report = None
+        if args.color_labels:
+            with open(args.color_labels) as f:
+                color_labels = json.load(f)
+            indices = [i for i, (path, _) in enumerate(samples) if os.path.basename(path) in color_labels]
+            roll_hsvs = dict(pool.map(_image_roll_hsvs, [(i, picked["params"]) for i in indices]))
+            rules, before, after = tune_colors(roll_hsvs, color_labels, args.color_trials, args.seed)
+            color_report = {"rules": rules, "default_error": before, "tuned_error": after,
+                            "images": len(roll_hsvs)}
+
+    elapsed = time.perf_counter() - start
+    print(f"✓ {len(results)} trials in {elapsed:.1f}s ({len(results) / elapsed:.1f} trials/s)")
+
+    print("\n📈 Pareto front (count MAE vs Hough latency):")
+    for trial in front:
+        marker = "  <- picked" if trial is picked else ""
+        print(f"   MAE {trial['count_mae']:6.2f} | {trial['hough_ms']:7.1f} ms | {trial['params']}{marker}")
+
+    if color_report:
+        print(f"\n🎨 Color rules: mean per-image color error "
+              f"{color_report['default_error']:.2f} -> {color_report['tuned_error']:.2f}")
+
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "search": args.search,
+        "images": [os.path.relpath(path, REPO_DIR) for path, _ in samples],
+        "expected_counts": [expected for _, expected in samples],
+        "trials": results,
+        "pareto_front": front,
+        "picked": picked,
+        "color": color_report,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Report written to {args.output}")
+
+    if args.write_config:
+        config = {
+            "hough": picked["params"],
+            "tuned_at": report["created_at"],
+            "tuning": {"count_mae": picked["count_mae"], "hough_ms": picked["hough_ms"],
+                       "images": len(samples), "search": args.search},
+        }
+        if color_report and color_report["tuned_error"] < color_report["default_error"]:
+            config["color_rules"] = color_report["rules"]
+        with open(args.write_config, "w") as f:
+            json.dump(config, f, indent=2)
+        print(f"✓ Detector config written to {args.write_config}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())